@@ -1,21 +1,37 @@
 import os
-import django
+
+from main import startup
+
+startup.begin()  # before Django loads; STARTUP_PROFILE=1 reports the cold start
+
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
-django.setup()  # <-- setup first
 
-from channels.routing import ProtocolTypeRouter, URLRouter
-from main.middleware import JWTAuthMiddleware  # now safe to import
-from main import routing as routing
+with startup.phase('django'):
+    http_application = get_asgi_application()  # runs django.setup()
+
+from main.checks import log_startup_warnings
 
+log_startup_warnings()
 
-application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
-    "websocket": JWTAuthMiddleware(
-     URLRouter(
-            routing.websocket_urlpatterns 
+from channels.routing import ProtocolTypeRouter
+
+
+def websocket_application():
+    # Channels' auth middleware, simplejwt and the consumers load on the first WebSocket connection
+    from channels.routing import URLRouter
+    from main.middleware import JWTAuthMiddleware
+    from main import routing
+
+    return JWTAuthMiddleware(
+        URLRouter(
+            routing.websocket_urlpatterns
         )
-    ),
-})
+    )
+
 
+application = startup.track_asgi(ProtocolTypeRouter({
+    "http": http_application,
+    "websocket": startup.LazyApplication(websocket_application),
+}))
@@ -14,16 +14,34 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
-from django.urls import path
 from django.conf import settings
 from django.conf.urls.static import static
 from django.urls import path, include
 
+from main.startup import lazy_include
+
+
+# The admin and the djoser auth endpoints import on first use, not at startup
+def admin_urls():
+    from django.contrib import admin
+    admin.autodiscover()
+    return admin.site.get_urls()
+
+
+def djoser_urls():
+    from djoser.urls import urlpatterns
+    return urlpatterns
+
+
+def djoser_jwt_urls():
+    from djoser.urls.jwt import urlpatterns
+    return urlpatterns
+
+
 urlpatterns = [
-    path('admin/', admin.site.urls),
-    path('api/auth/', include('djoser.urls')),
+    lazy_include('admin/', admin_urls, app_name='admin', namespace='admin'),
+    lazy_include('api/auth/', djoser_urls),
     path('api/', include('main.urls')),
-    path('api/auth/', include('djoser.urls.jwt')),
+    lazy_include('api/auth/', djoser_jwt_urls),
 ] + static(settings.MEDIA_URL,
                           document_root=settings.MEDIA_ROOT)
@@ -9,8 +9,19 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/wsgi/
 
 import os
 
+from main import startup
+
+startup.begin()  # before Django loads; STARTUP_PROFILE=1 reports the cold start
+
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
-application = get_wsgi_application()
+with startup.phase('django'):
+    application = get_wsgi_application()
+
+from main.checks import log_startup_warnings
+
+log_startup_warnings()
+
+application = startup.track_wsgi(application)
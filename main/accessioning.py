@@ -0,0 +1,219 @@
+# accessioning.py
+"""
+Batch accessioning: turn a shipment manifest into Acquisition rows and
+new or topped-up Catalog records, matched by ISBN.
+
+Lines are processed in chunks, each committed in its own transaction, so a
+large shipment never holds one long transaction open. A chunk the database
+rejects is retried line by line, so one bad line is reported on its own and
+the rest of the shipment still goes in.
+"""
+import csv
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from main import jobs
+from main.barcodes import allocate_barcodes
+from main.identifiers import compact_isbn, normalize_isbn, normalize_issn
+from main.models import Acquisition, AcquisitionSpend, Catalog
+from main.utils import chunks
+
+CATALOG_FIELDS = ['title', 'author', 'publisher', 'year', 'subject', 'language', 'format',
+                  'dewey_decimal', 'issn', 'lccn']
+
+
+def isbn_key(value):
+    """Matching key for an ISBN: canonical ISBN-13, or bare digits when it does not validate."""
+    return normalize_isbn(value) or compact_isbn(value)
+
+
+def _decimal(value):
+    if value in (None, ''):
+        return None
+    try:
+        return Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount: {value!r}")
+
+
+def read_manifest_csv(fileobj):
+    """Stream manifest lines from a CSV file with a header row."""
+    for row in csv.DictReader(fileobj):
+        yield {key.strip(): (value or '').strip() for key, value in row.items() if key}
+
+
+def record_spend(rows, sign=1):
+    """
+    Add ``(supplier, source, amount, quantity)`` rows to the running
+    AcquisitionSpend totals with one increment per supplier/source pair.
+    """
+    totals = defaultdict(lambda: [Decimal('0'), 0])
+    for supplier, source, amount, quantity in rows:
+        entry = totals[(supplier or '', source)]
+        entry[0] += amount or 0
+        entry[1] += quantity or 0
+
+    for (supplier, source), (amount, quantity) in totals.items():
+        AcquisitionSpend.objects.get_or_create(supplier=supplier, source=source)
+        AcquisitionSpend.objects.filter(supplier=supplier, source=source).update(
+            total_amount=F('total_amount') + sign * amount,
+            item_count=F('item_count') + sign * quantity,
+            updated_at=timezone.now(),
+        )
+
+
+def _accession_chunk(lines, defaults, added_by, result):
+    wanted = defaultdict(int)
+    for line in lines:
+        if line['isbn']:
+            wanted[line['isbn']] += line['quantity']
+
+    catalogs = {}
+    if wanted:
+        raw_isbns = {line['raw_isbn'] for line in lines if line['raw_isbn']}
+        matches = Catalog.objects.select_for_update().filter(Q(isbn13__in=wanted) | Q(isbn__in=raw_isbns))
+        for catalog in matches:
+            catalogs.setdefault(isbn_key(catalog.isbn), catalog)
+
+    # New titles: one Catalog per unseen ISBN (or per line without an ISBN)
+    new_lines = [line for line in lines if not line['isbn'] or line['isbn'] not in catalogs]
+    new_catalogs = {}
+    pending = []
+    for line in new_lines:
+        key = line['isbn'] or id(line)
+        if key not in new_catalogs:
+            catalog = Catalog(isbn=line['raw_isbn'], isbn13=normalize_isbn(line['raw_isbn']), quantity=0,
+                              **{f: line[f] for f in CATALOG_FIELDS if line.get(f) not in (None, '')})
+            catalog.issn_normalized = normalize_issn(catalog.issn)
+            new_catalogs[key] = catalog
+            pending.append(catalog)
+        new_catalogs[key].quantity += line['quantity']
+
+    barcodes = allocate_barcodes('catalog', len(pending), prefix=settings.CATALOG_BARCODE_PREFIX)
+    for catalog, barcode in zip(pending, barcodes):
+        catalog.barcode = barcode
+    Catalog.objects.bulk_create(pending)
+    result['created'] += len(pending)
+
+    if catalogs:
+        now = timezone.now()
+        increments = [c for isbn, c in catalogs.items() if isbn in wanted]
+        for catalog in increments:
+            catalog.quantity += wanted[isbn_key(catalog.isbn)]
+            catalog.updated_at = now
+        Catalog.objects.bulk_update(increments, ['quantity', 'updated_at'])
+        result['incremented'] += len(increments)
+
+    acquisitions = []
+    for line in lines:
+        catalog = catalogs.get(line['isbn']) or new_catalogs.get(line['isbn'] or id(line))
+        acquisitions.append(Acquisition(
+            title=line.get('title') or catalog.title or '',
+            source=line.get('source') or defaults['source'],
+            supplier=line.get('supplier') or defaults.get('supplier'),
+            amount=line['amount'],
+            date_acquired=line.get('date_acquired') or defaults['date_acquired'],
+            quantity=line['quantity'],
+            catalog=catalog,
+            added_by=added_by,
+        ))
+    Acquisition.objects.bulk_create(acquisitions)
+    result['acquisitions'] += len(acquisitions)
+
+    record_spend((a.supplier, a.source, a.amount, a.quantity) for a in acquisitions)
+
+
+def _text(value):
+    # JSON manifests may carry numbers, e.g. ``"isbn": 9780306406157``
+    return None if value is None else str(value).strip()
+
+
+def _clean_line(raw, defaults):
+    line = dict(raw)
+    for field in ['title', 'source', 'supplier'] + CATALOG_FIELDS:
+        if field != 'year' and raw.get(field) is not None:
+            line[field] = _text(raw[field])
+    line['raw_isbn'] = _text(raw.get('isbn')) or None
+    line['isbn'] = isbn_key(line['raw_isbn'])
+    line['quantity'] = 1 if raw.get('quantity') in (None, '') else int(raw['quantity'])
+    if line['quantity'] < 1:
+        raise ValueError("Quantity must be at least 1")
+    line['amount'] = _decimal(raw.get('amount'))
+    if raw.get('year') not in (None, ''):
+        line['year'] = int(raw['year'])
+    if raw.get('date_acquired') and isinstance(raw['date_acquired'], str):
+        line['date_acquired'] = parse_date(raw['date_acquired'])
+        if line['date_acquired'] is None:
+            raise ValueError(f"Invalid date: {raw['date_acquired']!r}")
+    source = line.get('source') or defaults['source']
+    if source not in dict(Acquisition.SOURCE_CHOICES):
+        raise ValueError(f"Unknown source: {source!r}")
+    if not (line.get('title') or line['isbn']):
+        raise ValueError("Each line needs a title or an ISBN")
+    return line
+
+
+def _commit_chunk(lines, defaults, added_by, result):
+    # Counted separately, so a rolled-back chunk adds nothing to ``result``
+    counts = {'acquisitions': 0, 'created': 0, 'incremented': 0}
+    with transaction.atomic():
+        _accession_chunk(lines, defaults, added_by, counts)
+    for key, value in counts.items():
+        result[key] += value
+
+
+def accession_manifest(lines, source='purchase', supplier=None, date_acquired=None,
+                       added_by=None, chunk_size=500):
+    """
+    Accession an iterable of manifest lines (dicts with ``title``, ``isbn``,
+    ``quantity``, ``amount`` and optional catalog fields).
+
+    Invalid lines are reported in ``errors`` and skipped; every other line
+    is committed chunk by chunk.
+    """
+    defaults = {
+        'source': source,
+        'supplier': supplier,
+        'date_acquired': date_acquired or timezone.localdate(),
+    }
+    result = {'acquisitions': 0, 'created': 0, 'incremented': 0, 'errors': []}
+
+    def cleaned():
+        for number, raw in enumerate(lines, start=1):
+            try:
+                yield number, _clean_line(raw, defaults)
+            except (AttributeError, TypeError, ValueError) as exc:
+                result['errors'].append({'line': number, 'error': str(exc)})
+
+    for chunk in chunks(cleaned(), chunk_size):
+        try:
+            _commit_chunk([line for _, line in chunk], defaults, added_by, result)
+        except DatabaseError:
+            # Find the lines the database rejects one by one
+            for number, line in chunk:
+                try:
+                    _commit_chunk([line], defaults, added_by, result)
+                except DatabaseError as exc:
+                    result['errors'].append({'line': number, 'error': str(exc)})
+    result['errors'].sort(key=lambda error: error['line'])
+    return result
+
+
+@jobs.task(max_attempts=1)
+def accession_manifest_job(lines, source, supplier, date_acquired, added_by_id):
+    """Background variant of ``accession_manifest``; not retried, as a rerun would accession twice."""
+    from main.models import User
+
+    return accession_manifest(
+        lines,
+        source=source,
+        supplier=supplier,
+        date_acquired=parse_date(date_acquired) if date_acquired else None,
+        added_by=User.objects.filter(pk=added_by_id).first(),
+    )
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from .models import (
-    User, Attendance, Catalog, Circulation, Acquisition, Duty, Message
+    User, Attendance, Catalog, Circulation, Acquisition, AcquisitionSpend, Duty, Message
 )
 
 
@@ -73,11 +73,18 @@ class CirculationAdmin(admin.ModelAdmin):
 # ================================
 @admin.register(Acquisition)
 class AcquisitionAdmin(admin.ModelAdmin):
-    list_display = ("title", "source", "supplier", "amount", "date_acquired", "added_by")
+    list_display = ("title", "source", "supplier", "amount", "quantity", "date_acquired", "added_by")
     search_fields = ("title", "supplier", "added_by__username")
     list_filter = ("source", "date_acquired")
 
 
+@admin.register(AcquisitionSpend)
+class AcquisitionSpendAdmin(admin.ModelAdmin):
+    list_display = ("supplier", "source", "total_amount", "item_count", "updated_at")
+    list_filter = ("source",)
+    search_fields = ("supplier",)
+
+
 # ================================
 #   DUTY ADMIN
 # ================================
@@ -0,0 +1,191 @@
+# async_views.py
+"""
+Native async versions of the hot read endpoints.
+
+DRF views are synchronous, so under ASGI every request to them is handed to
+a thread. The views here are plain async Django views on the async ORM:
+JWT authentication, permission checks and the ``values()`` query all run on
+the event loop, and rows are rendered with the same compiled plan and
+sparse fieldsets as the sync list views, so responses match them.
+
+    /api/async/catalog/            catalog list
+    /api/async/catalog/search/?q=  title/author/barcode/ISBN search
+    /api/async/attendance/         attendance list
+    /api/async/messages/           message history (user1_id, user2_id)
+"""
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.views import View
+from rest_framework.exceptions import APIException, AuthenticationFailed, ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from . import replicas
+from .fastpath import FastListMixin, render_json
+from .fieldsets import SparseFieldsMixin
+from .identifiers import normalize_isbn
+from .instrumentation import current, timed
+from .models import Attendance, Catalog, Message, User
+from .serializers import AttendanceSerializer, CatalogSerializer, MessageSerializer
+from .views import CatalogViewSet
+
+
+async def authenticate(request):
+    """The active user for the request's JWT, or None without credentials."""
+    auth = JWTAuthentication()
+    header = auth.get_header(request)
+    if header is None:
+        return None
+    raw_token = auth.get_raw_token(header)
+    if raw_token is None:
+        return None
+    token = auth.get_validated_token(raw_token)
+    try:
+        user_id = token[jwt_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise AuthenticationFailed("Token contained no recognizable user identification")
+    user = await User.objects.filter(**{jwt_settings.USER_ID_FIELD: user_id}).afirst()
+    if user is None or not user.is_active:
+        raise AuthenticationFailed("User not found or inactive")
+    return user
+
+
+class AsyncGenericView(View):
+    """The parts of GenericAPIView the sparse fieldset and fast plan mixins rely on."""
+    http_method_names = ['get', 'options']
+    serializer_class = None
+    action = 'list'
+
+    def get_serializer_class(self):
+        return self.serializer_class
+
+    def get_serializer_context(self):
+        return {'request': self.request, 'view': self}
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('context', self.get_serializer_context())
+        return self.get_serializer_class()(*args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        return queryset
+
+
+class AsyncListView(SparseFieldsMixin, FastListMixin, AsyncGenericView):
+    """Subclasses set ``queryset`` and ``serializer_class``, like the sync viewsets."""
+    renderer = JSONRenderer()
+    queryset = None
+
+    async def has_permission(self, user):
+        return True
+
+    async def get_queryset(self, user):
+        assert self.queryset is not None, (
+            f"'{type(self).__name__}' should either include a `queryset` attribute, or override `get_queryset()`."
+        )
+        return self.queryset.all()
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            user = await authenticate(request)
+        except AuthenticationFailed as exc:
+            return self.error(exc.detail, 401)
+        if user is None:
+            return self.error("Authentication credentials were not provided.", 401)
+        if not await self.has_permission(user):
+            return self.error("You do not have permission to perform this action.", 403)
+        await replicas.aallow_replica_reads(request, user)
+
+        recorder = current()
+        if recorder is not None:
+            recorder.view, recorder.action, recorder.user = type(self).__name__, self.action, user
+        self.request = Request(request, authenticators=())
+        self.request.user = user
+
+        try:
+            queryset = self.filter_queryset(await self.get_queryset(user))
+        except APIException as exc:
+            return self.error(exc.detail, exc.status_code)
+        plan = self.get_fast_plan()
+        with timed('serialize'):
+            if plan is None:
+                data = self.get_serializer([obj async for obj in queryset], many=True).data
+            else:
+                columns, build = plan
+                tz = timezone.get_current_timezone()
+                data = [build(row, tz) async for row in queryset.values(*columns)]
+            content = render_json(data, self.renderer)
+        return HttpResponse(content, content_type=self.renderer.media_type)
+
+    def error(self, detail, status):
+        # Same body shape as DRF's exception handler
+        response = JsonResponse(detail if isinstance(detail, dict) else {"detail": detail}, status=status)
+        if status == 401:
+            response['WWW-Authenticate'] = JWTAuthentication().authenticate_header(self.request)
+        return response
+
+
+class CatalogListView(AsyncListView):
+    queryset = Catalog.objects.all()
+    serializer_class = CatalogSerializer
+    list_omit_fields = CatalogViewSet.list_omit_fields
+
+    async def has_permission(self, user):
+        return await user.ahas_perm('main.view_catalog')
+
+
+class CatalogSearchView(CatalogListView):
+    max_results = 100
+
+    async def get_queryset(self, user):
+        queryset = await super().get_queryset(user)
+        query = self.request.query_params.get('q', '').strip()
+        if not query:
+            return queryset.none()
+        try:
+            limit = min(int(self.request.query_params.get('limit', 20)), self.max_results)
+        except ValueError:
+            limit = 20
+        match = Q(title__icontains=query) | Q(author__icontains=query) | Q(barcode=query)
+        isbn = normalize_isbn(query)
+        if isbn:
+            match |= Q(isbn13=isbn)
+        return queryset.filter(match).order_by('title')[:max(limit, 0)]
+
+
+class AttendanceListView(AsyncListView):
+    queryset = Attendance.objects.select_related('user')
+    serializer_class = AttendanceSerializer
+
+    async def get_queryset(self, user):
+        queryset = await super().get_queryset(user)
+        if user.is_staff or await user.ahas_perm('main.can_manage_attendance'):
+            return queryset
+        return queryset.filter(user=user)
+
+
+class MessageHistoryView(AsyncListView):
+    queryset = Message.objects.all()
+    serializer_class = MessageSerializer
+
+    async def get_queryset(self, user):
+        queryset = await super().get_queryset(user)
+        if not user.is_staff:
+            # Patrons only ever see conversations they are part of
+            queryset = queryset.filter(Q(sender=user) | Q(receiver=user))
+        try:
+            user1_id, user2_id = (User._meta.pk.to_python(self.request.query_params.get(name) or None)
+                                  for name in ('user1_id', 'user2_id'))
+        except ValidationError:
+            raise ParseError("user1_id and user2_id must be user ids")
+        if user1_id and user2_id:
+            queryset = queryset.filter(
+                Q(sender_id=user1_id, receiver_id=user2_id) | Q(sender_id=user2_id, receiver_id=user1_id)
+            )
+        elif user1_id or user2_id:
+            other = user1_id or user2_id
+            queryset = queryset.filter(Q(sender_id=other) | Q(receiver_id=other))
+        return queryset
@@ -0,0 +1,253 @@
+# barcodeimages.py
+"""
+Code 128 barcode images for card and label printing.
+
+Renders are cached content-addressed under ``MEDIA_ROOT/barcodes``: the file
+name is a hash of the value, format and options, so a cached file never
+changes and can be served with a far-future ``Cache-Control``. Bump
+``RENDER_VERSION`` when the drawing code changes. ``render_batch`` fills the
+cache for many values across a process pool; the workers need Pillow, not
+Django.
+"""
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+
+from main.utils import chunks
+
+RENDER_VERSION = 1
+FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+DEFAULT_OPTIONS = {'scale': 2, 'height': 60, 'text': True}
+QUIET_MODULES = 10
+# Sizes the API renders on demand, so each value has a bounded number of cached files
+SERVED_SCALES = (1, 2, 3, 4)
+SERVED_HEIGHTS = (30, 60, 90, 120)
+MAX_LENGTH = 80
+
+# Bar/space widths (in modules) of Code 128 symbols 0-106; 106 is the stop symbol
+PATTERNS = [
+    '212222', '222122', '222221', '121223', '121322', '131222', '122213', '122312', '132212', '221213',
+    '221312', '231212', '112232', '122132', '122231', '113222', '123122', '123221', '223211', '221132',
+    '221231', '213212', '223112', '312131', '311222', '321122', '321221', '312212', '322112', '322211',
+    '212123', '212321', '232121', '111323', '131123', '131321', '112313', '132113', '132311', '211313',
+    '231113', '231311', '112133', '112331', '132131', '113123', '113321', '133121', '313121', '211331',
+    '231131', '213113', '213311', '213131', '311123', '311321', '331121', '312113', '312311', '332111',
+    '314111', '221411', '431111', '111224', '111422', '121124', '121421', '141122', '141221', '112214',
+    '112412', '122114', '122411', '142112', '142211', '241211', '221114', '413111', '241112', '134111',
+    '111242', '121142', '121241', '114212', '124112', '124211', '411212', '421112', '421211', '212141',
+    '214121', '412121', '111143', '111341', '131141', '114113', '114311', '411113', '411311', '113141',
+    '114131', '311141', '411131', '211412', '211214', '211232', '2331112',
+]
+START_B, START_C, CODE_B, CODE_C, STOP = 104, 105, 100, 99, 106
+
+
+def encode(value):
+    """
+    Code 128 symbol values for ``value`` (printable ASCII), checksum and stop
+    included. Runs of digits are packed two per symbol with code set C.
+    """
+    if not value or len(value) > MAX_LENGTH or any(not 32 <= ord(char) <= 126 for char in value):
+        raise ValueError(f"Cannot encode {value!r}: use 1-{MAX_LENGTH} printable ASCII characters")
+    codes = []
+    code_set = None
+
+    def switch(to):
+        nonlocal code_set
+        if code_set != to:
+            codes.append((START_B if to == 'B' else START_C) if not codes else (CODE_B if to == 'B' else CODE_C))
+            code_set = to
+
+    i = 0
+    while i < len(value):
+        run = 0
+        while i + run < len(value) and value[i + run].isdigit():
+            run += 1
+        # Set C only pays off for longer runs, since switching costs a symbol
+        if run >= (4 if i == 0 or i + run == len(value) else 6):
+            if run % 2:
+                switch('B')
+                codes.append(ord(value[i]) - 32)
+                i += 1
+                run -= 1
+            switch('C')
+            codes.extend(int(value[j:j + 2]) for j in range(i, i + run, 2))
+            i += run
+        else:
+            switch('B')
+            codes.append(ord(value[i]) - 32)
+            i += 1
+    codes.append((codes[0] + sum(weight * code for weight, code in enumerate(codes[1:], start=1))) % 103)
+    codes.append(STOP)
+    return codes
+
+
+def modules(value):
+    """Element widths in modules, alternating bar and space and starting with a bar."""
+    return [int(width) for code in encode(value) for width in PATTERNS[code]]
+
+
+@lru_cache(maxsize=None)
+def font(size):
+    from PIL import ImageFont
+
+    return ImageFont.load_default(size=size)
+
+
+def bars_image(value, scale=2, height=60, quiet=QUIET_MODULES):
+    """The bars of ``value`` as a grayscale Pillow image, ``scale`` pixels per module."""
+    from PIL import Image
+
+    widths = modules(value)
+    width = (sum(widths) + 2 * quiet) * scale
+    row = bytearray(b'\xff' * quiet * scale)
+    for index, element in enumerate(widths):
+        row += (b'\x00' if index % 2 == 0 else b'\xff') * element * scale
+    row += b'\xff' * quiet * scale
+    # One pixel row stretched to the bar height is much faster than drawing each bar
+    return Image.frombytes('L', (width, 1), bytes(row)).resize((width, height), Image.NEAREST)
+
+
+def render_png(value, scale=2, height=60, text=True):
+    from PIL import Image, ImageDraw
+
+    bars = bars_image(value, scale, height)
+    width = bars.width
+    if not text:
+        return _png_bytes(bars)
+
+    font_size = max(10, 6 * scale)
+    image = Image.new('L', (width, height + font_size + 4 * scale), 255)
+    image.paste(bars, (0, 0))
+    ImageDraw.Draw(image).text((width // 2, height + 2 * scale), value, fill=0, anchor='ma',
+                               font=font(font_size))
+    return _png_bytes(image)
+
+
+def _png_bytes(image):
+    out = io.BytesIO()
+    image.save(out, 'PNG', optimize=False)
+    return out.getvalue()
+
+
+def render_svg(value, scale=2, height=60, text=True):
+    widths = modules(value)
+    width = (sum(widths) + 2 * QUIET_MODULES) * scale
+    font_size = max(10, 6 * scale)
+    total_height = height + (font_size + 4 * scale if text else 0)
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{total_height}" '
+             f'viewBox="0 0 {width} {total_height}" shape-rendering="crispEdges">',
+             f'<rect width="{width}" height="{total_height}" fill="#fff"/>']
+    x = QUIET_MODULES * scale
+    for index, element in enumerate(widths):
+        if index % 2 == 0:
+            parts.append(f'<rect x="{x}" width="{element * scale}" height="{height}"/>')
+        x += element * scale
+    if text:
+        parts.append(f'<text x="{width // 2}" y="{height + 2 * scale + font_size}" font-family="monospace" '
+                     f'font-size="{font_size}" text-anchor="middle">{escape(value)}</text>')
+    parts.append('</svg>')
+    return '\n'.join(parts).encode()
+
+
+RENDERERS = {'png': render_png, 'svg': render_svg}
+
+
+def clean_options(scale=None, height=None, text=None):
+    """Options with defaults filled in and clamped to printable sizes."""
+    options = dict(DEFAULT_OPTIONS)
+    if scale is not None:
+        options['scale'] = min(max(int(scale), 1), 10)
+    if height is not None:
+        options['height'] = min(max(int(height), 10), 400)
+    if text is not None:
+        options['text'] = bool(text)
+    return options
+
+
+def served_options(scale=None, height=None, text=None):
+    """``clean_options`` for API requests: sizes must be one of the served presets."""
+    options = clean_options(text=text)
+    for name, value, allowed in (('scale', scale, SERVED_SCALES), ('height', height, SERVED_HEIGHTS)):
+        if value is None:
+            continue
+        if str(value) not in map(str, allowed):
+            raise ValueError(f"{name} must be one of {', '.join(map(str, allowed))}")
+        options[name] = int(value)
+    return options
+
+
+def cache_key(value, fmt, options):
+    payload = json.dumps([RENDER_VERSION, fmt, value, sorted(options.items())])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def cache_path(key, fmt, root=None):
+    return os.path.join(root or settings.MEDIA_ROOT, 'barcodes', key[:2], f"{key}.{fmt}")
+
+
+def render_cached(value, fmt='png', root=None, render_if=None, **options):
+    """
+    Render ``value`` unless already cached; returns ``(path, key)``. On a
+    cache miss, ``render_if(value)`` may veto the render with LookupError.
+    """
+    if fmt not in RENDERERS:
+        raise ValueError(f"Unknown barcode format: {fmt!r}")
+    options = clean_options(**options)
+    key = cache_key(value, fmt, options)
+    path = cache_path(key, fmt, root)
+    if not os.path.exists(path):
+        if render_if is not None and not render_if(value):
+            raise LookupError(f"Unknown barcode: {value!r}")
+        data = RENDERERS[fmt](value, **options)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Write then rename, so concurrent renders of the same value never expose a partial file
+        fd, temporary = tempfile.mkstemp(dir=directory, suffix='.part')
+        with os.fdopen(fd, 'wb') as fileobj:
+            fileobj.write(data)
+        os.replace(temporary, path)
+    return path, key
+
+
+def _render_chunk(values, fmt, root, options):
+    errors = []
+    for value in values:
+        try:
+            render_cached(value, fmt, root, **options)
+        except ValueError as exc:
+            errors.append({'value': value, 'error': str(exc)})
+    return len(values) - len(errors), errors
+
+
+def render_batch(values, fmt='png', workers=None, chunk_size=500, **options):
+    """
+    Fill the cache for every value across ``workers`` processes; already
+    cached values are skipped up front. Returns counts and per-value errors.
+    """
+    if fmt not in RENDERERS:
+        raise ValueError(f"Unknown barcode format: {fmt!r}")
+    workers = settings.RENDER_WORKERS if workers is None else workers
+    root = settings.MEDIA_ROOT
+    options = clean_options(**options)
+    values = list(dict.fromkeys(value for value in values if value))
+    pending = [value for value in values if not os.path.exists(cache_path(cache_key(value, fmt, options), fmt, root))]
+    result = {'requested': len(values), 'cached': len(values) - len(pending), 'rendered': 0, 'errors': []}
+
+    if workers < 2 or len(pending) <= chunk_size:
+        outcomes = [_render_chunk(chunk, fmt, root, options) for chunk in chunks(pending, chunk_size)]
+    else:
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = [executor.submit(_render_chunk, chunk, fmt, root, options) for chunk in chunks(pending, chunk_size)]
+            outcomes = [future.result() for future in futures]
+    for rendered, errors in outcomes:
+        result['rendered'] += rendered
+        result['errors'] += errors
+    return result
@@ -0,0 +1,29 @@
+# barcodes.py
+from django.db import transaction
+from django.db.models import F
+
+from main.models import BarcodeSequence, Catalog, User
+
+
+def reserve_block(name, count):
+    """
+    Reserve ``count`` consecutive values from the named sequence and
+    return the first one. A single row lock per call, whatever the size.
+    """
+    with transaction.atomic():
+        sequence, _ = BarcodeSequence.objects.select_for_update().get_or_create(name=name)
+        BarcodeSequence.objects.filter(pk=sequence.pk).update(last_value=F('last_value') + count)
+    return sequence.last_value + 1
+
+
+def allocate_barcodes(name, count, prefix='', width=8):
+    """Return ``count`` new barcode strings such as ``LIB00000042``."""
+    if count <= 0:
+        return []
+    first = reserve_block(name, count)
+    return [f"{prefix}{value:0{width}d}" for value in range(first, first + count)]
+
+
+def is_known_barcode(value):
+    """Whether ``value`` is the barcode of a catalog record or a patron."""
+    return Catalog.objects.filter(barcode=value).exists() or User.objects.filter(barcode=value).exists()
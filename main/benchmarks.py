@@ -0,0 +1,318 @@
+# benchmarks.py
+"""
+Load-test scenarios for the library API and chat, run by ``manage.py benchmark``.
+
+Every scenario seeds its own fixtures in the (throw-away) benchmark
+database, drives requests through the full Django stack with real JWT
+auth, and returns one latency sample per operation.
+"""
+import asyncio
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from django.db import close_old_connections
+from django.test import Client
+from rest_framework_simplejwt.tokens import AccessToken
+
+from main.models import Catalog, User
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, elapsed, errors=0):
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "throughput": round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare p95 latency and throughput with a stored baseline.
+    Returns ``(rows, regressions)``; a regression is a change beyond
+    ``tolerance`` percent in the bad direction.
+    """
+    rows, regressions = [], []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        for metric, higher_is_better in (("p95_ms", False), ("throughput", True)):
+            before, after = previous.get(metric), current.get(metric)
+            if not before:
+                continue
+            change = (after - before) / before * 100
+            rows.append((name, metric, before, after, change))
+            worse = -change if higher_is_better else change
+            if worse > tolerance:
+                regressions.append((name, metric, change))
+    return rows, regressions
+
+
+# -- helpers ----------------------------------------------------------------
+
+def auth_header(user):
+    return {"HTTP_AUTHORIZATION": f"JWT {AccessToken.for_user(user)}"}
+
+
+def make_users(count, prefix, **extra):
+    users = User.objects.bulk_create([
+        User(username=f"{prefix}{i}", email=f"{prefix}{i}@bench.local", barcode=f"{prefix.upper()}{i:06d}", **extra)
+        for i in range(count)
+    ])
+    return list(User.objects.filter(username__startswith=prefix).order_by('username')[:len(users)])
+
+
+def make_catalog(count, prefix):
+    Catalog.objects.bulk_create([
+        Catalog(title=f"{prefix} title {i}", author=f"Author {i % 97}", barcode=f"{prefix.upper()}{i:06d}",
+                quantity=3, notes="n" * 200)
+        for i in range(count)
+    ])
+    return list(Catalog.objects.filter(barcode__startswith=prefix.upper()).order_by('barcode'))
+
+
+def run_http(request, iterations, concurrency, headers):
+    """Call ``request(client, i)`` ``iterations`` times across ``concurrency`` threads."""
+    def worker(offset):
+        client = Client(**headers)
+        samples, errors = [], 0
+        try:
+            for i in range(offset, iterations, concurrency):
+                started = time.perf_counter()
+                response = request(client, i)
+                samples.append(time.perf_counter() - started)
+                if response.status_code >= 400:
+                    errors += 1
+        finally:
+            close_old_connections()
+        return samples, errors
+
+    started = time.perf_counter()
+    if concurrency == 1:
+        outcomes = [worker(0)]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies = [sample for samples, _ in outcomes for sample in samples]
+    return summarize(latencies, elapsed, sum(errors for _, errors in outcomes))
+
+
+# -- scenarios --------------------------------------------------------------
+
+@scenario("attendance_scan")
+def attendance_scan(iterations, concurrency):
+    """Kiosk scan storm: POST /api/attendance/ with a rotating set of patron barcodes."""
+    kiosk = User.objects.create_user("bench-kiosk@bench.local", "bench-kiosk", "x", is_staff=True)
+    patrons = make_users(max(1, iterations // 2), "scan")
+
+    def request(client, i):
+        patron = patrons[i % len(patrons)]
+        return client.post("/api/attendance/", {"barcode": patron.barcode, "sign_type": "signin"},
+                           content_type="application/json")
+    return run_http(request, iterations, concurrency, auth_header(kiosk))
+
+
+@scenario("checkout_burst")
+def checkout_burst(iterations, concurrency):
+    """Desk checkout burst: POST /api/circulation/ borrowing distinct copies."""
+    desk = User.objects.create_superuser("bench-desk@bench.local", "bench-desk", "x")
+    patrons = make_users(50, "loan")
+    books = make_catalog(max(1, iterations // 3 + 1), "loanbook")
+
+    def request(client, i):
+        return client.post("/api/circulation/", {
+            "user_barcode": patrons[i % len(patrons)].barcode,
+            "book_barcode": books[i // 3 % len(books)].barcode,
+            "status": "borrowed",
+            "borrow_date": date.today().isoformat(),
+        }, content_type="application/json")
+    return run_http(request, iterations, concurrency, auth_header(desk))
+
+
+@scenario("catalog_browse")
+def catalog_browse(iterations, concurrency):
+    """Catalog browsing: list, detail and typeahead reads."""
+    reader = User.objects.create_superuser("bench-reader@bench.local", "bench-reader", "x")
+    books = make_catalog(500, "browse")
+
+    def request(client, i):
+        kind = i % 3
+        if kind == 0:
+            return client.get("/api/catalog/")
+        if kind == 1:
+            return client.get(f"/api/catalog/{books[i % len(books)].id}/")
+        return client.get("/api/catalog/suggest/", {"q": f"brows titl {i % 50}"})
+    return run_http(request, iterations, concurrency, auth_header(reader))
+
+
+@scenario("chat_fanout")
+def chat_fanout(iterations, concurrency):
+    """WebSocket chat: ``concurrency`` sender/receiver pairs through ChatConsumer."""
+    from asgiref.testing import ApplicationCommunicator
+    from channels.routing import URLRouter
+    from main.routing import websocket_urlpatterns
+
+    pairs = max(1, concurrency)
+    users = make_users(pairs * 2, "chat")
+    tokens = {user.id: str(AccessToken.for_user(user)) for user in users}
+    application = URLRouter(websocket_urlpatterns)
+    per_pair = max(1, iterations // pairs)
+
+    async def connect(user):
+        communicator = ApplicationCommunicator(application, {
+            "type": "websocket",
+            "path": "/ws/chat/",
+            "query_string": f"token={tokens[user.id]}".encode(),
+            "headers": [],
+            "subprotocols": [],
+        })
+        await communicator.send_input({"type": "websocket.connect"})
+        reply = await communicator.receive_output(timeout=10)
+        if reply["type"] != "websocket.accept":
+            raise RuntimeError(f"WebSocket connection refused for {user.username}")
+        return communicator
+
+    async def send(communicator, payload):
+        await communicator.send_input({"type": "websocket.receive", "text": json.dumps(payload)})
+
+    async def receive(communicator):
+        return (await communicator.receive_output(timeout=10))["text"]
+
+    async def disconnect(communicator):
+        await communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+        await communicator.wait(timeout=10)
+
+    async def converse(sender, receiver):
+        outgoing, incoming = await connect(sender), await connect(receiver)
+        samples = []
+        try:
+            for i in range(per_pair):
+                started = time.perf_counter()
+                await send(outgoing, {"message": f"hello {i}", "to_user_id": str(receiver.id)})
+                await receive(incoming)
+                samples.append(time.perf_counter() - started)
+                await receive(outgoing)  # sender echo
+        finally:
+            await disconnect(outgoing)
+            await disconnect(incoming)
+        return samples
+
+    async def main():
+        return await asyncio.gather(*(converse(users[2 * n], users[2 * n + 1]) for n in range(pairs)))
+
+    started = time.perf_counter()
+    outcomes = asyncio.run(main())
+    elapsed = time.perf_counter() - started
+    return summarize([sample for samples in outcomes for sample in samples], elapsed)
+
+
+# -- sync vs async views under a real ASGI server --------------------------------
+
+async def http_get(reader, writer, host, path, headers):
+    """One keep-alive ``GET`` over an open connection; returns the status code."""
+    request = [f"GET {path} HTTP/1.1", f"Host: {host}"] + [f"{k}: {v}" for k, v in headers.items()]
+    writer.write(("\r\n".join(request) + "\r\n\r\n").encode('latin-1'))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length, chunked = 0, False
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding' and 'chunked' in value.lower():
+            chunked = True
+    if not chunked:
+        await reader.readexactly(length)
+        return status
+    while True:
+        size = int((await reader.readline()).split(b';')[0], 16)
+        await reader.readexactly(size + 2)
+        if size == 0:
+            return status
+
+
+def run_server_http(host, port, paths, iterations, concurrency, headers):
+    """``iterations`` GETs over ``concurrency`` keep-alive connections to a running server."""
+    async def worker(offset):
+        reader, writer = await asyncio.open_connection(host, port)
+        samples, errors = [], 0
+        try:
+            for i in range(offset, iterations, concurrency):
+                started = time.perf_counter()
+                status = await http_get(reader, writer, host, paths[i % len(paths)], headers)
+                samples.append(time.perf_counter() - started)
+                if status >= 400:
+                    errors += 1
+        finally:
+            writer.close()
+        return samples, errors
+
+    async def main():
+        return await asyncio.gather(*(worker(n) for n in range(concurrency)))
+
+    started = time.perf_counter()
+    outcomes = asyncio.run(main())
+    elapsed = time.perf_counter() - started
+    latencies = [sample for samples, _ in outcomes for sample in samples]
+    return summarize(latencies, elapsed, sum(errors for _, errors in outcomes))
+
+
+def make_read_fixtures(prefix):
+    """Reader, catalog, attendance and a two-party conversation for the read endpoints."""
+    from main.models import Attendance, Message
+
+    reader = User.objects.create_superuser(f"{prefix}-reader@bench.local", f"{prefix}-reader", "x")
+    patrons = make_users(50, f"{prefix}-patron")
+    make_catalog(500, f"{prefix}book")
+    Attendance.objects.bulk_create([
+        Attendance(user=patrons[i % len(patrons)], sign_type='signin', purpose='reading') for i in range(2000)
+    ])
+    first, second = patrons[0], patrons[1]
+    Message.objects.bulk_create([
+        Message(sender=first if i % 2 else second, receiver=second if i % 2 else first, content=f"message {i}")
+        for i in range(500)
+    ])
+    return reader, first, second
+
+
+def drop_read_fixtures(prefix):
+    User.objects.filter(username__startswith=f"{prefix}-").delete()
+    Catalog.objects.filter(barcode__startswith=f"{prefix.upper()}BOOK").delete()
+
+
+# endpoint -> (sync path, async path); ``{first}``/``{second}`` are the conversation's user ids
+READ_ENDPOINTS = {
+    "catalog_list": ("/api/catalog/", "/api/async/catalog/"),
+    "attendance_list": ("/api/attendance/", "/api/async/attendance/"),
+    "message_history": ("/api/messages/?user1_id={first}&user2_id={second}",
+                        "/api/async/messages/?user1_id={first}&user2_id={second}"),
+}
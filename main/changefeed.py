@@ -0,0 +1,129 @@
+# changefeed.py
+"""
+Delta sync for clients that keep a local copy of a table.
+
+``changes`` returns rows changed since an opaque cursor, oldest first, and
+the ids of rows deleted since then (``Tombstone`` rows written by the
+delete signals). Without a cursor it pages through every row. Each page
+carries the cursor for the next; ``more`` says whether to fetch it now.
+
+Rows are scanned on the ``(updated_at, id)`` index and tombstones on
+``(model, deleted_at, id)``, each from its own position in the cursor.
+Changes from the last ``DELTA_SYNC_SETTLE_SECONDS`` are held back, so a
+transaction that commits late with an earlier ``updated_at`` is not
+skipped. Tombstones are kept for ``DELTA_SYNC_TOMBSTONE_DAYS``; an older
+cursor raises ``CursorExpired`` and the client starts over.
+"""
+import base64
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from main.models import Tombstone
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 2000
+
+
+class CursorExpired(Exception):
+    pass
+
+
+def model_label(model):
+    return model._meta.label_lower
+
+
+def encode_cursor(rows, deletions):
+    """``rows`` and ``deletions`` are ``(timestamp, id)`` scan positions; ``rows`` is None at the start."""
+    position = [None if part is None else [part[0].isoformat(), str(part[1])] for part in (rows, deletions)]
+    return base64.urlsafe_b64encode(json.dumps(position, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, model):
+    """The ``(rows, deletions)`` positions in a cursor for ``model``; ValueError if it is not one."""
+    try:
+        rows, deletions = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        positions = []
+        for part, pk_field in ((rows, model._meta.pk), (deletions, Tombstone._meta.pk)):
+            if part is None:
+                positions.append(None)
+                continue
+            moment = parse_datetime(part[0])
+            if moment is None or timezone.is_naive(moment):
+                raise ValueError
+            positions.append((moment, pk_field.to_python(part[1])))
+    except (TypeError, ValueError, IndexError, ValidationError):
+        raise ValueError("Invalid cursor")
+    if positions[1] is None:
+        raise ValueError("Invalid cursor")
+    return positions[0], positions[1]
+
+
+def _after(queryset, field, position):
+    """Rows strictly after ``position`` in (``field``, id) order: a range scan on the index, tie-broken by id."""
+    if position is None:
+        return queryset
+    moment, pk = position
+    return queryset.filter(**{f"{field}__gte": moment}).filter(Q(**{f"{field}__gt": moment}) | Q(pk__gt=pk))
+
+
+def changes(queryset, cursor=None, limit=DEFAULT_LIMIT, serialize=None, is_deleted=None):
+    """
+    One page of changes to ``queryset``'s rows: ``{'changed': [...], 'deleted':
+    [ids], 'cursor': ..., 'more': bool}``. ``serialize`` turns a list of rows
+    into the ``changed`` payload; rows for which ``is_deleted(row)`` is true
+    (e.g. deactivated users) are reported as deleted instead.
+    """
+    limit = max(1, min(limit, MAX_LIMIT))
+    now = timezone.now()
+    horizon = now - timedelta(seconds=settings.DELTA_SYNC_SETTLE_SECONDS)
+    if cursor:
+        rows_from, deletions_from = decode_cursor(cursor, queryset.model)
+        if deletions_from[0] < now - timedelta(days=settings.DELTA_SYNC_TOMBSTONE_DAYS):
+            raise CursorExpired("Cursor expired; sync again without a cursor")
+    else:
+        # A fresh client has nothing to delete
+        rows_from, deletions_from = None, (horizon, 0)
+
+    # Read the primary: a lagging replica could let the horizon pass rows it has not received yet
+    rows = list(_after(queryset.using(DEFAULT_DB_ALIAS).filter(updated_at__lte=horizon), 'updated_at', rows_from)
+                .order_by('updated_at', 'pk')[:limit + 1])
+    tombstones = list(_after(Tombstone.objects.using(DEFAULT_DB_ALIAS)
+                             .filter(model=model_label(queryset.model), deleted_at__lte=horizon),
+                             'deleted_at', deletions_from)
+                      .order_by('deleted_at', 'pk').values_list('deleted_at', 'pk', 'object_id')[:limit + 1])
+    more = len(rows) > limit or len(tombstones) > limit
+    rows, tombstones = rows[:limit], tombstones[:limit]
+
+    gone = [row for row in rows if is_deleted is not None and is_deleted(row)]
+    live = [row for row in rows if row not in gone] if gone else rows
+    deleted = [object_id for _, _, object_id in tombstones] + [str(row.pk) for row in gone]
+    if rows:
+        rows_from = (rows[-1].updated_at, rows[-1].pk)
+    if tombstones:
+        deletions_from = tombstones[-1][:2]
+    elif deletions_from[0] < horizon:
+        # No deletions up to the horizon: move up so a quiet feed's cursor does not expire
+        deletions_from = (horizon, 0)
+    return {
+        'changed': serialize(live) if serialize else live,
+        'deleted': deleted,
+        'cursor': encode_cursor(rows_from, deletions_from),
+        'more': more,
+    }
+
+
+def record_deletion(instance):
+    Tombstone.objects.create(model=model_label(type(instance)), object_id=str(instance.pk))
+
+
+def prune_tombstones():
+    """Delete tombstones older than any cursor still accepted; returns the number removed."""
+    cutoff = timezone.now() - timedelta(days=settings.DELTA_SYNC_TOMBSTONE_DAYS)
+    return Tombstone.objects.filter(deleted_at__lt=cutoff).delete()[0]
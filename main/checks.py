@@ -0,0 +1,71 @@
+# checks.py
+"""
+Startup checks for state that every server process must share.
+
+Process-local backends are fine for development, but with several worker
+processes each one keeps its own copy and the feature silently breaks. The
+checks run with ``manage.py`` commands (``runserver``, ``migrate``,
+``check``), and the WSGI/ASGI entry points log them when a server starts.
+A deployment that really is a single process can list the ids in
+``SILENCED_SYSTEM_CHECKS``.
+"""
+import logging
+
+from django.conf import settings
+from django.core import checks
+
+logger = logging.getLogger(__name__)
+
+PROCESS_LOCAL_LAYERS = ('channels.layers.InMemoryChannelLayer',)
+PROCESS_LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache',
+                        'django.core.cache.backends.dummy.DummyCache')
+
+
+@checks.register()
+def channel_layer_check(app_configs, **kwargs):
+    backend = getattr(settings, 'CHANNEL_LAYERS', {}).get('default', {}).get('BACKEND')
+    if backend not in PROCESS_LOCAL_LAYERS:
+        return []
+    return [checks.Warning(
+        "The channel layer is in-memory: dashboard events published by one process never reach "
+        "WebSockets served by another.",
+        hint="Set CHANNEL_REDIS_URL, or serve HTTP and WebSockets from one ASGI process.",
+        id='main.W001',
+    )]
+
+
+@checks.register()
+def shared_cache_check(app_configs, **kwargs):
+    uses = []
+    if getattr(settings, 'REPLICA_DATABASES', []):
+        uses.append(('REPLICA_PIN_CACHE', "read-your-writes pins"))
+    messages = []
+    for setting, purpose in uses:
+        alias = getattr(settings, setting, 'default')
+        backend = settings.CACHES.get(alias, {}).get('BACKEND')
+        if backend in PROCESS_LOCAL_CACHES:
+            messages.append(checks.Warning(
+                f"{setting} ({alias!r}) is a process-local cache: each worker process keeps its own {purpose}.",
+                hint="Point it at the 'shared' cache (Redis via CACHE_URL, or the database cache).",
+                id='main.W002',
+            ))
+    ratelimit_cache = getattr(settings, 'RATELIMIT_CACHE', None)
+    if getattr(settings, 'RATELIMIT_ENABLED', False) and ratelimit_cache:
+        backend = settings.CACHES.get(ratelimit_cache, {}).get('BACKEND')
+        if backend != 'django.core.cache.backends.redis.RedisCache':
+            messages.append(checks.Warning(
+                f"RATELIMIT_CACHE ({ratelimit_cache!r}) is not a Redis cache, so rate-limit buckets are kept in "
+                "the database instead.",
+                hint="Set RATELIMIT_CACHE to None, or point it at a Redis cache.",
+                id='main.W003',
+            ))
+    return messages
+
+
+def log_startup_warnings():
+    """Log these checks from a server process, where Django does not run system checks."""
+    silenced = set(settings.SILENCED_SYSTEM_CHECKS)
+    for check in (channel_layer_check, shared_cache_check):
+        for message in check(None):
+            if message.id not in silenced:
+                logger.warning("%s", message)
@@ -1,4 +1,5 @@
 # store/consumers.py
+import asyncio
 import json
 from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
@@ -8,6 +9,7 @@ from django.contrib.auth import get_user_model
 from jwt import decode as jwt_decode
 from jwt.exceptions import InvalidTokenError
 
+from . import events
 from .models import Message  # <-- your Message model
 
 User = get_user_model()
@@ -115,3 +117,77 @@ class ChatConsumer(AsyncWebsocketConsumer):
         sender = User.objects.get(id=sender_id)
         receiver = User.objects.get(id=receiver_id)
         Message.objects.create(sender=sender, receiver=receiver, content=content)
+
+
+class DashboardConsumer(AsyncWebsocketConsumer):
+    """
+    Pushes circulation and attendance events to staff dashboards.
+
+    The user comes from ``JWTAuthMiddleware``; the topics they may see are
+    worked out once on connect, and ``?topics=`` or a ``{"subscribe": [...]}``
+    message picks from those. Events arriving within
+    ``DASHBOARD_COALESCE_SECONDS`` of each other go out as one
+    ``{"type": "events", "events": [...]}`` frame.
+    """
+
+    async def connect(self):
+        self.topics = set()
+        self.pending = []
+        self.flusher = None
+        self.allowed = await sync_to_async(events.allowed_topics)(self.scope.get("user"))
+        if not self.allowed:
+            await self.close(code=4403)
+            return
+        await self.accept()
+        requested = parse_qs(self.scope["query_string"].decode()).get("topics", [""])[0]
+        await self.subscribe([topic for topic in requested.split(",") if topic] or sorted(self.allowed))
+
+    async def disconnect(self, close_code):
+        if getattr(self, "flusher", None):
+            self.flusher.cancel()
+        for topic in getattr(self, "topics", ()):
+            await self.channel_layer.group_discard(events.group_name(topic), self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            data = json.loads(text_data or "")
+        except ValueError:
+            return
+        if not isinstance(data, dict):
+            return
+        if isinstance(data.get("subscribe"), list):
+            await self.subscribe(data["subscribe"])
+        elif isinstance(data.get("unsubscribe"), list):
+            for topic in {topic for topic in data["unsubscribe"] if isinstance(topic, str)} & self.topics:
+                self.topics.discard(topic)
+                await self.channel_layer.group_discard(events.group_name(topic), self.channel_name)
+            await self.send(text_data=json.dumps({"type": "subscribed", "topics": sorted(self.topics)}))
+
+    async def subscribe(self, topics):
+        topics = {topic for topic in topics if isinstance(topic, str)}
+        denied = sorted(topics - self.allowed)
+        for topic in topics & self.allowed - self.topics:
+            self.topics.add(topic)
+            await self.channel_layer.group_add(events.group_name(topic), self.channel_name)
+        await self.send(text_data=json.dumps({"type": "subscribed", "topics": sorted(self.topics), "denied": denied}))
+
+    async def dashboard_event(self, message):
+        # Group membership was permission-checked on subscribe; events pass straight through
+        self.pending.extend(message["events"])
+        if len(self.pending) >= settings.DASHBOARD_MAX_BATCH:
+            await self.flush()
+        elif self.flusher is None:
+            self.flusher = asyncio.ensure_future(self.flush_later())
+
+    async def flush_later(self):
+        await asyncio.sleep(settings.DASHBOARD_COALESCE_SECONDS)
+        self.flusher = None
+        await self.flush()
+
+    async def flush(self):
+        if self.flusher is not None:
+            self.flusher.cancel()
+            self.flusher = None
+        batch, self.pending = self.pending, []
+        if batch:
+            await self.send(text_data=json.dumps({"type": "events", "events": batch}))
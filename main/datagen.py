@@ -0,0 +1,275 @@
+# datagen.py
+"""
+Synthetic data for scale testing, loaded by ``manage.py generate_dataset``.
+
+Rows are produced in independent chunks so they can be generated and
+bulk-inserted by a pool of worker processes. Each chunk seeds its own RNG
+from (seed, model, chunk start), which keeps runs reproducible whatever the
+worker count. Catalog ids are derived from the run id and the row index, so
+workers can reference books without reading them back.
+"""
+import random
+import string
+import uuid
+from bisect import bisect
+from contextlib import contextmanager
+from datetime import datetime, time as dtime, timedelta
+from decimal import Decimal
+from functools import lru_cache
+from itertools import accumulate
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from main.accessioning import record_spend
+from main.identifiers import isbn13_check_digit
+from main.models import Acquisition, Attendance, Catalog, Circulation, Duty, Message, User
+
+WORDS = [
+    'history', 'science', 'river', 'kingdom', 'shadow', 'engineering', 'modern', 'african', 'theory',
+    'practice', 'introduction', 'principles', 'garden', 'stars', 'economy', 'law', 'medicine', 'poetry',
+    'journey', 'children', 'market', 'ocean', 'city', 'night', 'mathematics', 'language', 'society',
+    'power', 'health', 'nation', 'light', 'computing', 'data', 'culture', 'faith', 'land', 'war', 'peace',
+]
+FIRST_NAMES = ['Ada', 'Chinua', 'Ngozi', 'Kofi', 'Amina', 'Tunde', 'Wole', 'Zainab', 'Emeka', 'Fatima',
+               'Yaw', 'Kemi', 'Musa', 'Efua', 'Sade', 'Ike', 'Halima', 'Bola', 'Nnamdi', 'Aisha']
+LAST_NAMES = ['Achebe', 'Adichie', 'Soyinka', 'Okafor', 'Mensah', 'Bello', 'Okonkwo', 'Abubakar',
+              'Adeyemi', 'Boateng', 'Eze', 'Ibrahim', 'Nwosu', 'Owusu', 'Balogun', 'Danjuma']
+FACULTIES = ['Science', 'Arts', 'Engineering', 'Law', 'Medicine', 'Education', 'Management Sciences']
+SHIFTS = ['Morning', 'Afternoon', 'Evening']
+
+# Kiosk traffic: (hour, minute) peaks with their weights and spread in minutes
+SCAN_PEAKS = [((8, 30), 0.55, 40), ((13, 0), 0.3, 60), ((17, 0), 0.15, 45)]
+
+
+@lru_cache(maxsize=8)
+def zipf_cumulative(n, exponent):
+    """Cumulative Zipf weights over ``n`` ranks, cached per worker."""
+    return list(accumulate(1.0 / (rank ** exponent) for rank in range(1, n + 1)))
+
+
+def zipf_index(rng, n, exponent=1.1):
+    cumulative = zipf_cumulative(n, exponent)
+    return min(bisect(cumulative, rng.random() * cumulative[-1]), n - 1)
+
+
+def catalog_id(run, index):
+    return uuid.UUID(int=(run << 64) | index)
+
+
+def isbn13(run, index):
+    body = f"979{(run + index) % 10**9:09d}"
+    return body + isbn13_check_digit(body)
+
+
+def _words(rng, low, high):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def _day(rng, ctx):
+    # Weekdays carry most traffic
+    while True:
+        day = ctx['start'] + timedelta(days=rng.randrange(ctx['days']))
+        if day.weekday() < 5 or rng.random() < 0.25:
+            return day
+
+
+def _scan_time(rng, ctx):
+    (hour, minute), _, spread = rng.choices(SCAN_PEAKS, weights=[p[1] for p in SCAN_PEAKS])[0]
+    offset = int(rng.gauss(0, spread))
+    moment = datetime.combine(_day(rng, ctx), dtime(hour, minute)) + timedelta(minutes=offset, seconds=rng.randrange(60))
+    return timezone.make_aware(moment, timezone.get_default_timezone())
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk inserts keep generated ``auto_now``/``auto_now_add`` values."""
+    fields = [f for model in models for f in model._meta.concrete_fields
+              if getattr(f, 'auto_now', False) or getattr(f, 'auto_now_add', False)]
+    saved = [(f, f.auto_now, f.auto_now_add) for f in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+# -- row builders -------------------------------------------------------------
+
+def build_users(rng, start, count, ctx):
+    tag = ctx['tag']
+    now = timezone.now()
+    rows = []
+    for i in range(start, start + count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        is_student = rng.random() < 0.9
+        rows.append(User(
+            username=f"{tag}-user{i}",
+            email=f"{tag}-user{i}@example.edu",
+            password='!',  # unusable password, skips hashing
+            first_name=first,
+            last_name=last,
+            student_id=f"{tag.upper()}{i:07d}" if is_student else None,
+            faculty=rng.choice(FACULTIES),
+            barcode=f"{tag.upper()}U{i:08d}",
+            user_category=rng.choice(['undergraduate'] * 8 + ['postgraduate'] * 2) if is_student else None,
+            staff_category=None if is_student else rng.choice(['librarian', 'staff', 'member']),
+            is_staff=not is_student and rng.random() < 0.3,
+            date_joined=now,
+            updated_at=now,
+        ))
+    return User, rows
+
+
+def build_catalog(rng, start, count, ctx):
+    run, tag = ctx['run'], ctx['tag']
+    now = timezone.now()
+    rows = []
+    for i in range(start, start + count):
+        isbn = isbn13(run, i)
+        created = now - timedelta(days=rng.randrange(ctx['days'] * 4), seconds=rng.randrange(86400))
+        rows.append(Catalog(
+            id=catalog_id(run, i),
+            title=_words(rng, 2, 6).title(),
+            author=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            barcode=f"{tag.upper()}B{i:08d}",
+            isbn=isbn,
+            isbn13=isbn,
+            dewey_decimal=f"{rng.randrange(1000):03d}.{rng.randrange(100):02d}",
+            subject=rng.choice(WORDS).title(),
+            language='English',
+            publisher=f"{rng.choice(LAST_NAMES)} Press",
+            year=rng.randint(1950, 2026),
+            notes=_words(rng, 10, 60) if rng.random() < 0.5 else None,
+            tags=', '.join(rng.sample(WORDS, 3)),
+            quantity=rng.choices([1, 2, 3, 5, 10], weights=[40, 30, 15, 10, 5])[0],
+            created_at=created,
+            updated_at=created,
+        ))
+    return Catalog, rows
+
+
+def build_attendance(rng, start, count, ctx):
+    users = ctx['user_ids']
+    rows = []
+    for _ in range(count):
+        rows.append(Attendance(
+            user_id=users[zipf_index(rng, len(users), 0.6)],
+            purpose=rng.choice(['reading', 'borrowing', 'research', 'study', None]),
+            sign_type=rng.choice(['signin', 'signin', 'signout']),
+            created_at=_scan_time(rng, ctx),
+        ))
+    return Attendance, rows
+
+
+def build_circulation(rng, start, count, ctx):
+    run, users, books = ctx['run'], ctx['user_ids'], ctx['catalog_count']
+    today = timezone.localdate()
+    rows = []
+    for _ in range(count):
+        borrowed = _day(rng, ctx)
+        due = borrowed + timedelta(days=14)
+        returned = None
+        if due < today and rng.random() < 0.9:
+            returned = borrowed + timedelta(days=rng.randint(1, 21))
+            status = 'returned'
+        elif due < today:
+            status = 'overdue'
+        else:
+            status = 'borrowed'
+        rows.append(Circulation(
+            book_id=catalog_id(run, zipf_index(rng, books)),
+            borrower_id=rng.choice(users),
+            borrow_date=borrowed,
+            return_date=due,
+            actual_return=returned,
+            fine=Decimal(max(0, (returned - due).days) * 50) if returned else Decimal('0'),
+            status=status,
+        ))
+    return Circulation, rows
+
+
+def build_messages(rng, start, count, ctx):
+    users = ctx['user_ids']
+    now = timezone.now()
+    rows = []
+    for _ in range(count):
+        # Power-law senders and receivers: a few very active chatters
+        sender = users[zipf_index(rng, len(users), 1.2)]
+        receiver = users[zipf_index(rng, len(users), 1.0)]
+        if receiver == sender:
+            receiver = rng.choice(users)
+        rows.append(Message(
+            sender_id=sender,
+            receiver_id=receiver,
+            content=_words(rng, 1, 25),
+            sent_at=now - timedelta(seconds=rng.randrange(ctx['days'] * 86400)),
+        ))
+    return Message, rows
+
+
+def build_acquisitions(rng, start, count, ctx):
+    run, books = ctx['run'], ctx['catalog_count']
+    rows = []
+    for i in range(start, start + count):
+        source = rng.choices(['purchase', 'donation', 'exchange'], weights=[70, 25, 5])[0]
+        rows.append(Acquisition(
+            title=_words(rng, 2, 5).title(),
+            source=source,
+            supplier=f"{rng.choice(LAST_NAMES)} Books" if source == 'purchase' else None,
+            amount=Decimal(rng.randint(1000, 50000)) / 10 if source == 'purchase' else None,
+            date_acquired=_day(rng, ctx),
+            catalog_id=catalog_id(run, rng.randrange(books)) if books else None,
+            quantity=rng.randint(1, 5),
+        ))
+    return Acquisition, rows
+
+
+def build_duties(rng, start, count, ctx):
+    staff = ctx['staff_ids'] or ctx['user_ids']
+    rows = {}
+    for i in range(start, start + count):
+        day = ctx['start'] + timedelta(days=i // len(SHIFTS) % ctx['days'])
+        shift = SHIFTS[i % len(SHIFTS)]
+        user = rng.choice(staff)
+        rows[(user, day, shift)] = Duty(user_id=user, date=day, shift=shift)
+    return Duty, list(rows.values())
+
+
+BUILDERS = {
+    'users': build_users,
+    'catalog': build_catalog,
+    'attendance': build_attendance,
+    'circulation': build_circulation,
+    'messages': build_messages,
+    'acquisitions': build_acquisitions,
+    'duties': build_duties,
+}
+
+
+_context = {}
+
+
+def init_worker(ctx):
+    # Forked workers must not share the parent's database connection
+    connections.close_all()
+    _context.update(ctx)
+
+
+def insert_chunk(kind, start, count, ctx=None):
+    """Build and insert one chunk; runs inside a worker process."""
+    ctx = ctx or _context
+    rng = random.Random(f"{ctx['seed']}:{kind}:{start}")
+    model, rows = BUILDERS[kind](rng, start, count, ctx)
+    with explicit_timestamps(model), transaction.atomic():
+        model.objects.bulk_create(rows, batch_size=ctx['batch_size'], ignore_conflicts=(kind == 'duties'))
+        if kind == 'acquisitions':
+            # Keep the running spend totals in step, as accessioning does
+            record_spend((row.supplier, row.source, row.amount, row.quantity) for row in rows)
+    return kind, len(rows)
+
+
+def run_tag(rng):
+    return ''.join(rng.choices(string.ascii_lowercase, k=5))
@@ -0,0 +1,24 @@
+from django.db.backends.postgresql import base
+
+from main.dbpool import PooledDatabaseWrapperMixin
+
+TRANSACTION_IDLE = 0  # psycopg2 TRANSACTION_STATUS_IDLE / psycopg TransactionStatus.IDLE
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    """PostgreSQL with connections from the process-wide pool."""
+
+    def pool_check(self, conn):
+        if conn.closed:
+            return False
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        if conn.info.transaction_status != TRANSACTION_IDLE:
+            conn.rollback()
+        return True
+
+    def pool_reset(self, conn):
+        if conn.closed:
+            raise base.Database.InterfaceError("connection already closed")
+        if conn.info.transaction_status != TRANSACTION_IDLE:
+            conn.rollback()
@@ -0,0 +1,27 @@
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.backends.sqlite3 import base
+from django.utils.asyncio import async_unsafe
+
+from main.dbpool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    """SQLite with connections from the process-wide pool, for local runs and tests."""
+
+    def pool_check(self, conn):
+        conn.execute('SELECT 1').close()
+        return True
+
+    def pool_reset(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+
+    @async_unsafe
+    def close(self):
+        # Pooled connections stay open, so returning one never drops an in-memory database
+        self.validate_thread_sharing()
+        if self.in_atomic_block and self.is_in_memory_db():
+            # Closing inside atomic() discards the connection, and an in-memory database with it
+            # (e.g. Channels' close_old_connections() during a TestCase)
+            return
+        BaseDatabaseWrapper.close(self)
@@ -0,0 +1,260 @@
+# dbpool.py
+"""
+Bounded database connection pool for the pooled engines in ``main.db``.
+
+Each process keeps at most ``MAX_SIZE`` connections per database alias,
+shared by every request thread and ``sync_to_async`` worker. Django closes
+the connection at the end of each request (``CONN_MAX_AGE = 0``), which
+hands it back to the pool instead of disconnecting. Borrowers wait up to
+``TIMEOUT`` seconds for a free connection before ``PoolTimeout`` is raised.
+A connection idle for ``CHECK_IDLE`` seconds or more is health-checked
+before it is handed out, and connections older than ``MAX_LIFETIME`` are
+replaced. Configured per database:
+
+    DATABASES['default']['POOL'] = {'MAX_SIZE': 10, 'TIMEOUT': 10, 'MAX_LIFETIME': 1800, 'CHECK_IDLE': 0}
+
+Pool gauges, counters and the checkout wait histogram are served with the
+request metrics at ``/api/metrics/``.
+"""
+import threading
+import time
+from collections import deque
+
+from django.db import OperationalError
+
+from .instrumentation import BUCKETS, Histogram
+
+DEFAULTS = {'MAX_SIZE': 10, 'TIMEOUT': 10.0, 'MAX_LIFETIME': 1800.0, 'CHECK_IDLE': 0.0}
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, alias, key, check, reset, max_size=10, timeout=10.0, max_lifetime=1800.0, check_idle=0.0):
+        self.alias = alias
+        self.key = key
+        self.check = check  # check(conn) -> bool, run on borrow
+        self.reset = reset  # reset(conn), run on return
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.check_idle = check_idle
+        self.retired = False
+
+        self.cond = threading.Condition()
+        self.idle = deque()  # (conn, created, returned), most recently returned last
+        self.created = {}  # id(conn) -> creation time, for every open connection
+        self.size = 0  # open connections plus connects in progress
+        self.in_use = 0
+        self.waiting = 0
+        self.peak = 0
+        self.counters = {'checkouts': 0, 'timeouts': 0, 'health_check_failures': 0, 'connects': 0, 'discards': 0}
+        self.wait_histogram = Histogram(BUCKETS)
+
+    def get(self, connect):
+        """Borrow a connection, opening one with ``connect()`` while under ``max_size``."""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        with self.cond:
+            self.waiting += 1
+            try:
+                while True:
+                    if self.idle:
+                        entry = self.idle.pop()
+                        break
+                    if self.size < self.max_size:
+                        self.size += 1
+                        entry = None
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.counters['timeouts'] += 1
+                        raise PoolTimeout(
+                            f"No connection available in the '{self.alias}' pool within {self.timeout}s "
+                            f"({self.max_size} in use)"
+                        )
+                    self.cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.in_use += 1
+            self.peak = max(self.peak, self.in_use)
+            self.counters['checkouts'] += 1
+            self.wait_histogram.observe((self.alias,), time.monotonic() - started)
+
+        if entry is not None:
+            conn, created, returned = entry
+            now = time.monotonic()
+            if now - created >= self.max_lifetime:
+                self._discard(conn, reopen=True)
+            elif now - returned >= self.check_idle and not self._healthy(conn):
+                with self.cond:
+                    self.counters['health_check_failures'] += 1
+                self._discard(conn, reopen=True)
+            else:
+                return conn
+
+        try:
+            conn = connect()
+        except BaseException:
+            with self.cond:
+                self.size -= 1
+                self.in_use -= 1
+                self.cond.notify()
+            raise
+        with self.cond:
+            self.created[id(conn)] = time.monotonic()
+            self.counters['connects'] += 1
+        return conn
+
+    def put(self, conn, discard=False):
+        """Return a borrowed connection; broken or discarded ones are closed."""
+        if not discard and not self.retired:
+            try:
+                self.reset(conn)
+            except Exception:
+                discard = True
+        if discard or self.retired:
+            self._discard(conn)
+            with self.cond:
+                self.in_use -= 1
+            return
+        with self.cond:
+            self.idle.append((conn, self.created[id(conn)], time.monotonic()))
+            self.in_use -= 1
+            self.cond.notify()
+
+    def _healthy(self, conn):
+        try:
+            return self.check(conn)
+        except Exception:
+            return False
+
+    def _discard(self, conn, reopen=False):
+        """Close a connection; with ``reopen`` its slot stays reserved for the caller."""
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self.cond:
+            self.created.pop(id(conn), None)
+            self.counters['discards'] += 1
+            if not reopen:
+                self.size -= 1
+                self.cond.notify()
+
+    def retire(self):
+        """Close idle connections; borrowed ones are closed when returned."""
+        with self.cond:
+            self.retired = True
+            idle, self.idle = list(self.idle), deque()
+        for conn, _, _ in idle:
+            self._discard(conn)
+
+    def stats(self):
+        with self.cond:
+            return {
+                'max_size': self.max_size,
+                'connections': len(self.created),
+                'in_use': self.in_use,
+                'idle': len(self.idle),
+                'waiting': self.waiting,
+                'peak': self.peak,
+                **self.counters,
+            }
+
+
+_pools = {}  # alias -> ConnectionPool
+_lock = threading.Lock()
+
+
+def get_pool(alias, settings_dict, check, reset):
+    """The pool for a database alias, replacing it when the connection settings change."""
+    key = tuple(settings_dict.get(name) for name in ('NAME', 'HOST', 'PORT', 'USER'))
+    pool = _pools.get(alias)
+    if pool is not None and pool.key == key:
+        return pool
+    with _lock:
+        pool = _pools.get(alias)
+        if pool is None or pool.key != key:
+            if pool is not None:
+                # e.g. the test runner switching to the test database
+                pool.retire()
+            options = {**DEFAULTS, **settings_dict.get('POOL', {})}
+            pool = _pools[alias] = ConnectionPool(
+                alias, key, check, reset,
+                max_size=int(options['MAX_SIZE']),
+                timeout=float(options['TIMEOUT']),
+                max_lifetime=float(options['MAX_LIFETIME']),
+                check_idle=float(options['CHECK_IDLE']),
+            )
+        return pool
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    Mixed into a backend's ``DatabaseWrapper``: connections come from and go
+    back to the alias's pool. Backends provide ``pool_check`` and ``pool_reset``.
+    """
+
+    def pool_check(self, conn):
+        raise NotImplementedError
+
+    def pool_reset(self, conn):
+        raise NotImplementedError
+
+    @property
+    def connection_pool(self):
+        return get_pool(self.alias, self.settings_dict, self.pool_check, self.pool_reset)
+
+    def get_new_connection(self, conn_params):
+        pool = self.connection_pool
+        conn = pool.get(lambda: super(PooledDatabaseWrapperMixin, self).get_new_connection(conn_params))
+        self._borrowed_from = pool
+        return conn
+
+    def _close(self):
+        if self.connection is None:
+            return
+        pool = getattr(self, '_borrowed_from', None) or self.connection_pool
+        self._borrowed_from = None
+        # Django keeps the connection object when closed inside atomic(); it must not be shared
+        pool.put(self.connection, discard=self.in_atomic_block)
+
+
+METRICS = [
+    ('db_pool_max_size', 'gauge', "Configured pool size", 'max_size'),
+    ('db_pool_connections', 'gauge', "Open connections", 'connections'),
+    ('db_pool_in_use', 'gauge', "Connections checked out", 'in_use'),
+    ('db_pool_idle', 'gauge', "Idle connections", 'idle'),
+    ('db_pool_waiting', 'gauge', "Threads waiting for a connection", 'waiting'),
+    ('db_pool_checkouts_total', 'counter', "Connections handed out", 'checkouts'),
+    ('db_pool_timeouts_total', 'counter', "Checkouts that timed out", 'timeouts'),
+    ('db_pool_health_check_failures_total', 'counter', "Connections that failed the borrow health check", 'health_check_failures'),
+    ('db_pool_connects_total', 'counter', "New database connections opened", 'connects'),
+]
+
+
+def render_metrics():
+    """Prometheus text for every pool in this process."""
+    pools = list(_pools.values())
+    lines = []
+    for name, kind, help_text, key in METRICS:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for pool in pools:
+            lines.append(f'{name}{{alias="{pool.alias}"}} {pool.stats()[key]}')
+    name = 'db_pool_wait_seconds'
+    lines.append(f"# HELP {name} Time spent waiting to check out a connection")
+    lines.append(f"# TYPE {name} histogram")
+    for pool in pools:
+        with pool.cond:
+            rows = list(pool.wait_histogram.series.items())
+        for (alias,), row in rows:
+            for bound, count in zip(pool.wait_histogram.buckets, row):
+                lines.append(f'{name}_bucket{{alias="{alias}",le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{alias="{alias}",le="+Inf"}} {row[-1]}')
+            lines.append(f'{name}_sum{{alias="{alias}"}} {row[-2]:.6f}')
+            lines.append(f'{name}_count{{alias="{alias}"}} {row[-1]}')
+    return '\n'.join(lines) + '\n'
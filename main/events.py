@@ -0,0 +1,78 @@
+# events.py
+"""
+Dashboard events: checkouts, returns and attendance scans pushed to staff
+over ``ws/dashboard/`` (see ``consumers.DashboardConsumer``).
+
+Signals call ``publish`` for each saved loan or scan, and kiosk batches for
+all their scans at once; events go to the topic's channel-layer group once
+the write commits, so rolled-back changes are never announced. A channel
+layer that is down loses the events, logged, but never fails the write.
+Consumers coalesce bursts into batched frames.
+"""
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# topic -> permission that grants it besides is_staff
+TOPICS = {
+    'circulation': 'main.can_manage_circulation',
+    'attendance': 'main.can_manage_attendance',
+}
+
+
+def group_name(topic):
+    return f"dashboard.{topic}"
+
+
+def allowed_topics(user):
+    """The topics ``user`` may subscribe to; checked once per connection."""
+    if not user or not user.is_authenticated or not user.is_active:
+        return set()
+    if user.is_staff:
+        return set(TOPICS)
+    return {topic for topic, permission in TOPICS.items() if user.has_perm(permission)}
+
+
+def _send(topic, batch):
+    try:
+        layer = get_channel_layer()
+        if layer is not None:
+            async_to_sync(layer.group_send)(group_name(topic), {'type': 'dashboard.event', 'events': batch})
+    except Exception:
+        logger.exception("Could not publish %d %s event(s)", len(batch), topic)
+
+
+def publish(topic, *items):
+    """
+    Send events (JSON-ready dicts) to ``topic`` subscribers after the current
+    transaction commits, as one channel-layer message however many there are.
+    """
+    if items:
+        transaction.on_commit(lambda: _send(topic, [{'topic': topic, **item} for item in items]))
+
+
+def loan_event(loan, created):
+    action = 'checkout' if created and loan.status == 'borrowed' else 'return' if loan.status == 'returned' else 'update'
+    return {
+        'event': action,
+        'id': str(loan.pk),
+        'book': str(loan.book_id),
+        'borrower': str(loan.borrower_id) if loan.borrower_id else None,
+        'status': loan.status,
+        'return_date': loan.return_date.isoformat() if loan.return_date else None,
+    }
+
+
+def scan_event(attendance):
+    return {
+        'event': 'scan',
+        'id': str(attendance.pk),
+        'user': str(attendance.user_id),
+        'sign_type': attendance.sign_type,
+        'method': attendance.method,
+        'at': attendance.created_at.isoformat(),
+    }
@@ -0,0 +1,201 @@
+# fastpath.py
+"""
+Read-only fast path for list endpoints.
+
+``FastListMixin.list`` reads rows with ``values()`` instead of building model
+instances and running every field through ``Serializer.to_representation``.
+The plan is compiled once per serializer class (and sparse fieldset) from
+its readable fields, so
+the output keeps the same keys, order and values as the ModelSerializer
+path; it is rendered with the same JSON settings, via orjson when that
+package is installed. orjson is not in the Pipfile: without it the output
+is identical but encoded by DRF's JSONRenderer, which gives up most of the
+rendering speed-up (``manage.py benchmark_serialization`` reports which
+encoder it measured). Serializers with fields the plan cannot express
+(method fields, many-to-many, dotted sources, ...) fall back to the
+regular path.
+"""
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils import encoders
+
+from .instrumentation import timed
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+# Values read from the database already have their JSON form for these fields
+_PASSTHROUGH = (
+    serializers.CharField,
+    serializers.IntegerField,
+    serializers.BooleanField,
+    serializers.ChoiceField,
+)
+# Fields whose ``to_representation`` is cheap and safe to call on a raw column value
+_CONVERTED = (
+    serializers.UUIDField,
+    serializers.DateTimeField,
+    serializers.DateField,
+    serializers.TimeField,
+    serializers.DecimalField,
+    serializers.FloatField,
+)
+
+
+class Unsupported(Exception):
+    pass
+
+
+def _iso_datetime(field):
+    """DateTimeField.to_representation for aware ISO 8601 output, without per-value settings lookups."""
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if (hasattr(field, 'timezone') or not settings.USE_TZ
+            or output_format is None or output_format.lower() != ISO_8601):
+        return lambda value, tz: field.to_representation(value)
+
+    def convert(value, tz):
+        if isinstance(value, str) or timezone.is_naive(value):
+            return field.to_representation(value)
+        value = value.astimezone(tz).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return convert
+
+
+def _converter(field):
+    """``convert(value, tz)`` for a field, or None when the column value is used as is."""
+    if isinstance(field, _PASSTHROUGH):
+        return None
+    if isinstance(field, serializers.UUIDField) and field.uuid_format == 'hex_verbose':
+        return lambda value, tz: str(value)
+    if isinstance(field, serializers.DateTimeField):
+        return _iso_datetime(field)
+    if isinstance(field, _CONVERTED):
+        return lambda value, tz: field.to_representation(value)
+    raise Unsupported(field)
+
+
+def _compile(serializer, prefix=''):
+    """
+    Return ``(columns, builder)`` where ``builder(row, tz)`` turns a
+    ``values()`` row into the serializer's representation, rendering
+    datetimes in the ``tz`` timezone.
+    """
+    model = serializer.Meta.model
+    columns, steps = [], []
+    for field in serializer._readable_fields:
+        source = field.source
+        if source == '*' or '.' in source:
+            raise Unsupported(field)
+
+        if isinstance(field, serializers.BaseSerializer):
+            # One level of nested, non-many serializer over a foreign key
+            relation = model._meta.get_field(source)
+            if not relation.many_to_one and not relation.one_to_one:
+                raise Unsupported(field)
+            key = f"{prefix}{relation.attname}"
+            child_columns, child_builder = _compile(field, prefix=f"{prefix}{source}__")
+            columns.append(key)
+            columns.extend(child_columns)
+            steps.append((field.field_name, key, child_builder, True))
+            continue
+
+        try:
+            model_field = model._meta.get_field(source)
+        except Exception:
+            raise Unsupported(field)
+        if model_field.is_relation:
+            if not (isinstance(field, PrimaryKeyRelatedField) and (model_field.many_to_one or model_field.one_to_one)):
+                raise Unsupported(field)
+            convert = _converter(field.pk_field) if field.pk_field is not None else None
+            key = f"{prefix}{model_field.attname}"
+        else:
+            convert = _converter(field)
+            key = f"{prefix}{source}"
+        columns.append(key)
+        steps.append((field.field_name, key, convert, False))
+
+    def build(row, tz):
+        data = {}
+        for name, key, convert, nested in steps:
+            value = row[key]
+            if value is None:
+                data[name] = None
+            elif nested:
+                data[name] = convert(row, tz)
+            elif convert is None:
+                data[name] = value
+            else:
+                data[name] = convert(value, tz)
+        return data
+
+    return columns, build
+
+
+def compile_plan(serializer):
+    """Compiled ``(columns, builder)`` for a serializer instance, or None when unsupported."""
+    try:
+        return _compile(serializer)
+    except Unsupported:
+        return None
+
+
+def render_json(data, renderer, media_type=None, context=None):
+    compact = (
+        orjson is not None
+        and type(renderer) is JSONRenderer
+        and renderer.compact
+        and not renderer.ensure_ascii
+        and renderer.get_indent(media_type, {}) is None
+    )
+    if compact:
+        content = orjson.dumps(data, default=encoders.JSONEncoder().default)
+        # Match JSONRenderer's escaping so both paths stay byte-identical
+        return content.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+    return renderer.render(data, media_type, context)
+
+
+class FastListMixin:
+    """Serve ``list`` from ``values()`` rows when the serializer allows it."""
+
+    _fast_plans = {}  # (serializer class, selected fields) -> plan
+    max_fast_plans = 256
+
+    def get_fast_plan(self):
+        # Sparse fieldsets (see fieldsets.py) get a plan of their own
+        selected = self.selected_fields() if hasattr(self, 'selected_fields') else None
+        key = (self.get_serializer_class(), None if selected is None else tuple(selected))
+        if key not in self._fast_plans:
+            if len(self._fast_plans) >= self.max_fast_plans:
+                self._fast_plans.clear()
+            self._fast_plans[key] = compile_plan(self.get_serializer())
+        return self._fast_plans[key]
+
+    def use_fast_list(self, request):
+        return (
+            self.paginator is None
+            and isinstance(getattr(request, 'accepted_renderer', None), JSONRenderer)
+            and request.query_params.get('format') != 'api'
+        )
+
+    def list(self, request, *args, **kwargs):
+        plan = self.get_fast_plan() if self.use_fast_list(request) else None
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+
+        columns, build = plan
+        queryset = self.filter_queryset(self.get_queryset())
+        tz = timezone.get_current_timezone()
+        with timed('serialize'):
+            data = [build(row, tz) for row in queryset.values(*columns)]
+            content = render_json(data, request.accepted_renderer, request.accepted_media_type,
+                                  {'request': request, 'view': self})
+        return HttpResponse(content, content_type=request.accepted_renderer.media_type)
@@ -0,0 +1,75 @@
+# fieldsets.py
+"""
+Sparse fieldsets for read endpoints.
+
+``?fields=title,author,barcode`` limits a GET response to the named fields,
+``?omit=notes`` drops fields. List views additionally leave out the view's
+``list_omit_fields`` unless they are asked for by name. Columns backing the
+dropped fields are deferred in SQL, so they are neither fetched nor sent.
+"""
+from django.core.exceptions import FieldDoesNotExist
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def _split(value):
+    return {name.strip() for name in (value or '').split(',') if name.strip()}
+
+
+class SparseFieldsMixin:
+    list_omit_fields = ()
+    list_actions = ('list',)  # actions that return lists and so omit list_omit_fields
+
+    _field_sources = {}  # serializer class -> [(field name, source)] of readable fields
+
+    def readable_field_sources(self):
+        serializer_class = self.get_serializer_class()
+        if serializer_class not in self._field_sources:
+            serializer = serializer_class(context=self.get_serializer_context())
+            self._field_sources[serializer_class] = [(f.field_name, f.source) for f in serializer._readable_fields]
+        return self._field_sources[serializer_class]
+
+    def selected_fields(self):
+        """Names of the readable fields to render, or None for all of them."""
+        request = getattr(self, 'request', None)
+        if request is None or request.method not in SAFE_METHODS:
+            return None
+        available = [name for name, _ in self.readable_field_sources()]
+        fields = _split(request.query_params.get('fields'))
+        omit = _split(request.query_params.get('omit'))
+        if fields:
+            chosen = [name for name in available if name in fields]
+        else:
+            chosen = available
+            if getattr(self, 'action', None) in self.list_actions:
+                omit |= set(self.list_omit_fields)
+        chosen = [name for name in chosen if name not in omit]
+        return None if len(chosen) == len(available) else chosen
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        chosen = self.selected_fields()
+        if chosen is not None:
+            target = getattr(serializer, 'child', serializer)
+            for name in [name for name, field in target.fields.items() if not field.write_only]:
+                if name not in chosen:
+                    target.fields.pop(name)
+        return serializer
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        chosen = self.selected_fields()
+        if chosen is None:
+            return queryset
+        meta = queryset.model._meta
+        deferred = []
+        for name, source in self.readable_field_sources():
+            if name in chosen:
+                continue
+            try:
+                model_field = meta.get_field(source)
+            except FieldDoesNotExist:
+                continue
+            if model_field.concrete and not model_field.is_relation and not model_field.primary_key:
+                deferred.append(model_field.name)
+        return queryset.defer(*deferred) if deferred else queryset
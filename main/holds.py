@@ -0,0 +1,136 @@
+# holds.py
+"""
+Per-title hold queue built on Circulation rows with status 'reserve'.
+
+Holds are served by priority (higher first), then by reservation time.
+Every queue mutation locks the Catalog row first, so concurrent returns
+and reservations on the same title are applied one at a time.
+"""
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from main.models import Catalog, Circulation
+
+HOLD_STATUS = 'reserve'
+READY_STATUS = 'ready'
+LOAN_STATUSES = ['borrowed', 'overdue']
+# Statuses that take a physical copy off the shelf
+COPY_STATUSES = LOAN_STATUSES + [READY_STATUS]
+
+
+class NoCopyAvailable(Exception):
+    pass
+
+
+def lock_book(book_id):
+    return Catalog.objects.select_for_update().get(pk=book_id)
+
+
+def queued_holds(book):
+    """Return the pending holds for a title in service order."""
+    return (
+        Circulation.objects
+        .filter(book=book, status=HOLD_STATUS)
+        .order_by('-priority', 'reserved_at', 'id')
+    )
+
+
+def copies_in_use(book, exclude=None):
+    queryset = Circulation.objects.filter(book=book, status__in=COPY_STATUSES)
+    if exclude is not None:
+        queryset = queryset.exclude(pk=exclude.pk)
+    return queryset.count()
+
+
+def place_hold(book, borrower, priority=0, **extra_fields):
+    """Append a hold for ``borrower`` to the queue of ``book``."""
+    with transaction.atomic():
+        book = lock_book(book.pk)
+        hold = Circulation.objects.create(
+            book=book,
+            borrower=borrower,
+            status=HOLD_STATUS,
+            priority=priority,
+            reserved_at=timezone.now(),
+            **extra_fields
+        )
+        # A copy may already be sitting on the shelf
+        allocate_next_hold(book)
+        hold.refresh_from_db(fields=['status'])
+    return hold
+
+
+def queue_position(hold):
+    """
+    1-based position of ``hold`` in its title's queue, or None when it is
+    no longer waiting. Answered by a count over the hold-queue index.
+    """
+    if hold.status != HOLD_STATUS:
+        return None
+    ahead = Circulation.objects.filter(book_id=hold.book_id, status=HOLD_STATUS).filter(
+        Q(priority__gt=hold.priority) |
+        Q(priority=hold.priority, reserved_at__lt=hold.reserved_at) |
+        Q(priority=hold.priority, reserved_at=hold.reserved_at, id__lt=hold.id)
+    ).count()
+    return ahead + 1
+
+
+def allocate_next_hold(book):
+    """
+    Move the next waiting hold to 'ready' if a copy is free.
+    Must be called inside a transaction holding the lock on ``book``.
+    """
+    if copies_in_use(book) >= book.quantity:
+        return None
+    hold = queued_holds(book).select_for_update().first()
+    if hold is None:
+        return None
+    hold.status = READY_STATUS
+    hold.save(update_fields=['status'])
+    return hold
+
+
+def checkout(book, borrower, **fields):
+    """
+    Lend ``book`` to ``borrower``: a copy allocated to their hold turns the
+    hold into the loan, otherwise a free copy is taken. Counted and written
+    under the title's lock, so a walk-up checkout cannot take a copy that a
+    concurrent return is handing to the queue. Raises ``NoCopyAvailable``.
+    """
+    with transaction.atomic():
+        book = lock_book(book.pk)
+        hold = ready_hold_for(book, borrower)
+        if copies_in_use(book, exclude=hold) >= book.quantity:
+            raise NoCopyAvailable()
+        if hold is None:
+            return Circulation.objects.create(book=book, borrower=borrower, status='borrowed', **fields)
+        for field, value in fields.items():
+            setattr(hold, field, value)
+        hold.status = 'borrowed'
+        hold.save()
+        return hold
+
+
+def return_loan(loan, returned_on=None):
+    """
+    Mark ``loan`` returned and hand the freed copy to the next hold,
+    all in one transaction. Returns ``(loan, allocated_hold)``; ValueError
+    if ``loan`` is a hold rather than a loan.
+    """
+    with transaction.atomic():
+        book = lock_book(loan.book_id)
+        loan = Circulation.objects.select_for_update().get(pk=loan.pk)
+        if loan.status == 'returned':
+            return loan, None
+        if loan.status not in LOAN_STATUSES:
+            raise ValueError(f"Only borrowed items can be returned; this one is {loan.status}")
+        loan.status = 'returned'
+        loan.actual_return = returned_on or timezone.localdate()
+        loan.save(update_fields=['status', 'actual_return'])
+        return loan, allocate_next_hold(book)
+
+
+def ready_hold_for(book, borrower):
+    """The hold allocated to ``borrower`` on ``book``, if any."""
+    return Circulation.objects.filter(book=book, borrower=borrower, status=READY_STATUS).first()
@@ -0,0 +1,189 @@
+# idempotency.py
+"""
+``Idempotency-Key`` support for mutating API requests.
+
+A client that may retry a POST, PUT, PATCH or DELETE sends a unique
+``Idempotency-Key`` header with it. The first request with a key claims it
+by inserting an ``IdempotencyKey`` row (unique per user and key) before the
+view runs, and stores the response when it finishes. A repeat gets the
+stored response back, marked ``Idempotent-Replayed: true``, without running
+the view again; a repeat that arrives while the first is still running gets
+409, and reusing a key for a different request gets 422.
+
+Server errors (5xx) and responses over ``IDEMPOTENCY_MAX_RESPONSE_BYTES``
+are not stored, so a retry runs the request again. Stored responses expire
+after ``IDEMPOTENCY_TTL_SECONDS`` and are pruned as new keys come in.
+"""
+import hashlib
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from main.models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+MAX_KEY_LENGTH = 255
+
+_last_prune = 0.0
+
+
+class KeyInProgress(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "A request with this Idempotency-Key is still in progress"
+    default_code = 'idempotency_key_in_progress'
+    wait = 1  # sent as Retry-After
+
+
+class KeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = "This Idempotency-Key was used for a different request"
+    default_code = 'idempotency_key_reused'
+
+
+class InvalidKey(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters"
+    default_code = 'invalid_idempotency_key'
+
+
+class Replay(Exception):
+    """Raised from ``initial()`` to answer with a stored response instead of running the view."""
+
+    def __init__(self, response):
+        self.response = response
+
+
+def fingerprint(request):
+    """Hash of a Django request's method, path and body (its length only, when too big to read into memory)."""
+    digest = hashlib.sha256(f"{request.method} {request.get_full_path()}\n".encode())
+    length = int(request.META.get('CONTENT_LENGTH') or 0)
+    if length <= settings.DATA_UPLOAD_MAX_MEMORY_SIZE:
+        digest.update(request.body)
+    else:
+        digest.update(f"length:{length}".encode())
+    return digest.hexdigest()
+
+
+def _owner(user):
+    return f"user:{user.pk}" if user and user.is_authenticated else 'anonymous'
+
+
+def _prune(now):
+    global _last_prune
+    if time.monotonic() - _last_prune > settings.IDEMPOTENCY_PRUNE_SECONDS:
+        _last_prune = time.monotonic()
+        IdempotencyKey.objects.filter(expires_at__lt=now).delete()
+
+
+def _replay(record):
+    response = HttpResponse(bytes(record.body or b''), status=record.status_code, content_type=record.content_type or None)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def claim(user, key, request_fingerprint):
+    """
+    Claim ``key`` for a new request and return its record, or raise: ``Replay``
+    with the stored response, ``KeyInProgress`` or ``KeyReused``.
+    """
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise InvalidKey()
+    now = timezone.now()
+    _prune(now)
+    owner = _owner(user)
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(owner=owner, key=key, fingerprint=request_fingerprint, created_at=now,
+                                                     expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_TTL_SECONDS))
+        except IntegrityError:
+            pass
+        record = IdempotencyKey.objects.filter(owner=owner, key=key).first()
+        if record is None:
+            continue  # released or pruned in between: try the insert again
+        if record.expires_at < now:
+            IdempotencyKey.objects.filter(pk=record.pk, expires_at=record.expires_at).delete()
+            continue
+        if record.fingerprint != request_fingerprint:
+            raise KeyReused()
+        if record.status_code is not None:
+            raise Replay(_replay(record))
+        if record.created_at > now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS):
+            raise KeyInProgress()
+        # The first request died without finishing: take the key over
+        if IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at, status_code__isnull=True) \
+                .update(created_at=now):
+            record.created_at = now
+            return record
+    raise KeyInProgress()
+
+
+def _claimed(record):
+    # Only the request that holds the claim may finish or release it
+    return IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at, status_code__isnull=True)
+
+
+def release(record):
+    """Forget a claim so a retry runs the request again."""
+    _claimed(record).delete()
+
+
+def complete(record, response):
+    """Store ``response`` for replays, or release the key for server errors and oversized bodies."""
+    if response.status_code >= 500 or getattr(response, 'streaming', False):
+        release(record)
+        return
+    if hasattr(response, 'render') and not response.is_rendered:
+        response.render()
+    if len(response.content) > settings.IDEMPOTENCY_MAX_RESPONSE_BYTES:
+        release(record)
+        return
+    _claimed(record).update(status_code=response.status_code, content_type=response.get('Content-Type', ''),
+                            body=response.content)
+
+
+class IdempotencyMixin:
+    """Viewset mixin: mutating requests with an ``Idempotency-Key`` header run once per key."""
+
+    def initialize_request(self, request, *args, **kwargs):
+        self.idempotency_record = None
+        self.idempotency_fingerprint = None
+        if request.method in METHODS and HEADER in request.headers:
+            # Read the body before DRF's parsers consume the stream
+            self.idempotency_fingerprint = fingerprint(request)
+        return super().initialize_request(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.idempotency_fingerprint is not None:
+            # After authentication and permission checks, so keys are per user and refusals are not stored
+            self.idempotency_record = claim(request.user, request.headers[HEADER].strip(), self.idempotency_fingerprint)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, Replay):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        record, self.idempotency_record = getattr(self, 'idempotency_record', None), None
+        if record is not None:
+            complete(record, response)
+        return response
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except BaseException:
+            # An unhandled error escaped the view: let a retry run it again
+            record = getattr(self, 'idempotency_record', None)
+            if record is not None:
+                release(record)
+            raise
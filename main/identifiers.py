@@ -0,0 +1,63 @@
+# identifiers.py
+"""
+Canonical forms for catalog identifiers.
+
+ISBNs are stored as ISBN-13 digits (ISBN-10s are converted), ISSNs as eight
+characters without the hyphen. Values with a bad check digit normalize to
+None so they never take part in matching or deduplication.
+"""
+
+
+def _compact(value):
+    if not value:
+        return ''
+    return ''.join(ch for ch in str(value).upper() if ch.isdigit() or ch == 'X')
+
+
+def isbn10_check_digit(digits):
+    total = sum((10 - i) * int(d) for i, d in enumerate(digits[:9]))
+    check = (11 - total % 11) % 11
+    return 'X' if check == 10 else str(check)
+
+
+def isbn13_check_digit(digits):
+    total = sum(int(d) * (1 if i % 2 == 0 else 3) for i, d in enumerate(digits[:12]))
+    return str((10 - total % 10) % 10)
+
+
+def normalize_isbn(value):
+    """Return the ISBN-13 for an ISBN-10 or ISBN-13 in any format, or None."""
+    digits = _compact(value)
+    if len(digits) == 10:
+        if not digits[:9].isdigit() or isbn10_check_digit(digits) != digits[9]:
+            return None
+        body = '978' + digits[:9]
+        return body + isbn13_check_digit(body)
+    if len(digits) == 13:
+        if not digits.isdigit() or isbn13_check_digit(digits) != digits[12]:
+            return None
+        return digits
+    return None
+
+
+def normalize_issn(value):
+    """Return the eight-character ISSN (no hyphen), or None."""
+    digits = _compact(value)
+    if len(digits) != 8 or not digits[:7].isdigit():
+        return None
+    total = sum((8 - i) * int(d) for i, d in enumerate(digits[:7]))
+    check = (11 - total % 11) % 11
+    if ('X' if check == 10 else str(check)) != digits[7]:
+        return None
+    return digits
+
+
+def compact_isbn(value):
+    """Digits-only form used to match identifiers that fail validation."""
+    return _compact(value) or None
+
+
+def normalize_row(row):
+    """``(id, isbn, issn)`` -> ``(id, isbn13, issn_normalized)``; used by the backfill workers."""
+    pk, isbn, issn = row
+    return pk, normalize_isbn(isbn), normalize_issn(issn)
@@ -0,0 +1,275 @@
+# instrumentation.py
+"""
+Per-request performance instrumentation.
+
+``PerformanceMiddleware`` samples a fraction of requests (``PERF_SAMPLE_RATE``,
+or any request sent with an ``X-Server-Timing: 1`` header). For a sampled
+request it counts queries and database time on every connection, and the
+instrumented viewsets add permission, validation and serialization time.
+The timings are sent back as a ``Server-Timing`` header to staff users (to
+anyone with ``DEBUG``) and folded into the histograms served at
+``/api/metrics/`` in Prometheus text format. Only sampled requests are
+recorded, so the histograms follow ``PERF_SAMPLE_RATE`` and are not skewed
+toward staff who ask for timings with the header.
+
+The histograms are kept per process, so with several workers a scrape of
+``/api/metrics/`` sees the worker that answered it. Give each worker its
+own scrape target, or sum the series in Prometheus by ``instance``.
+
+Unsampled requests pay for one random number and a context variable read.
+Both middlewares here are async-capable, so async views stay on the event
+loop under ASGI.
+"""
+import random
+import threading
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 1000)
+
+_current = ContextVar('perf_recorder', default=None)
+
+
+class RequestRecorder:
+    def __init__(self, sampled=True):
+        self.started = time.perf_counter()
+        self.sampled = sampled  # False when only the X-Server-Timing header asked for it
+        self.timings = {}
+        self.queries = 0
+        self.db_time = 0.0
+        self.view = None
+        self.action = None
+        self.user = None
+
+    def add(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def __call__(self, execute, sql, params, many, context):
+        # Installed with connection.execute_wrapper()
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+
+def current():
+    """The recorder for the request being handled, or None when not sampled."""
+    return _current.get()
+
+
+class timed:
+    """Add the duration of a block to the current recorder under ``name``."""
+
+    __slots__ = ('name', 'recorder', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.recorder = _current.get()
+        if self.recorder is not None:
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.recorder is not None:
+            self.recorder.add(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.series = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, labels, value):
+        row = self.series.get(labels)
+        if row is None:
+            row = self.series[labels] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                row[i] += 1
+        row[-2] += value
+        row[-1] += 1
+
+
+class MetricsRegistry:
+    HISTOGRAMS = {
+        'http_request_duration_seconds': ("Total time spent handling the request", BUCKETS),
+        'http_request_db_seconds': ("Time spent in database queries", BUCKETS),
+        'http_request_db_queries': ("Number of database queries", QUERY_BUCKETS),
+        'http_request_permission_seconds': ("Time spent in permission checks", BUCKETS),
+        'http_request_validation_seconds': ("Time spent validating request data", BUCKETS),
+        'http_request_serializer_seconds': ("Time spent serializing responses", BUCKETS),
+    }
+    TIMINGS = {
+        'perm': 'http_request_permission_seconds',
+        'validate': 'http_request_validation_seconds',
+        'serialize': 'http_request_serializer_seconds',
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {name: Histogram(buckets) for name, (_, buckets) in self.HISTOGRAMS.items()}
+
+    def record(self, recorder, total, status_code):
+        labels = (recorder.view or 'unknown', recorder.action or '', str(status_code))
+        with self.lock:
+            self.histograms['http_request_duration_seconds'].observe(labels, total)
+            self.histograms['http_request_db_seconds'].observe(labels, recorder.db_time)
+            self.histograms['http_request_db_queries'].observe(labels, recorder.queries)
+            for key, name in self.TIMINGS.items():
+                if key in recorder.timings:
+                    self.histograms[name].observe(labels, recorder.timings[key])
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, (help_text, _) in self.HISTOGRAMS.items():
+                histogram = self.histograms[name]
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for (view, action, status_code), row in sorted(histogram.series.items()):
+                    base = f'view="{view}",action="{action}",status="{status_code}"'
+                    for bound, count in zip(histogram.buckets, row):
+                        lines.append(f'{name}_bucket{{{base},le="{bound}"}} {count}')
+                    lines.append(f'{name}_bucket{{{base},le="+Inf"}} {row[-1]}')
+                    lines.append(f'{name}_sum{{{base}}} {row[-2]:.6f}')
+                    lines.append(f'{name}_count{{{base}}} {row[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def server_timing(recorder, total):
+    parts = [f'db;dur={recorder.db_time * 1000:.2f};desc="{recorder.queries} queries"']
+    for name, seconds in recorder.timings.items():
+        parts.append(f'{name};dur={seconds * 1000:.2f}')
+    parts.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(parts)
+
+
+def wrap_connections(stack, wrapper):
+    """Install ``wrapper`` on every connection of the calling thread until ``stack`` closes."""
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(wrapper))
+
+
+async def awrap_connections(stack, wrapper):
+    # The async ORM runs queries on the request's sync thread, so wrap that thread's connections
+    await sync_to_async(wrap_connections)(stack, wrapper)
+
+
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def recorder(self, request):
+        """A recorder when the request is sampled or asks for timings, else None."""
+        rate = getattr(settings, 'PERF_SAMPLE_RATE', 0.0)
+        sampled = rate > 0 and random.random() < rate
+        if sampled or request.headers.get('X-Server-Timing') == '1':
+            return RequestRecorder(sampled)
+        return None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = self.recorder(request)
+        if recorder is None:
+            return self.get_response(request)
+
+        token = _current.set(recorder)
+        try:
+            with ExitStack() as stack:
+                wrap_connections(stack, recorder)
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, recorder)
+
+    async def __acall__(self, request):
+        recorder = self.recorder(request)
+        if recorder is None:
+            return await self.get_response(request)
+
+        token = _current.set(recorder)
+        try:
+            stack = ExitStack()
+            await awrap_connections(stack, recorder)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, recorder)
+
+    def finish(self, request, response, recorder):
+        total = time.perf_counter() - recorder.started
+        if recorder.view is None and request.resolver_match is not None:
+            recorder.view = request.resolver_match.view_name
+        # The user the view authenticated; timings reveal query counts, so only staff see them
+        visible = settings.DEBUG or bool(recorder.user and recorder.user.is_staff)
+        if visible:
+            response['Server-Timing'] = server_timing(recorder, total)
+        if recorder.sampled:
+            registry.record(recorder, total, response.status_code)
+        return response
+
+
+def _timed_method(method, name):
+    def wrapper(*args, **kwargs):
+        with timed(name):
+            return method(*args, **kwargs)
+    return wrapper
+
+
+class InstrumentedViewMixin:
+    """
+    Adds permission, validation and serialization timings to sampled
+    requests. A no-op for requests the middleware did not sample.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        recorder = _current.get()
+        if recorder is not None:
+            recorder.view = type(self).__name__
+            recorder.action = getattr(self, 'action', None) or request.method.lower()
+        super().initial(request, *args, **kwargs)
+
+    def perform_authentication(self, request):
+        super().perform_authentication(request)
+        recorder = _current.get()
+        if recorder is not None:
+            recorder.user = request.user
+
+    def check_permissions(self, request):
+        with timed('perm'):
+            super().check_permissions(request)
+
+    def check_object_permissions(self, request, obj):
+        with timed('perm'):
+            super().check_object_permissions(request, obj)
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        if _current.get() is not None:
+            serializer.is_valid = _timed_method(serializer.is_valid, 'validate')
+            serializer.to_representation = _timed_method(serializer.to_representation, 'serialize')
+        return serializer
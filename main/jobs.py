@@ -0,0 +1,239 @@
+# jobs.py
+"""
+Database-backed background jobs.
+
+Work is declared with ``@task`` and queued with ``enqueue``; ``manage.py
+run_jobs`` starts worker processes that claim jobs from the ``Job`` table,
+highest priority first. No broker is involved: the claim is a conditional
+UPDATE (``SKIP LOCKED`` on PostgreSQL), so any number of workers can poll
+the same database.
+
+A running job holds a lease that its worker renews; if the worker dies, the
+job is requeued once the lease expires. Failed attempts are retried with
+exponential backoff until ``max_attempts``. Task arguments and results must
+be JSON serializable.
+
+    @jobs.task(max_attempts=5)
+    def send_digest(user_id):
+        ...
+
+    jobs.enqueue(send_digest, args=[user.pk], priority=jobs.HIGH)
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from main.models import Job
+
+logger = logging.getLogger(__name__)
+
+LOW, NORMAL, HIGH = -10, 0, 10
+
+_tasks = {}  # dotted path -> Task
+
+
+class Task:
+    def __init__(self, func, max_attempts=None, backoff=None, clear_args=False):
+        self.func = func
+        self.name = f"{func.__module__}.{func.__qualname__}"
+        self.max_attempts = max_attempts
+        self.backoff = backoff  # base delay in seconds, doubled per attempt
+        self.clear_args = clear_args  # e.g. passwords: erased once the job is done
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def enqueue(self, *args, **kwargs):
+        return enqueue(self, args=args, kwargs=kwargs)
+
+
+def task(func=None, max_attempts=None, backoff=None, clear_args=False):
+    """Register a function as a job task; it stays callable directly."""
+    def register(func):
+        registered = _tasks[f"{func.__module__}.{func.__qualname__}"] = Task(func, max_attempts, backoff, clear_args)
+        return registered
+    return register(func) if func is not None else register
+
+
+def get_task(name):
+    if name not in _tasks:
+        # Importing the module runs its @task decorators
+        found = import_string(name)
+        if isinstance(found, Task):
+            _tasks[name] = found
+    if name not in _tasks:
+        raise LookupError(f"{name} is not a registered task")
+    return _tasks[name]
+
+
+def enqueue(task, args=(), kwargs=None, priority=NORMAL, delay=0, max_attempts=None, created_by=None):
+    """
+    Queue ``task`` (a ``Task`` or its dotted path) to run in a worker after
+    ``delay`` seconds. Inside a transaction the job is only visible to
+    workers once the transaction commits.
+    """
+    task = get_task(task) if isinstance(task, str) else task
+    return Job.objects.create(
+        task=task.name,
+        args=list(args),
+        kwargs=kwargs or {},
+        priority=priority,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or task.max_attempts or settings.JOB_MAX_ATTEMPTS,
+        created_by=created_by if created_by is None or created_by.is_authenticated else None,
+    )
+
+
+def backoff_seconds(task, attempts):
+    """Delay before retry number ``attempts``: exponential with jitter, capped."""
+    base = task.backoff or settings.JOB_RETRY_BACKOFF
+    delay = min(base * 2 ** (attempts - 1), settings.JOB_RETRY_BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def _lease():
+    return timezone.now() + timedelta(seconds=settings.JOB_LEASE_SECONDS)
+
+
+def claim(worker):
+    """Mark the next due job as running for ``worker`` and return it, or None."""
+    now = timezone.now()
+    ready = Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by('-priority', 'run_at')
+    claimed = {'status': Job.RUNNING, 'worker': worker, 'locked_until': _lease(), 'started_at': now}
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job = ready.select_for_update(skip_locked=True).first()
+            if job is None:
+                return None
+            Job.objects.filter(pk=job.pk).update(attempts=job.attempts + 1, **claimed)
+    else:
+        # Without SKIP LOCKED, race for one of the first few candidates
+        for pk, attempts in ready.values_list('pk', 'attempts')[:10]:
+            if Job.objects.filter(pk=pk, status=Job.QUEUED).update(attempts=attempts + 1, **claimed):
+                break
+        else:
+            return None
+        job = Job(pk=pk)
+    job.refresh_from_db()
+    return job
+
+
+def requeue_expired():
+    """Put running jobs whose worker stopped renewing the lease back in the queue."""
+    expired = Job.objects.filter(status=Job.RUNNING, locked_until__lt=timezone.now())
+    for job in expired:
+        if job.attempts >= job.max_attempts:
+            _finish(job, Job.FAILED, error="Worker lost (lease expired)")
+        else:
+            Job.objects.filter(pk=job.pk, status=Job.RUNNING, worker=job.worker).update(
+                status=Job.QUEUED, worker=None, locked_until=None)
+
+
+def _erased(job):
+    # Resolved rather than looked up: this process (a web worker cancelling, a fresh
+    # worker recovering a lost lease) may not have imported the task's module yet
+    try:
+        clear_args = get_task(job.task).clear_args
+    except (ImportError, LookupError):
+        clear_args = False
+    return {'args': [], 'kwargs': {}} if clear_args else {}
+
+
+def cancel(job):
+    """Cancel a job that has not started; returns False once a worker has it."""
+    return bool(Job.objects.filter(pk=job.pk, status=Job.QUEUED).update(
+        status=Job.CANCELLED, locked_until=None, finished_at=timezone.now(), **_erased(job)))
+
+
+def _finish(job, status, result=None, error=None):
+    # Conditional, so a job requeued after a lost lease is not overwritten
+    return Job.objects.filter(pk=job.pk, status=Job.RUNNING, worker=job.worker).update(
+        status=status, result=result, error=error, locked_until=None, finished_at=timezone.now(), **_erased(job))
+
+
+class _Heartbeat(threading.Thread):
+    """Renews a running job's lease until stopped."""
+
+    def __init__(self, job):
+        super().__init__(daemon=True)
+        self.job = job
+        self.stopped = threading.Event()
+
+    def run(self):
+        interval = settings.JOB_LEASE_SECONDS / 3
+        try:
+            while not self.stopped.wait(interval):
+                Job.objects.filter(pk=self.job.pk, worker=self.job.worker).update(locked_until=_lease())
+        finally:
+            connection.close()
+
+
+def execute(job):
+    """Run a claimed job and record its outcome, scheduling a retry on failure."""
+    try:
+        task = get_task(job.task)
+    except (ImportError, LookupError) as exc:
+        _finish(job, Job.FAILED, error=str(exc))
+        return
+    heartbeat = _Heartbeat(job)
+    heartbeat.start()
+    try:
+        result = task.func(*job.args, **job.kwargs)
+    except Exception as exc:
+        error = ''.join(traceback.format_exception(exc))
+        if job.attempts < job.max_attempts:
+            delay = backoff_seconds(task, job.attempts)
+            Job.objects.filter(pk=job.pk, status=Job.RUNNING, worker=job.worker).update(
+                status=Job.QUEUED, error=error, worker=None, locked_until=None,
+                run_at=timezone.now() + timedelta(seconds=delay))
+            logger.warning("Job %s (%s) failed, retrying in %.0fs", job.pk, job.task, delay)
+        else:
+            _finish(job, Job.FAILED, error=error)
+            logger.error("Job %s (%s) failed after %s attempts", job.pk, job.task, job.attempts)
+    else:
+        _finish(job, Job.SUCCEEDED, result=result)
+    finally:
+        heartbeat.stopped.set()
+        heartbeat.join()
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def run_worker(stop=None, poll_interval=None, burst=False):
+    """
+    Claim and run jobs until ``stop`` (a ``threading.Event``) is set; with
+    ``burst``, return as soon as the queue is empty. Returns the number run.
+    """
+    stop = stop or threading.Event()
+    poll_interval = settings.JOB_POLL_SECONDS if poll_interval is None else poll_interval
+    worker = worker_name()
+    done = 0
+    last_recovery = 0.0
+    while not stop.is_set():
+        if time.monotonic() - last_recovery > settings.JOB_LEASE_SECONDS / 3:
+            requeue_expired()
+            last_recovery = time.monotonic()
+        job = claim(worker)
+        if job is None:
+            close_old_connections()
+            if burst:
+                break
+            stop.wait(poll_interval)
+            continue
+        execute(job)
+        done += 1
+        # Hand the connection back between jobs, as at the end of a request
+        close_old_connections()
+    return done
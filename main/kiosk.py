@@ -0,0 +1,161 @@
+# kiosk.py
+"""
+Offline attendance uploads from gate kiosks.
+
+A kiosk that loses its connection queues scans locally, each with the time
+it happened and a key the kiosk generates, and uploads the queue in one
+request when it is back. ``record_scans`` validates the scans, looks up
+all their barcodes and keys in a few set-based queries, applies the same
+"one scan per person per minute" rule as the single-scan endpoint, and
+inserts what is left with ``bulk_create``.
+
+Keys are unique in the database, so a replayed or overlapping upload (even
+two at once) records each scan exactly once; a repeat reports
+``duplicate`` with the id of the original row.
+"""
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from main import events
+from main.models import Attendance, User
+from main.utils import chunks
+
+CREATED = 'created'
+DUPLICATE = 'duplicate'  # this key was recorded before
+RECENT = 'recent'  # the person was already recorded within RECENT_SCAN_WINDOW
+UNKNOWN_BARCODE = 'unknown_barcode'
+INVALID = 'invalid'
+
+RECENT_SCAN_WINDOW = timedelta(minutes=1)
+MAX_CLOCK_SKEW = timedelta(minutes=5)  # kiosk clocks may run slightly ahead
+SIGN_TYPES = {choice for choice, _ in Attendance.SIGN_CHOICES}
+
+
+def _clean(scan, now):
+    if not isinstance(scan, dict):
+        raise ValueError("Scan must be an object")
+    key = str(scan.get('key') or '').strip()
+    if not key or len(key) > 64:
+        raise ValueError("key is required (at most 64 characters)")
+    barcode = str(scan.get('barcode') or '').strip()
+    if not barcode:
+        raise ValueError("barcode is required")
+    scanned_at = parse_datetime(str(scan.get('scanned_at') or ''))
+    if scanned_at is None:
+        raise ValueError("scanned_at must be an ISO 8601 datetime")
+    if timezone.is_naive(scanned_at):
+        scanned_at = timezone.make_aware(scanned_at)
+    if scanned_at > now + MAX_CLOCK_SKEW:
+        raise ValueError("scanned_at is in the future")
+    sign_type = str(scan.get('sign_type') or Attendance._meta.get_field('sign_type').default)
+    if sign_type not in SIGN_TYPES:
+        raise ValueError(f"Unknown sign_type: {sign_type!r}")
+    return {
+        'key': key,
+        'barcode': barcode,
+        'created_at': scanned_at,
+        'sign_type': sign_type,
+        'purpose': (str(scan.get('purpose') or '')[:255]) or None,
+        'items': (str(scan.get('items') or '')[:255]) or None,
+    }
+
+
+def _lookup(queryset, field, values, columns, chunk_size=2000):
+    """``{field value: row}`` for rows whose ``field`` is in ``values``, one query per chunk."""
+    found = {}
+    for chunk in chunks(values, chunk_size):
+        for row in queryset.filter(**{f"{field}__in": chunk}).values_list(field, *columns):
+            found[row[0]] = row[1:]
+    return found
+
+
+def _is_recent(times, moment):
+    """Whether sorted ``times`` has one within RECENT_SCAN_WINDOW of ``moment``."""
+    index = bisect_left(times, moment)
+    return any(abs(times[i] - moment) < RECENT_SCAN_WINDOW for i in (index - 1, index) if 0 <= i < len(times))
+
+
+def record_scans(scans, method='kiosk'):
+    """
+    Record a kiosk's queued scans (dicts with ``key``, ``barcode``,
+    ``scanned_at`` and optional ``sign_type``, ``purpose`` and ``items``).
+    Returns ``{'created': n, 'results': [...]}`` with one ``{'key', 'status'}``
+    result per scan, in order, plus ``id`` for recorded ones and ``error``
+    for rejected ones.
+    """
+    now = timezone.now()
+    results = [None] * len(scans)
+    cleaned = {}  # key -> (index, scan)
+    repeats = []  # (index, index of the first scan with the same key)
+    for index, raw in enumerate(scans):
+        try:
+            scan = _clean(raw, now)
+        except (TypeError, ValueError) as exc:
+            key = raw.get('key') if isinstance(raw, dict) else None
+            results[index] = {'key': key, 'status': INVALID, 'error': str(exc)}
+            continue
+        if scan['key'] in cleaned:
+            repeats.append((index, cleaned[scan['key']][0]))
+            continue
+        cleaned[scan['key']] = (index, scan)
+
+    recorded = _lookup(Attendance.objects.all(), 'client_key', list(cleaned), ['id'])
+    users = _lookup(User.objects.filter(is_active=True), 'barcode', list({scan['barcode'] for _, scan in cleaned.values()}), ['id'])
+
+    pending = []
+    for key, (index, scan) in cleaned.items():
+        if key in recorded:
+            results[index] = {'key': key, 'status': DUPLICATE, 'id': str(recorded[key][0])}
+        elif scan['barcode'] not in users:
+            results[index] = {'key': key, 'status': UNKNOWN_BARCODE}
+        else:
+            scan['user_id'] = users[scan['barcode']][0]
+            pending.append((index, scan))
+    if not pending:
+        return _finish(results, repeats, 0)
+
+    # Scans already on record around the batch, per person, to apply the one-per-minute rule
+    earliest = min(scan['created_at'] for _, scan in pending) - RECENT_SCAN_WINDOW
+    latest = max(scan['created_at'] for _, scan in pending) + RECENT_SCAN_WINDOW
+    seen = defaultdict(list)
+    for chunk in chunks({scan['user_id'] for _, scan in pending}, 2000):
+        for user_id, moment in Attendance.objects.filter(user_id__in=chunk, created_at__range=(earliest, latest)) \
+                .values_list('user_id', 'created_at'):
+            seen[user_id].append(moment)
+    for times in seen.values():
+        times.sort()
+
+    rows = []
+    for index, scan in sorted(pending, key=lambda item: item[1]['created_at']):
+        times = seen[scan['user_id']]
+        if _is_recent(times, scan['created_at']):
+            results[index] = {'key': scan['key'], 'status': RECENT}
+            continue
+        times.insert(bisect_left(times, scan['created_at']), scan['created_at'])
+        rows.append((index, Attendance(user_id=scan['user_id'], created_at=scan['created_at'], sign_type=scan['sign_type'],
+                                       purpose=scan['purpose'], items=scan['items'], method=method,
+                                       client_key=scan['key'])))
+
+    with transaction.atomic():
+        # A concurrent upload of the same keys loses the race quietly; the re-read below tells which rows are ours
+        Attendance.objects.bulk_create([row for _, row in rows], batch_size=1000, ignore_conflicts=True)
+        stored = _lookup(Attendance.objects.all(), 'client_key', [row.client_key for _, row in rows], ['id'])
+        created = [row for _, row in rows if stored.get(row.client_key, (None,))[0] == row.pk]
+        events.publish('attendance', *(events.scan_event(row) for row in created))
+    for index, row in rows:
+        stored_id = stored[row.client_key][0]
+        results[index] = {'key': row.client_key, 'status': CREATED if stored_id == row.pk else DUPLICATE, 'id': str(stored_id)}
+    return _finish(results, repeats, len(created))
+
+
+def _finish(results, repeats, created):
+    for index, first in repeats:
+        results[index] = {'key': results[first]['key'], 'status': DUPLICATE}
+        if 'id' in results[first]:
+            results[index]['id'] = results[first]['id']
+    return {'created': created, 'results': results}
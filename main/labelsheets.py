@@ -0,0 +1,258 @@
+# labelsheets.py
+"""
+Printable sheets of spine labels (Catalog) and library cards (User).
+
+Records are laid out on A4 pages per a ``LAYOUTS`` entry. Pages are
+rendered as 1-bit bitmaps across a process pool and written as one PDF
+page each; ``stream_sheets`` yields the PDF piece by piece, in page order,
+as the workers finish, so a download starts after the first page.
+"""
+import multiprocessing
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, time
+from itertools import repeat
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from main.barcodeimages import bars_image, font, modules
+from main.utils import chunks
+
+MM_PER_INCH = 25.4
+POINTS_PER_INCH = 72
+
+
+class Layout:
+    """A grid of ``columns`` x ``rows`` labels; all sizes in millimetres."""
+
+    def __init__(self, label_width, label_height, columns, rows, left, top, gap_x=0.0, gap_y=0.0,
+                 page_width=210.0, page_height=297.0):
+        self.label_width = label_width
+        self.label_height = label_height
+        self.columns = columns
+        self.rows = rows
+        self.left = left
+        self.top = top
+        self.gap_x = gap_x
+        self.gap_y = gap_y
+        self.page_width = page_width
+        self.page_height = page_height
+
+    @property
+    def per_page(self):
+        return self.columns * self.rows
+
+    def cells(self):
+        """Top-left corner of each label, row by row."""
+        for row in range(self.rows):
+            for column in range(self.columns):
+                yield (self.left + column * (self.label_width + self.gap_x),
+                       self.top + row * (self.label_height + self.gap_y))
+
+
+LAYOUTS = {
+    # 21 per sheet, 63.5 x 38.1 mm (Avery L7160 and compatibles)
+    'spine': Layout(63.5, 38.1, 3, 7, left=7.2, top=15.15, gap_x=2.5),
+    # 10 per sheet, ID-1 card size
+    'card': Layout(85.6, 54.0, 2, 5, left=16.9, top=9.5, gap_x=5.0, gap_y=2.0),
+}
+
+
+def select(queryset, ids=(), since=None, date_field='created_at'):
+    """Records by primary key and/or created since an ISO date or datetime, e.g. the last intake."""
+    if not ids and not since:
+        raise ValueError("Select records with ids or since")
+    if ids:
+        try:
+            queryset = queryset.filter(pk__in=list(ids))
+        except (ValidationError, ValueError):
+            raise ValueError("Invalid id in ids")
+    if since:
+        moment = parse_datetime(since)
+        if moment is None:
+            day = parse_date(since)
+            if day is None:
+                raise ValueError(f"Invalid since: {since!r}")
+            moment = timezone.make_aware(datetime.combine(day, time.min))
+        elif timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        queryset = queryset.filter(**{f"{date_field}__gte": moment})
+    return queryset
+
+
+def catalog_labels(queryset, per_copy=False):
+    """Spine label content: call number, title, author and barcode."""
+    for row in queryset.values('barcode', 'dewey_decimal', 'title', 'author', 'quantity').iterator(chunk_size=2000):
+        label = {'barcode': row['barcode'], 'lines': [row['dewey_decimal'] or '', row['title'] or '', row['author'] or '']}
+        yield from repeat(label, max(row['quantity'], 1) if per_copy else 1)
+
+
+def patron_cards(queryset):
+    """Library card content: name, category, student ID and barcode."""
+    fields = ('barcode', 'first_name', 'last_name', 'username', 'user_category', 'staff_category', 'student_id', 'faculty')
+    for row in queryset.values(*fields).iterator(chunk_size=2000):
+        name = ' '.join(part for part in (row['first_name'], row['last_name']) if part) or row['username'] or ''
+        category = (row['user_category'] or row['staff_category'] or '').title()
+        yield {'barcode': row['barcode'], 'lines': [name, ' · '.join(p for p in (category, row['student_id']) if p),
+                                                    row['faculty'] or '']}
+
+
+_glyphs = {}  # (size, char) -> (mask, left, top, advance), per process
+
+
+def _glyph(size, char):
+    glyph = _glyphs.get((size, char))
+    if glyph is None:
+        from PIL import Image, ImageDraw
+
+        typeface = font(size)
+        left, top, right, bottom = typeface.getbbox(char)
+        mask = None
+        if right > left and bottom > top:
+            mask = Image.new('L', (right - left, bottom - top), 0)
+            ImageDraw.Draw(mask).text((-left, -top), char, fill=255, font=typeface)
+        glyph = _glyphs[(size, char)] = (mask, left, top, typeface.getlength(char))
+    return glyph
+
+
+def _text_width(text, size):
+    return sum(_glyph(size, char)[3] for char in text)
+
+
+def _draw_text(page, x, y, text, size):
+    """
+    Draw ``text`` with its top at ``y`` by pasting cached glyphs: rasterizing
+    each string with FreeType is most of the cost of a page, and label text
+    repeats the same few dozen characters.
+    """
+    for char in text:
+        mask, left, top, advance = _glyph(size, char)
+        if mask is not None:
+            page.paste(0, (round(x) + left, y + top), mask)
+        x += advance
+
+
+def _fit(text, size, width):
+    """``text``, cut short with an ellipsis if wider than ``width``."""
+    if _text_width(text, size) <= width:
+        return text
+    width -= _text_width('...', size)
+    used = 0
+    for index, char in enumerate(text):
+        used += _glyph(size, char)[3]
+        if used > width:
+            return text[:index] + '...'
+    return text
+
+
+def _draw_label(page, label, x, y, width, height, px):
+    pad = round(2 * px)
+    inner = width - 2 * pad
+    heading, body, caption = round(4 * px), round(3 * px), round(2.5 * px)
+    top = y + pad
+    for index, text in enumerate(label['lines']):
+        size = heading if index == 0 else body
+        if text:
+            _draw_text(page, x + pad, top, _fit(text, size, inner), size)
+        top += round((5 if index == 0 else 4) * px)
+
+    value = label['barcode']
+    if not value:
+        return
+    ascent, descent = font(caption).getmetrics()
+    caption_top = y + height - pad - ascent - descent
+    try:
+        symbol_width = sum(modules(value))
+    except ValueError:
+        # Not encodable as Code 128: print the value only
+        _draw_text(page, x + pad, top, _fit(value, caption, inner), caption)
+        return
+    scale = max(1, inner // symbol_width)
+    bars = bars_image(value, scale, max(caption_top - top, 1), quiet=0)
+    page.paste(bars.crop((0, 0, min(bars.width, inner), bars.height)), (x + pad + max(0, (inner - bars.width) // 2), top))
+    value = _fit(value, caption, inner)
+    _draw_text(page, x + (width - _text_width(value, caption)) / 2, caption_top, value, caption)
+
+
+def render_page(layout_name, labels, dpi=300):
+    """One page of ``labels`` as zlib-compressed 1-bit rows (PDF DeviceGray, 1 = white)."""
+    from PIL import Image
+
+    layout = LAYOUTS[layout_name]
+    px = dpi / MM_PER_INCH
+    page = Image.new('L', (round(layout.page_width * px), round(layout.page_height * px)), 255)
+    for label, (left, top) in zip(labels, layout.cells()):
+        _draw_label(page, label, round(left * px), round(top * px),
+                    round(layout.label_width * px), round(layout.label_height * px), px)
+    bitmap = page.convert('1', dither=Image.Dither.NONE)
+    return zlib.compress(bitmap.tobytes(), 6)
+
+
+def render_pages(layout_name, labels, dpi=300, workers=None):
+    """Compressed page bitmaps in order, rendered across ``workers`` processes."""
+    workers = settings.RENDER_WORKERS if workers is None else workers
+    pages = list(chunks(labels, LAYOUTS[layout_name].per_page))
+    if workers < 2 or len(pages) < 2:
+        for page in pages:
+            yield render_page(layout_name, page, dpi)
+        return
+    # Workers need Pillow only, not a configured Django
+    executor = ProcessPoolExecutor(min(workers, len(pages)), mp_context=multiprocessing.get_context('spawn'))
+    try:
+        yield from executor.map(render_page, repeat(layout_name), pages, repeat(dpi))
+    finally:
+        # Also reached when a download is abandoned part way
+        executor.shutdown(cancel_futures=True)
+
+
+def pdf_document(pages, layout, dpi=300):
+    """
+    Yield a PDF whose pages are the 1-bit bitmaps from ``pages``. Objects
+    are written as they come; the page tree and xref table go last.
+    """
+    width_px, height_px = round(layout.page_width / MM_PER_INCH * dpi), round(layout.page_height / MM_PER_INCH * dpi)
+    width_pt = f"{layout.page_width / MM_PER_INCH * POINTS_PER_INCH:.2f}"
+    height_pt = f"{layout.page_height / MM_PER_INCH * POINTS_PER_INCH:.2f}"
+    offsets = {}
+    position = 0
+
+    def obj(number, body, stream=None):
+        nonlocal position
+        offsets[number] = position
+        data = f"{number} 0 obj\n".encode() + body.encode()
+        if stream is not None:
+            data += b"\nstream\n" + stream + b"\nendstream"
+        data += b"\nendobj\n"
+        position += len(data)
+        return data
+
+    header = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+    position = len(header)
+    yield header
+    yield obj(1, "<< /Type /Catalog /Pages 2 0 R >>")
+    kids = []
+    number = 3
+    for bitmap in pages:
+        image, content, page = number, number + 1, number + 2
+        number += 3
+        yield obj(image, f"<< /Type /XObject /Subtype /Image /Width {width_px} /Height {height_px} /ColorSpace /DeviceGray "
+                         f"/BitsPerComponent 1 /Filter /FlateDecode /Length {len(bitmap)} >>", bitmap)
+        drawing = f"q {width_pt} 0 0 {height_pt} 0 0 cm /Im0 Do Q".encode()
+        yield obj(content, f"<< /Length {len(drawing)} >>", drawing)
+        yield obj(page, f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width_pt} {height_pt}] "
+                        f"/Resources << /XObject << /Im0 {image} 0 R >> >> /Contents {content} 0 R >>")
+        kids.append(f"{page} 0 R")
+    yield obj(2, f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>")
+
+    xref = [f"xref\n0 {number}\n", "0000000000 65535 f \n"]
+    xref += [f"{offsets[n]:010d} 00000 n \n" for n in range(1, number)]
+    xref.append(f"trailer\n<< /Size {number} /Root 1 0 R >>\nstartxref\n{position}\n%%EOF\n")
+    yield ''.join(xref).encode()
+
+
+def stream_sheets(layout_name, labels, dpi=300, workers=None):
+    """The PDF for ``labels`` laid out with ``LAYOUTS[layout_name]``, as an iterator of bytes."""
+    return pdf_document(render_pages(layout_name, labels, dpi, workers), LAYOUTS[layout_name], dpi)
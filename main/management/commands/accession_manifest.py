@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from main.accessioning import accession_manifest, read_manifest_csv
+from main.models import Acquisition
+
+
+class Command(BaseCommand):
+    help = "Accession a shipment manifest CSV into Acquisition and Catalog records"
+
+    def add_arguments(self, parser):
+        parser.add_argument('manifest', help="CSV file with title, isbn, quantity, amount, ... columns")
+        parser.add_argument('--source', default='purchase', choices=[c[0] for c in Acquisition.SOURCE_CHOICES])
+        parser.add_argument('--supplier')
+        parser.add_argument('--date', help="Date acquired (YYYY-MM-DD), defaults to today")
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        date_acquired = parse_date(options['date']) if options['date'] else None
+        if options['date'] and date_acquired is None:
+            raise CommandError(f"Invalid date: {options['date']}")
+
+        with open(options['manifest'], newline='', encoding='utf-8-sig') as fileobj:
+            result = accession_manifest(
+                read_manifest_csv(fileobj),
+                source=options['source'],
+                supplier=options['supplier'],
+                date_acquired=date_acquired,
+                chunk_size=options['chunk_size'],
+            )
+
+        for error in result['errors']:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['acquisitions']} acquisitions, {result['created']} new catalog records, "
+            f"{result['incremented']} catalog records topped up, {len(result['errors'])} errors"
+        ))
@@ -0,0 +1,50 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from main.identifiers import normalize_row
+from main.models import Catalog
+
+
+class Command(BaseCommand):
+    help = "Fill Catalog.isbn13 / issn_normalized from the free-form isbn and issn columns"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        rows = Catalog.objects.values_list('id', 'isbn', 'issn').order_by('id').iterator(chunk_size=batch_size)
+
+        # Values already owned by a row, so collisions are detected across batches
+        seen_isbn = dict(Catalog.objects.exclude(isbn13=None).values_list('isbn13', 'id'))
+        seen_issn = dict(Catalog.objects.exclude(issn_normalized=None).values_list('issn_normalized', 'id'))
+
+        updated = 0
+        collisions = []
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                changed = []
+                for pk, isbn13, issn in pool.map(normalize_row, batch, chunksize=max(1, batch_size // 16)):
+                    if isbn13 and seen_isbn.setdefault(isbn13, pk) != pk:
+                        collisions.append(('isbn', isbn13, seen_isbn[isbn13], pk))
+                        isbn13 = None
+                    if issn and seen_issn.setdefault(issn, pk) != pk:
+                        collisions.append(('issn', issn, seen_issn[issn], pk))
+                        issn = None
+                    changed.append(Catalog(id=pk, isbn13=isbn13, issn_normalized=issn))
+                with transaction.atomic():
+                    Catalog.objects.bulk_update(changed, ['isbn13', 'issn_normalized'])
+                updated += len(changed)
+
+        for kind, value, kept, duplicate in collisions:
+            self.stdout.write(f"{kind} {value}: kept {kept}, duplicate {duplicate}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Normalized {updated} catalog records, {len(collisions)} collisions"
+        ))
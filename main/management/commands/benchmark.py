@@ -0,0 +1,66 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings, setup_databases, teardown_databases
+
+from main.benchmarks import SCENARIOS, compare
+
+
+class Command(BaseCommand):
+    help = (
+        "Run load-test scenarios against a throw-away copy of the configured database "
+        "and report throughput and p50/p95/p99 latency. Point DATABASE_URL at a local "
+        "database first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f"Scenarios to run (default: all of {', '.join(SCENARIOS)})")
+        parser.add_argument('--iterations', type=int, default=300)
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--keepdb', action='store_true', help="Reuse the benchmark database between runs")
+        parser.add_argument('--save-baseline', metavar='PATH', help="Write results as the new baseline")
+        parser.add_argument('--baseline', metavar='PATH', help="Compare results with a stored baseline")
+        parser.add_argument('--tolerance', type=float, default=20.0,
+                            help="Allowed regression in percent before the run fails (default: 20)")
+
+    def handle(self, *args, **options):
+        names = options['scenarios'] or list(SCENARIOS)
+        unknown = [name for name in names if name not in SCENARIOS]
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(unknown)}")
+        if not settings.DATABASE_URL:
+            raise CommandError("Set DATABASE_URL to a local database before benchmarking.")
+
+        results = {}
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'])
+        try:
+            with override_settings(DEBUG=False):
+                for name in names:
+                    self.stdout.write(f"Running {name}...")
+                    results[name] = SCENARIOS[name](options['iterations'], options['concurrency'])
+        finally:
+            teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+
+        self.stdout.write(f"{'scenario':<20}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for name, row in results.items():
+            self.stdout.write(
+                f"{name:<20}{row['requests']:>10}{row['errors']:>8}{row['throughput']:>10}"
+                f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}"
+            )
+
+        if options['save_baseline']:
+            Path(options['save_baseline']).write_text(json.dumps(results, indent=2, sort_keys=True))
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['save_baseline']}"))
+
+        if options['baseline']:
+            baseline = json.loads(Path(options['baseline']).read_text())
+            rows, regressions = compare(results, baseline, options['tolerance'])
+            for name, metric, before, after, change in rows:
+                self.stdout.write(f"{name:<20}{metric:<12}{before:>10} -> {after:<10}({change:+.1f}%)")
+            if regressions:
+                raise CommandError("Regressions beyond tolerance: " + ", ".join(
+                    f"{name} {metric} {change:+.1f}%" for name, metric, change in regressions
+                ))
+            self.stdout.write(self.style.SUCCESS("No regressions beyond tolerance"))
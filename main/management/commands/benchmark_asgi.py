@@ -0,0 +1,93 @@
+import json
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main.benchmarks import READ_ENDPOINTS, auth_header, drop_read_fixtures, make_read_fixtures, run_server_http
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise CommandError("uvicorn exited during startup")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise CommandError("uvicorn did not start in time")
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the sync DRF read views with their native async versions under uvicorn: "
+        "throughput and p50/p95/p99 latency at each concurrency level. Seeds its fixtures "
+        "into the database at DATABASE_URL and removes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('endpoints', nargs='*', help=f"Endpoints to run (default: all of {', '.join(READ_ENDPOINTS)})")
+        parser.add_argument('--iterations', type=int, default=500, help="Requests per endpoint, mode and level")
+        parser.add_argument('--concurrency', default='1,16,64', help="Comma-separated concurrency levels")
+        parser.add_argument('--output', metavar='PATH', help="Also write the results as JSON")
+
+    def handle(self, *args, **options):
+        names = options['endpoints'] or list(READ_ENDPOINTS)
+        unknown = [name for name in names if name not in READ_ENDPOINTS]
+        if unknown:
+            raise CommandError(f"Unknown endpoint(s): {', '.join(unknown)}")
+        if not settings.DATABASE_URL:
+            raise CommandError("Set DATABASE_URL to a local database before benchmarking.")
+        levels = [int(level) for level in options['concurrency'].split(',')]
+
+        prefix = 'asgi'
+        drop_read_fixtures(prefix)
+        reader, first, second = make_read_fixtures(prefix)
+        headers = {'Authorization': auth_header(reader)['HTTP_AUTHORIZATION'], 'Connection': 'keep-alive'}
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'backend.asgi:application', '--port', str(port),
+             '--log-level', 'warning', '--no-access-log'],
+            cwd=settings.BASE_DIR,
+        )
+        results = {}
+        try:
+            wait_for_port(port, server)
+            for name in names:
+                for mode, path in zip(('sync', 'async'), READ_ENDPOINTS[name]):
+                    path = path.format(first=first.id, second=second.id)
+                    # Warm up imports, plan caches and the connection
+                    run_server_http('127.0.0.1', port, [path], 5, 1, headers)
+                    for level in levels:
+                        self.stdout.write(f"Running {name} ({mode}, concurrency {level})...")
+                        results[f"{name}:{mode}:{level}"] = run_server_http(
+                            '127.0.0.1', port, [path], options['iterations'], level, headers)
+        finally:
+            server.terminate()
+            server.wait(timeout=10)
+            drop_read_fixtures(prefix)
+
+        self.stdout.write(f"{'endpoint':<20}{'mode':<7}{'conc':>6}{'requests':>10}{'errors':>8}"
+                          f"{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for key, row in results.items():
+            name, mode, level = key.split(':')
+            self.stdout.write(
+                f"{name:<20}{mode:<7}{level:>6}{row['requests']:>10}{row['errors']:>8}{row['throughput']:>10}"
+                f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}"
+            )
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, indent=2, sort_keys=True))
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
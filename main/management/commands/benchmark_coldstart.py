@@ -0,0 +1,86 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main.benchmarks import percentile
+
+ENTRY_POINTS = ('wsgi', 'asgi')
+CHILD = "import json, sys; from main import startup; print(json.dumps(startup.measure(sys.argv[1], sys.argv[2])))"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure worker cold start: start fresh interpreters that import the WSGI/ASGI "
+        "entry point and serve one request in-process, then report p50/p95 import, "
+        "first-response and process times and the packages that dominate import time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('entry_points', nargs='*', help="wsgi and/or asgi (default: both)")
+        parser.add_argument('--runs', type=int, default=10, help="Fresh processes per entry point")
+        parser.add_argument('--path', default='/api/catalog/', help="URL of the first request")
+        parser.add_argument('--top', type=int, default=10, help="Packages to list by import time")
+        parser.add_argument('--output', metavar='PATH', help="Also write the results as JSON")
+
+    def handle(self, *args, **options):
+        entry_points = options['entry_points'] or list(ENTRY_POINTS)
+        unknown = [name for name in entry_points if name not in ENTRY_POINTS]
+        if unknown:
+            raise CommandError(f"Unknown entry point(s): {', '.join(unknown)}")
+
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'backend.settings')}
+        env.pop('STARTUP_PROFILE', None)
+        results = {}
+        for entry in entry_points:
+            self.stdout.write(f"Starting {options['runs']} {entry} workers...")
+            runs = []
+            for _ in range(options['runs']):
+                started = time.perf_counter()
+                child = subprocess.run([sys.executable, '-c', CHILD, entry, options['path']],
+                                       cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+                elapsed = time.perf_counter() - started
+                if child.returncode:
+                    raise CommandError(f"{entry} worker failed:\n{child.stderr}")
+                run = json.loads(child.stdout.strip().splitlines()[-1])
+                run['process_s'] = elapsed
+                runs.append(run)
+            results[entry] = self.summarize(runs, options['top'])
+
+        self.stdout.write(f"{'entry':<7}{'status':>8}{'import p50':>12}{'p95':>8}{'first p50':>11}{'p95':>8}"
+                          f"{'ready p50':>11}{'p95':>8}{'process p50':>13}{'p95':>8}{'modules':>9}")
+        for entry, row in results.items():
+            self.stdout.write(
+                f"{entry:<7}{row['status']:>8}{row['import_p50_ms']:>12}{row['import_p95_ms']:>8}"
+                f"{row['first_request_p50_ms']:>11}{row['first_request_p95_ms']:>8}"
+                f"{row['ready_p50_ms']:>11}{row['ready_p95_ms']:>8}"
+                f"{row['process_p50_ms']:>13}{row['process_p95_ms']:>8}{row['modules']:>9}"
+            )
+        for entry, row in results.items():
+            self.stdout.write(f"\n{entry}: mean self import time by package (ms)")
+            for package, ms in row['packages_ms'].items():
+                self.stdout.write(f"  {package:<30}{ms:>8}")
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, indent=2, sort_keys=True))
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def summarize(self, runs, top):
+        row = {'runs': len(runs), 'status': ','.join(sorted({str(run['status']) for run in runs}))}
+        for key in ('import', 'first_request', 'ready', 'process'):
+            ordered = sorted(run[f"{key}_s"] for run in runs)
+            row[f"{key}_p50_ms"] = round(percentile(ordered, 50) * 1000, 1)
+            row[f"{key}_p95_ms"] = round(percentile(ordered, 95) * 1000, 1)
+        packages = {}
+        for run in runs:
+            for package, seconds in run['report'].get('packages_s', {}).items():
+                packages[package] = packages.get(package, 0.0) + seconds
+        ranked = sorted(packages.items(), key=lambda item: -item[1])[:top]
+        row['packages_ms'] = {package: round(seconds / len(runs) * 1000, 1) for package, seconds in ranked}
+        row['modules'] = max(run['report'].get('imported_modules', 0) for run in runs)
+        return row
@@ -0,0 +1,66 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, teardown_databases
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from main import fastpath
+from main.benchmarks import make_catalog
+from main.fastpath import compile_plan, render_json
+from main.models import Catalog
+from main.serializers import CatalogSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Microbenchmark CatalogSerializer against the values() fast path on a throw-away "
+        "database and check that both produce byte-identical JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_URL:
+            raise CommandError("Set DATABASE_URL to a local database before benchmarking.")
+
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            make_catalog(options['rows'], "serial")
+            queryset = Catalog.objects.all()
+            renderer = JSONRenderer()
+            columns, build = compile_plan(CatalogSerializer())
+            tz = timezone.get_current_timezone()
+
+            def serializer_path():
+                return renderer.render(CatalogSerializer(queryset.all(), many=True).data)
+
+            def fast_path():
+                return render_json([build(row, tz) for row in queryset.all().values(*columns)], renderer)
+
+            results = {}
+            for name, func in (("ModelSerializer", serializer_path), ("values() fast path", fast_path)):
+                best = None
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    output = func()
+                    elapsed = time.perf_counter() - started
+                    best = elapsed if best is None else min(best, elapsed)
+                results[name] = (best, output)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+        rows = options['rows']
+        if fastpath.orjson is None:
+            self.stdout.write("Fast path encoder: DRF JSONRenderer (orjson is not installed)")
+        else:
+            self.stdout.write(f"Fast path encoder: orjson {fastpath.orjson.__version__}")
+        for name, (elapsed, output) in results.items():
+            self.stdout.write(f"{name:<20}{rows / elapsed:>12,.0f} rows/s  ({elapsed * 1000:.1f} ms, {len(output):,} bytes)")
+        (slow, slow_output), (fast, fast_output) = results.values()
+        if slow_output != fast_output:
+            raise CommandError("Outputs differ between the serializer and fast paths")
+        self.stdout.write(self.style.SUCCESS(f"Identical output, {slow / fast:.1f}x faster"))
@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main import labelsheets
+from main.models import Catalog, User
+
+
+class Command(BaseCommand):
+    help = "Write a PDF of spine labels (catalog) or library cards (users) for selected records"
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=['spine', 'card'])
+        parser.add_argument('output', help="PDF file to write")
+        parser.add_argument('--ids', default='', help="Comma-separated primary keys")
+        parser.add_argument('--since', help="Records created (users: joined) since this ISO date or datetime")
+        parser.add_argument('--per-copy', action='store_true', help="Spine labels: one per copy (quantity)")
+        parser.add_argument('--dpi', type=int, default=300)
+        parser.add_argument('--workers', type=int, default=settings.RENDER_WORKERS)
+
+    def handle(self, *args, **options):
+        ids = [i for i in options['ids'].split(',') if i]
+        try:
+            if options['kind'] == 'spine':
+                queryset = labelsheets.select(Catalog.objects.order_by('dewey_decimal', 'title'), ids, options['since'])
+                labels = list(labelsheets.catalog_labels(queryset, per_copy=options['per_copy']))
+            else:
+                queryset = labelsheets.select(User.objects.order_by('last_name', 'first_name'), ids, options['since'],
+                                              date_field='date_joined')
+                labels = list(labelsheets.patron_cards(queryset))
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        started = time.perf_counter()
+        with open(options['output'], 'wb') as fileobj:
+            for chunk in labelsheets.stream_sheets(options['kind'], labels, options['dpi'], options['workers']):
+                fileobj.write(chunk)
+        pages = -(-len(labels) // labelsheets.LAYOUTS[options['kind']].per_page)
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(labels)} labels on {pages} pages written to {options['output']} "
+            f"in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,52 @@
+import csv
+
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand, CommandError
+
+from main.models import User
+from main.provisioning import provision_patrons, read_roster_csv
+
+
+class Command(BaseCommand):
+    help = "Create patron accounts in bulk from a roster CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument('roster', help="CSV file with email, username, password, student_id, ... columns")
+        parser.add_argument('--group', action='append', default=[], help="Add every new user to this group (repeatable)")
+        parser.add_argument('--faculty')
+        parser.add_argument('--department')
+        parser.add_argument('--user-category', choices=[c[0] for c in User._meta.get_field('user_category').choices])
+        parser.add_argument('--staff-category', choices=[c[0] for c in User._meta.get_field('staff_category').choices])
+        parser.add_argument('--role')
+        parser.add_argument('--workers', type=int, default=settings.PROVISIONING_WORKERS,
+                            help="Password hashing processes")
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--output', metavar='PATH', help="Write the created users and their barcodes to this CSV")
+
+    def handle(self, *args, **options):
+        groups = list(Group.objects.filter(name__in=options['group']))
+        missing = set(options['group']) - {group.name for group in groups}
+        if missing:
+            raise CommandError(f"Unknown group(s): {', '.join(sorted(missing))}")
+        defaults = {field: options[field] for field in ('faculty', 'department', 'user_category', 'staff_category', 'role')
+                    if options[field]}
+
+        with open(options['roster'], newline='', encoding='utf-8-sig') as fileobj:
+            result = provision_patrons(
+                read_roster_csv(fileobj),
+                defaults=defaults,
+                groups=groups,
+                workers=options['workers'],
+                chunk_size=options['chunk_size'],
+            )
+
+        if options['output']:
+            with open(options['output'], 'w', newline='') as fileobj:
+                writer = csv.DictWriter(fileobj, fieldnames=['line', 'id', 'username', 'email', 'barcode'])
+                writer.writeheader()
+                writer.writerows(result['users'])
+
+        for error in result['errors']:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(f"{result['created']} users created, {len(result['errors'])} errors"))
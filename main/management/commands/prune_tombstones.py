@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from main import changefeed
+
+
+class Command(BaseCommand):
+    help = "Delete delta sync tombstones older than DELTA_SYNC_TOMBSTONE_DAYS"
+
+    def handle(self, *args, **options):
+        removed = changefeed.prune_tombstones()
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} tombstones"))
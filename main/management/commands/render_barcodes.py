@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main.barcodeimages import RENDERERS, render_batch
+from main.models import Catalog, User
+
+
+class Command(BaseCommand):
+    help = "Pre-render barcode images for catalog records and/or patrons into the media cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--catalog', action='store_true', help="Render Catalog.barcode values")
+        parser.add_argument('--users', action='store_true', help="Render User.barcode values")
+        parser.add_argument('--format', default='png', choices=sorted(RENDERERS))
+        parser.add_argument('--scale', type=int)
+        parser.add_argument('--height', type=int)
+        parser.add_argument('--no-text', action='store_true', help="Bars only, without the human-readable value")
+        parser.add_argument('--workers', type=int, default=settings.RENDER_WORKERS)
+
+    def handle(self, *args, **options):
+        if not (options['catalog'] or options['users']):
+            raise CommandError("Choose --catalog and/or --users")
+        values = []
+        if options['catalog']:
+            values += Catalog.objects.exclude(barcode=None).exclude(barcode='').values_list('barcode', flat=True)
+        if options['users']:
+            values += User.objects.exclude(barcode=None).exclude(barcode='').values_list('barcode', flat=True)
+
+        started = time.perf_counter()
+        result = render_batch(
+            values, options['format'], workers=options['workers'],
+            scale=options['scale'], height=options['height'], text=False if options['no_text'] else None,
+        )
+        elapsed = time.perf_counter() - started
+
+        for error in result['errors']:
+            self.stderr.write(f"{error['value']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['rendered']} rendered, {result['cached']} already cached, "
+            f"{len(result['errors'])} errors in {elapsed:.1f}s"
+        ))
@@ -0,0 +1,58 @@
+import multiprocessing
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+
+def _stop_on_signals():
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *args: stop.set())
+    return stop
+
+
+def _worker_process(poll_interval, burst):
+    # Spawned processes import this module before Django is set up
+    import django
+    django.setup()
+    from main import jobs
+
+    jobs.run_worker(_stop_on_signals(), poll_interval=poll_interval, burst=burst)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run background job workers. Each process claims and runs one job at a time; "
+        "SIGTERM lets running jobs finish before exiting."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help="Worker processes to start")
+        parser.add_argument('--poll', type=float, help="Seconds between polls of an empty queue")
+        parser.add_argument('--burst', action='store_true', help="Exit once the queue is empty")
+
+    def handle(self, *args, **options):
+        from main import jobs
+
+        if options['processes'] <= 1:
+            done = jobs.run_worker(_stop_on_signals(), poll_interval=options['poll'], burst=options['burst'])
+            self.stdout.write(self.style.SUCCESS(f"Worker stopped after {done} jobs"))
+            return
+
+        context = multiprocessing.get_context('spawn')
+        workers = [context.Process(target=_worker_process, args=(options['poll'], options['burst']))
+                   for _ in range(options['processes'])]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f"Started {len(workers)} workers")
+
+        def forward(signum, frame):
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()  # SIGTERM: each finishes its current job
+        signal.signal(signal.SIGINT, forward)
+        signal.signal(signal.SIGTERM, forward)
+        for worker in workers:
+            worker.join()
+        self.stdout.write(self.style.SUCCESS("Workers stopped"))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from main import notices
+
+
+class Command(BaseCommand):
+    help = (
+        "Email borrowers one digest of their loans that are due soon or overdue. "
+        "Loans already notified for their due date are skipped, so this is safe to rerun (e.g. daily from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Count the emails without sending or recording them")
+        parser.add_argument('--limit', type=int, help="Send at most this many emails")
+        parser.add_argument('--rate', type=float, help="Emails per second (default: LOAN_NOTICE_RATE)")
+
+    def handle(self, *args, **options):
+        result = notices.send_notices(dry_run=options['dry_run'], limit=options['limit'], rate=options['rate'])
+        verb = "Would send" if options['dry_run'] else "Sent"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {result['sent']} emails covering {result['loans']} loans"))
+        if result['failed']:
+            self.stdout.write(self.style.WARNING(f"{result['failed']} emails failed; they will be retried on the next run"))
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_attendance_sign_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='circulation',
+            name='priority',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Hold priority (higher is served first)'),
+        ),
+        migrations.AddField(
+            model_name='circulation',
+            name='reserved_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='circulation',
+            name='status',
+            field=models.CharField(choices=[('borrowed', 'Borrowed'), ('returned', 'Returned'), ('overdue', 'Overdue'), ('reserve', 'Reserve'), ('ready', 'Ready for pickup')], default='borrowed', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='circulation',
+            index=models.Index(fields=['book', 'status', '-priority', 'reserved_at'], name='circulation_hold_queue_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:43
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def merge_duplicate_duties(apps, schema_editor):
+    # Existing double bookings would make the unique constraint fail: keep the first row
+    # for each user, date and shift, with the notes of all of them
+    Duty = apps.get_model('main', 'Duty')
+    duplicates = (Duty.objects.values('user_id', 'date', 'shift')
+                  .annotate(rows=Count('id')).filter(rows__gt=1))
+    for booking in duplicates:
+        keep, *extra = Duty.objects.filter(user_id=booking['user_id'], date=booking['date'],
+                                           shift=booking['shift']).order_by('id')
+        notes = '\n'.join(dict.fromkeys(duty.notes for duty in [keep, *extra] if duty.notes))
+        if notes != (keep.notes or ''):
+            keep.notes = notes
+            keep.save(update_fields=['notes'])
+        Duty.objects.filter(pk__in=[duty.pk for duty in extra]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_circulation_hold_queue'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_duties, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='duty',
+            index=models.Index(fields=['date', 'shift'], name='duty_date_shift_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='duty',
+            constraint=models.UniqueConstraint(fields=('user', 'date', 'shift'), name='unique_duty_per_shift'),
+        ),
+    ]
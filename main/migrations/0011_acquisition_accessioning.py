@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:44
+
+from collections import defaultdict
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_spend(apps, schema_editor):
+    # Totals for acquisitions recorded before running totals existed, so later edits
+    # and deletions have something to subtract from
+    Acquisition = apps.get_model('main', 'Acquisition')
+    AcquisitionSpend = apps.get_model('main', 'AcquisitionSpend')
+    totals = defaultdict(lambda: [Decimal('0'), 0])
+    for row in Acquisition.objects.values('supplier', 'source').annotate(amount=Sum('amount'), items=Sum('quantity')):
+        entry = totals[(row['supplier'] or '', row['source'])]
+        entry[0] += row['amount'] or 0
+        entry[1] += row['items'] or 0
+    AcquisitionSpend.objects.bulk_create([
+        AcquisitionSpend(supplier=supplier, source=source, total_amount=amount, item_count=items)
+        for (supplier, source), (amount, items) in totals.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_duty_conflict_constraints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BarcodeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_value', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='acquisition',
+            name='catalog',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='acquisitions', to='main.catalog'),
+        ),
+        migrations.AddField(
+            model_name='acquisition',
+            name='quantity',
+            field=models.PositiveIntegerField(default=1, help_text='Number of copies received'),
+        ),
+        migrations.CreateModel(
+            name='AcquisitionSpend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('supplier', models.CharField(blank=True, default='', max_length=100)),
+                ('source', models.CharField(choices=[('purchase', 'Purchase'), ('donation', 'Donation'), ('exchange', 'Exchange')], max_length=20)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('supplier', 'source'), name='unique_spend_supplier_source')],
+            },
+        ),
+        migrations.RunPython(backfill_spend, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_acquisition_accessioning'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='catalog',
+            name='isbn13',
+            field=models.CharField(blank=True, editable=False, max_length=13, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='catalog',
+            name='issn_normalized',
+            field=models.CharField(blank=True, editable=False, max_length=8, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:33
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_job_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoanNotice',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('due_soon', 'Due soon'), ('overdue', 'Overdue')], max_length=20)),
+                ('due_date', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent')], default='pending', max_length=20)),
+                ('batch', models.UUIDField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='circulation',
+            index=models.Index(fields=['status', 'return_date'], name='circulation_due_idx'),
+        ),
+        migrations.AddField(
+            model_name='loannotice',
+            name='circulation',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notices', to='main.circulation'),
+        ),
+        migrations.AddIndex(
+            model_name='loannotice',
+            index=models.Index(fields=['batch'], name='loan_notice_batch_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='loannotice',
+            constraint=models.UniqueConstraint(fields=('circulation', 'kind', 'due_date'), name='unique_loan_notice'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:39
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_delta_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendance',
+            name='client_key',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='attendance',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['user', 'created_at'], name='attendance_user_time_idx'),
+        ),
+    ]
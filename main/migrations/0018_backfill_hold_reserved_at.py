@@ -0,0 +1,28 @@
+from datetime import datetime, time, timezone as dt_timezone
+
+from django.db import migrations
+from django.utils import timezone
+
+
+def backfill_reserved_at(apps, schema_editor):
+    # Holds placed before the queue existed join it by the day they were recorded (undated ones
+    # last), so no waiting hold has a NULL reservation time for queue_position() to compare
+    Circulation = apps.get_model('main', 'Circulation')
+    undated = timezone.now()
+    for hold in Circulation.objects.filter(status__in=['reserve', 'ready'], reserved_at=None).order_by('borrow_date', 'id'):
+        if hold.borrow_date:
+            hold.reserved_at = timezone.make_aware(datetime.combine(hold.borrow_date, time.min), dt_timezone.utc)
+        else:
+            hold.reserved_at = undated
+        hold.save(update_fields=['reserved_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_reserved_at, migrations.RunPython.noop),
+    ]
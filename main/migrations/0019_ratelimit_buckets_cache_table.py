@@ -0,0 +1,25 @@
+from django.core.management import call_command
+from django.db import migrations, models
+
+
+def create_cache_tables(apps, schema_editor):
+    # The tables of DatabaseCache backends in CACHES (the "shared" cache without CACHE_URL)
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0018_backfill_hold_reserved_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                ('key', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('tat', models.BigIntegerField()),
+            ],
+        ),
+        migrations.RunPython(create_cache_tables, migrations.RunPython.noop),
+    ]
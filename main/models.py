@@ -1,9 +1,13 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from uuid import uuid4
 from django.conf import settings
 
+from .identifiers import normalize_isbn, normalize_issn
+
 class UserManager(BaseUserManager):
     def create_user(self, email, username, password=None, **extra_fields):
         if not email:
@@ -47,13 +51,26 @@ class User(AbstractUser):
         ('none', 'None')
     ], blank=True, null=True)  # Student Category (Undergraduate, Postgraduate, etc.)
     role = models.CharField(max_length=50, blank=True, null=True, help_text="User role (admin, staff, student, etc.)")
+    updated_at = models.DateTimeField(auto_now=True)  # delta sync cursor (see main.changefeed)
     USERNAME_FIELD = 'username'
     REQUIRED_FIELDS = ['email', 'first_name', 'last_name', 'phone', 'student_id', 'faculty', 'department', 'user_category', 'staff_category', 'is_active', 'is_staff', 'is_superuser', 'barcode']  
 
     objects = UserManager()
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='user_sync_idx'),
+        ]
+
     def __str__(self):
         return self.username
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        # A login only touches last_login, which sync clients never see
+        if update_fields is not None and set(update_fields) - {'last_login'}:
+            kwargs['update_fields'] = set(update_fields) | {'updated_at'}
+        super().save(*args, **kwargs)
  
 
 class Attendance(models.Model):
@@ -76,12 +93,19 @@ class Attendance(models.Model):
         default="signout"   # your default
     )
 
-    created_at = models.DateTimeField(auto_now_add=True)
+    # When the scan happened; kiosk batches upload it after the fact (see main.kiosk)
+    created_at = models.DateTimeField(default=timezone.now)
+    # Idempotency key generated by the kiosk, so a replayed upload records each scan once
+    client_key = models.CharField(max_length=64, unique=True, blank=True, null=True)
 
     class Meta:
         permissions = [
             ("can_manage_attendance", "Can manage all attendance records"),
         ]
+        indexes = [
+            # Recent-scan checks: a user's scans around a time
+            models.Index(fields=['user', 'created_at'], name='attendance_user_time_idx'),
+        ]
         ordering = ['-created_at']
         verbose_name = "Attendance"
         verbose_name_plural = "Attendance"
@@ -100,6 +124,9 @@ class Catalog(models.Model):
     ai_suggestion = models.TextField(blank=True, null=True)
     isbn = models.CharField(max_length=30, blank=True, null=True)
     issn = models.CharField(max_length=30, blank=True, null=True)
+    # Canonical identifiers derived from isbn/issn on save (see main.identifiers)
+    isbn13 = models.CharField(max_length=13, unique=True, blank=True, null=True, editable=False)
+    issn_normalized = models.CharField(max_length=8, unique=True, blank=True, null=True, editable=False)
     lccn = models.CharField(max_length=30, blank=True, null=True)  # Library of Congress Control Number
     dewey_decimal = models.CharField(max_length=30, blank=True, null=True)
     subject = models.CharField(max_length=255, blank=True, null=True)
@@ -119,10 +146,43 @@ class Catalog(models.Model):
         permissions = [
             ("can_manage_catalog", "Can manage all catalog records"),
         ]
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='catalog_sync_idx'),
+        ]
 
     def __str__(self):
         return f"Catalog record for {self.title or self.subject or str(self.id)}"
 
+    # Raw identifier -> canonical column derived from it on save
+    IDENTIFIERS = (('isbn', 'isbn13', normalize_isbn), ('issn', 'issn_normalized', normalize_issn))
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_identifiers = {field: instance.__dict__[field] for field, _, _ in cls.IDENTIFIERS
+                                        if field in instance.__dict__}
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Canonical values are derived only when the raw value is new or changed, so saving a
+        # record the backfill left without one (a duplicate) does not collide with its twin
+        loaded = getattr(self, '_loaded_identifiers', {})
+        for field, target, normalize in self.IDENTIFIERS:
+            if field in self.__dict__ and (field not in loaded or loaded[field] != getattr(self, field)):
+                setattr(self, target, normalize(getattr(self, field)))
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if 'isbn' in update_fields:
+                update_fields.add('isbn13')
+            if 'issn' in update_fields:
+                update_fields.add('issn_normalized')
+            update_fields.add('updated_at')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+        self._loaded_identifiers = {field: self.__dict__[field] for field, _, _ in self.IDENTIFIERS
+                                    if field in self.__dict__}
+
 
 class Circulation(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
@@ -131,6 +191,7 @@ class Circulation(models.Model):
         ('returned', 'Returned'),
         ('overdue', 'Overdue'),
         ('reserve', 'Reserve'),
+        ('ready', 'Ready for pickup'),
     ]
 
     book = models.ForeignKey(Catalog, on_delete=models.CASCADE, related_name='circulations')
@@ -140,11 +201,19 @@ class Circulation(models.Model):
     actual_return = models.DateField(blank=True, null=True)
     fine = models.DecimalField(max_digits=8, decimal_places=2, default=0.00)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='borrowed')
+    # Hold queue: higher priority is served first, then oldest reservation
+    reserved_at = models.DateTimeField(blank=True, null=True)
+    priority = models.PositiveSmallIntegerField(default=0, help_text="Hold priority (higher is served first)")
 
     class Meta:
         permissions = [
             ("can_manage_circulation", "Can manage all circulation records"),
         ]
+        indexes = [
+            models.Index(fields=['book', 'status', '-priority', 'reserved_at'], name='circulation_hold_queue_idx'),
+            # Loan notices: open loans by due date
+            models.Index(fields=['status', 'return_date'], name='circulation_due_idx'),
+        ]
 
 
     def __str__(self):
@@ -163,6 +232,8 @@ class Acquisition(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
     date_acquired = models.DateField()
     added_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='acquisitions')
+    catalog = models.ForeignKey(Catalog, on_delete=models.SET_NULL, null=True, blank=True, related_name='acquisitions')
+    quantity = models.PositiveIntegerField(default=1, help_text="Number of copies received")
 
     class Meta:
         permissions = [
@@ -172,6 +243,32 @@ class Acquisition(models.Model):
     def __str__(self):
         return f"{self.title} ({self.source})"
 
+
+class AcquisitionSpend(models.Model):
+    """Running spend totals per supplier and source, updated as acquisitions are recorded."""
+    supplier = models.CharField(max_length=100, blank=True, default='')
+    source = models.CharField(max_length=20, choices=Acquisition.SOURCE_CHOICES)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['supplier', 'source'], name='unique_spend_supplier_source'),
+        ]
+
+    def __str__(self):
+        return f"{self.supplier or 'Unknown'} / {self.source}: {self.total_amount}"
+
+
+class BarcodeSequence(models.Model):
+    """Counter used to hand out blocks of barcodes in a single locked update."""
+    name = models.CharField(max_length=50, unique=True)
+    last_value = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} ({self.last_value})"
+
 class Duty(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='duties')
@@ -183,6 +280,13 @@ class Duty(models.Model):
         permissions = [
             ("can_manage_duty", "Can manage all duty records"),
         ]
+        constraints = [
+            # Index-backed double-booking guard
+            models.UniqueConstraint(fields=['user', 'date', 'shift'], name='unique_duty_per_shift'),
+        ]
+        indexes = [
+            models.Index(fields=['date', 'shift'], name='duty_date_shift_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.date} ({self.shift})"
@@ -204,3 +308,134 @@ class Message(models.Model):
         return f"Message from {self.sender.username} to {self.receiver.username} at {self.sent_at}"
 
 
+
+class Job(models.Model):
+    """A unit of background work run by ``manage.py run_jobs`` (see main.jobs)."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+        (CANCELLED, 'Cancelled'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    task = models.CharField(max_length=255)  # dotted path of a function decorated with main.jobs.task
+    args = models.JSONField(default=list, encoder=DjangoJSONEncoder)
+    kwargs = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    priority = models.SmallIntegerField(default=0, help_text="Higher runs first")
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    result = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder)
+    error = models.TextField(blank=True, null=True)
+    worker = models.CharField(max_length=100, blank=True, null=True)
+    locked_until = models.DateTimeField(blank=True, null=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, blank=True, null=True,
+                                   related_name='jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # The worker's claim query: next queued job by priority, then due time
+            models.Index(fields=['status', '-priority', 'run_at'], name='job_claim_idx'),
+            models.Index(fields=['status', 'locked_until'], name='job_lease_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.task} ({self.status})"
+
+
+class LoanNotice(models.Model):
+    """
+    A due-soon or overdue email about one loan (see main.notices). One row
+    per loan, kind and due date, so a renewed loan can be notified again.
+    """
+    DUE_SOON = 'due_soon'
+    OVERDUE = 'overdue'
+    KIND_CHOICES = [
+        (DUE_SOON, 'Due soon'),
+        (OVERDUE, 'Overdue'),
+    ]
+    PENDING = 'pending'
+    SENT = 'sent'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    circulation = models.ForeignKey(Circulation, on_delete=models.CASCADE, related_name='notices')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    due_date = models.DateField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    batch = models.UUIDField()  # the digest email this notice went out in
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['circulation', 'kind', 'due_date'], name='unique_loan_notice'),
+        ]
+        indexes = [
+            models.Index(fields=['batch'], name='loan_notice_batch_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} notice for {self.circulation_id} ({self.status})"
+
+
+class Tombstone(models.Model):
+    """A deleted row, reported to delta sync clients until pruned (see main.changefeed)."""
+    model = models.CharField(max_length=100)  # app_label.model_name
+    object_id = models.CharField(max_length=64)
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'deleted_at', 'id'], name='tombstone_sync_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} {self.object_id} deleted at {self.deleted_at}"
+
+
+class RateLimitBucket(models.Model):
+    """A rate-limit bucket kept in the database when there is no Redis cache (see main.ratelimit)."""
+    key = models.CharField(max_length=255, primary_key=True)
+    tat = models.BigIntegerField()  # GCRA theoretical arrival time, microseconds since the epoch
+
+    def __str__(self):
+        return self.key
+
+
+class IdempotencyKey(models.Model):
+    """A client's ``Idempotency-Key`` and the response its request got (see main.idempotency)."""
+    owner = models.CharField(max_length=64)  # "user:<id>" or "anonymous"
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)  # hash of method, path and body
+    status_code = models.PositiveSmallIntegerField(blank=True, null=True)  # None while the first request runs
+    content_type = models.CharField(max_length=255, blank=True, default='')
+    body = models.BinaryField(blank=True, null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'key'], name='unique_idempotency_key'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.owner} {self.key} ({self.status_code or 'in progress'})"
@@ -0,0 +1,160 @@
+# notices.py
+"""
+Due-soon and overdue loan emails.
+
+``pending_loans`` finds every open loan that is due within
+``LOAN_DUE_SOON_DAYS`` or past due, and has no notice yet for its kind and
+due date, in one query. ``send_notices`` groups those loans by borrower and
+sends each borrower one digest over a single SMTP connection, paced to
+``LOAN_NOTICE_RATE`` messages a second.
+
+Each loan in a digest is claimed with a ``LoanNotice`` row before the email
+goes out. The unique (loan, kind, due date) constraint means a rerun, or a
+second run at the same time, never emails about the same loan twice. If the
+SMTP server refuses a message, its claims are dropped and the next run tries
+again. A run that dies mid-send leaves its claims ``pending``; those loans
+are not emailed again.
+"""
+import logging
+import smtplib
+import time
+from datetime import timedelta
+from itertools import groupby
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Case, Exists, OuterRef, Q, Value, When
+from django.utils import timezone
+
+from main import jobs
+from main.models import Circulation, LoanNotice
+
+logger = logging.getLogger(__name__)
+
+
+def pending_loans(today=None):
+    """Open loans due for a notice, ordered by borrower, with ``notice_kind`` annotated."""
+    today = today or timezone.localdate()
+    already = LoanNotice.objects.filter(circulation=OuterRef('pk'), kind=OuterRef('notice_kind'),
+                                        due_date=OuterRef('return_date'))
+    return (
+        Circulation.objects
+        .filter(status__in=['borrowed', 'overdue'], actual_return__isnull=True,
+                return_date__lte=today + timedelta(days=settings.LOAN_DUE_SOON_DAYS),
+                borrower__is_active=True)
+        .exclude(Q(borrower__email__isnull=True) | Q(borrower__email=''))
+        .annotate(notice_kind=Case(When(return_date__lt=today, then=Value(LoanNotice.OVERDUE)),
+                                   default=Value(LoanNotice.DUE_SOON)))
+        .filter(~Exists(already))
+        .select_related('book', 'borrower')
+        .only('book__title', 'book__author', 'book__barcode', 'borrower__email', 'borrower__first_name',
+              'borrower__username', 'return_date', 'fine')
+        .order_by('borrower_id', 'return_date')
+    )
+
+
+def compose(borrower, loans, today=None):
+    """The digest email for one borrower's loans."""
+    today = today or timezone.localdate()
+    overdue = [loan for loan in loans if loan.notice_kind == LoanNotice.OVERDUE]
+    due_soon = [loan for loan in loans if loan.notice_kind == LoanNotice.DUE_SOON]
+    lines = [f"Dear {borrower.first_name or borrower.username},", ""]
+    if overdue:
+        lines.append("These items are overdue. Please return them as soon as possible:")
+        for loan in overdue:
+            days = (today - loan.return_date).days
+            line = f"  - {loan.book.title} ({loan.book.author}), due {loan.return_date:%d %b %Y}, {days} day{'s' * (days != 1)} late"
+            if loan.fine:
+                line += f", fine {loan.fine}"
+            lines.append(line)
+        lines.append("")
+    if due_soon:
+        lines.append("These items are due soon:")
+        lines.extend(f"  - {loan.book.title} ({loan.book.author}), due {loan.return_date:%d %b %Y}" for loan in due_soon)
+        lines.append("")
+    lines.append("Thank you.")
+    subject = f"{len(overdue)} overdue library item{'s' * (len(overdue) != 1)}" if overdue else \
+        f"{len(due_soon)} library item{'s' * (len(due_soon) != 1)} due soon"
+    return EmailMessage(subject, '\n'.join(lines), settings.DEFAULT_FROM_EMAIL, [borrower.email])
+
+
+class _Pacer:
+    """Spaces calls at least ``1 / rate`` seconds apart (no limit when ``rate`` is 0)."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next = 0.0
+
+    def wait(self):
+        now = time.monotonic()
+        if now < self.next:
+            time.sleep(self.next - now)
+            now = self.next
+        self.next = now + self.interval
+
+
+def _claim(loans, batch):
+    """Insert pending notices for ``loans``; returns the loans this batch got (others were claimed elsewhere)."""
+    LoanNotice.objects.bulk_create([
+        LoanNotice(circulation_id=loan.pk, kind=loan.notice_kind, due_date=loan.return_date, batch=batch)
+        for loan in loans
+    ], ignore_conflicts=True)
+    claimed = set(LoanNotice.objects.filter(batch=batch).values_list('circulation_id', flat=True))
+    return [loan for loan in loans if loan.pk in claimed]
+
+
+def send_notices(today=None, dry_run=False, limit=None, rate=None, connection=None):
+    """
+    Email each borrower with loans due soon or overdue one digest. Returns
+    counts of ``sent`` emails, the ``loans`` they cover, and ``failed`` emails
+    (to be retried by the next run). With ``dry_run``, nothing is sent or
+    recorded.
+    """
+    today = today or timezone.localdate()
+    rate = settings.LOAN_NOTICE_RATE if rate is None else rate
+    result = {'sent': 0, 'loans': 0, 'failed': 0}
+    borrowers = groupby(pending_loans(today).iterator(chunk_size=2000), key=lambda loan: loan.borrower_id)
+    if dry_run:
+        for _, loans in borrowers:
+            if limit is not None and result['sent'] >= limit:
+                break
+            result['sent'] += 1
+            result['loans'] += len(list(loans))
+        return result
+
+    connection = connection or get_connection()
+    pacer = _Pacer(rate)
+    connection.open()
+    try:
+        for _, loans in borrowers:
+            if limit is not None and result['sent'] + result['failed'] >= limit:
+                break
+            batch = uuid4()
+            loans = _claim(list(loans), batch)
+            if not loans:
+                continue
+            pacer.wait()
+            try:
+                connection.send_messages([compose(loans[0].borrower, loans, today)])
+            except OSError as exc:  # smtplib.SMTPException included
+                LoanNotice.objects.filter(batch=batch).delete()
+                result['failed'] += 1
+                logger.warning("Loan notice to %s failed: %s", loans[0].borrower.email, exc)
+                if isinstance(exc, smtplib.SMTPServerDisconnected) or not isinstance(exc, smtplib.SMTPException):
+                    # The connection is gone, not just this message refused: reconnect for the rest
+                    connection.close()
+                    connection.open()
+                continue
+            LoanNotice.objects.filter(batch=batch).update(status=LoanNotice.SENT, sent_at=timezone.now())
+            result['sent'] += 1
+            result['loans'] += len(loans)
+    finally:
+        connection.close()
+    return result
+
+
+@jobs.task(max_attempts=1)
+def send_notices_job():
+    """Background variant of ``send_notices``, e.g. enqueued daily by a scheduler."""
+    return send_notices()
@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
 from rest_framework import permissions
 
 
@@ -89,3 +91,16 @@ class MessagePermission(permissions.BasePermission):
             return obj.sender == request.user or obj.receiver == request.user
         return False
 
+
+
+class MetricsPermission(permissions.BasePermission):
+    """
+    - Admins can read metrics.
+    - A scraper can read them with the configured PERF_METRICS_TOKEN.
+    """
+    def has_permission(self, request, view):
+        if request.user and request.user.is_staff:
+            return True
+        token = getattr(settings, 'PERF_METRICS_TOKEN', None)
+        supplied = request.headers.get('X-Metrics-Token')
+        return bool(token and supplied and constant_time_compare(token, supplied))
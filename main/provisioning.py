@@ -0,0 +1,246 @@
+# provisioning.py
+"""
+Bulk patron provisioning from intake rosters.
+
+Rows are streamed and handled in chunks. Each chunk is checked against the
+database with one query per unique column, its passwords are hashed across
+a process pool (PBKDF2 is deliberately slow and CPU bound, so threads do not
+help), missing barcodes are allocated as one block, and the users are
+inserted with ``bulk_create`` in their own transaction. Bad rows are
+reported in ``errors`` and skipped; the rest of the batch still goes in.
+
+Rosters queued with ``provision_patrons_job`` go through ``seal_roster``
+first: passwords are stored in the job's arguments encrypted with a key
+derived from ``SECRET_KEY`` (``SECRET_KEY_FALLBACKS`` still decrypt), and
+are validated and hashed by the job worker, never in the web request.
+"""
+import base64
+import csv
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth import password_validation
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.utils.crypto import salted_hmac
+
+from main import jobs
+from main.barcodes import allocate_barcodes
+from main.models import User
+from main.utils import chunks
+
+FIELDS = ['email', 'username', 'first_name', 'last_name', 'phone', 'student_id', 'faculty',
+          'department', 'user_category', 'staff_category', 'role', 'barcode']
+UNIQUE_FIELDS = ['email', 'username', 'barcode']
+DEFAULT_FIELDS = ['faculty', 'department', 'user_category', 'staff_category', 'role']
+
+
+def read_roster_csv(fileobj):
+    """Stream roster rows from a CSV file with a header row."""
+    for row in csv.DictReader(fileobj):
+        yield {key.strip().lower(): (value or '').strip() for key, value in row.items() if key}
+
+
+def _hash_all(passwords):
+    # ``None`` gives an unusable password: the patron sets one through a password reset
+    return [make_password(password) for password in passwords]
+
+
+def hash_passwords(passwords, executor=None, workers=1):
+    """``make_password()`` for each password, split evenly across the executor's workers."""
+    if executor is None or workers < 2 or len(passwords) < 2:
+        return _hash_all(passwords)
+    size = -(-len(passwords) // workers)
+    hashed = []
+    for part in executor.map(_hash_all, [passwords[i:i + size] for i in range(0, len(passwords), size)]):
+        hashed.extend(part)
+    return hashed
+
+
+def password_pool(workers):
+    """A process pool for ``hash_passwords``, or None when hashing should stay in-process."""
+    if workers < 2:
+        return None
+    # Spawned, not forked: the caller may be a multi-threaded web worker
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup)
+
+
+def _text(value):
+    # JSON rosters may carry numbers, e.g. ``"student_id": 12345``
+    return '' if value is None else str(value).strip()
+
+
+def _roster_cipher():
+    # cryptography is installed with djoser (through social-auth-core)
+    from cryptography.fernet import Fernet, MultiFernet
+
+    return MultiFernet([
+        Fernet(base64.urlsafe_b64encode(salted_hmac('main.provisioning.roster', 'password', secret, algorithm='sha256').digest()))
+        for secret in [settings.SECRET_KEY, *settings.SECRET_KEY_FALLBACKS]
+    ])
+
+
+def _unseal(token):
+    from cryptography.fernet import InvalidToken
+
+    try:
+        return _roster_cipher().decrypt(token.encode()).decode()
+    except (InvalidToken, AttributeError):
+        raise ValueError("The password could not be decrypted; queue the roster again")
+
+
+def seal_roster(rows):
+    """
+    Roster rows for ``provision_patrons_job``: columns other than ``FIELDS``
+    are dropped and each password is replaced by its encrypted ``sealed_password``.
+    """
+    cipher = _roster_cipher()
+    sealed = []
+    for raw in rows:
+        row = {field: raw[field] for field in FIELDS if field in raw}
+        if raw.get('password') not in (None, ''):
+            row['sealed_password'] = cipher.encrypt(str(raw['password']).encode()).decode()
+        sealed.append(row)
+    return sealed
+
+
+def has_passwords(rows):
+    return any(row.get('password') not in (None, '') for row in rows)
+
+
+def _clean_row(raw, defaults, sealed=False):
+    row = {field: _text(raw.get(field)) or None for field in FIELDS}
+    for field in DEFAULT_FIELDS:
+        row[field] = row[field] or defaults.get(field)
+    if not row['email']:
+        raise ValueError("Email is required")
+    try:
+        validate_email(row['email'])
+    except ValidationError:
+        raise ValueError(f"Invalid email: {row['email']!r}")
+    row['email'] = User.objects.normalize_email(row['email'])
+    row['username'] = row['username'] or row['student_id'] or row['email']
+    for field in ('user_category', 'staff_category'):
+        if row[field] and row[field] not in dict(User._meta.get_field(field).choices):
+            raise ValueError(f"Unknown {field}: {row[field]!r}")
+
+    if sealed:
+        password = _unseal(raw['sealed_password']) if raw.get('sealed_password') is not None else None
+    else:
+        password = raw.get('password')
+        password = None if password in (None, '') else str(password)
+    if password:
+        try:
+            password_validation.validate_password(password, User(**row))
+        except ValidationError as exc:
+            raise ValueError(' '.join(exc.messages))
+    row['password'] = password
+    return row
+
+
+def _add_groups(users, groups):
+    Membership = User.groups.through
+    Membership.objects.bulk_create([Membership(user_id=user.pk, group_id=group.pk) for user in users for group in groups])
+
+
+def _provision_chunk(rows, groups, hasher, seen, result):
+    fresh = []
+    for number, row in rows:
+        duplicate = next((field for field in UNIQUE_FIELDS if row[field] and row[field] in seen[field]), None)
+        if duplicate:
+            result['errors'].append({'line': number, 'error': f"Duplicate {duplicate} in roster: {row[duplicate]!r}"})
+            continue
+        for field in UNIQUE_FIELDS:
+            if row[field]:
+                seen[field].add(row[field])
+        fresh.append((number, row))
+
+    taken = {}
+    for field in UNIQUE_FIELDS:
+        values = [row[field] for _, row in fresh if row[field]]
+        taken[field] = set(User.objects.filter(**{f"{field}__in": values}).values_list(field, flat=True)) if values else set()
+    rows = []
+    for number, row in fresh:
+        existing = next((field for field in UNIQUE_FIELDS if row[field] in taken[field]), None)
+        if existing:
+            result['errors'].append({'line': number, 'error': f"A user with this {existing} already exists: {row[existing]!r}"})
+        else:
+            rows.append((number, row))
+    if not rows:
+        return
+
+    hashed = hasher([row['password'] for _, row in rows])
+    missing = [row for _, row in rows if not row['barcode']]
+    for row, barcode in zip(missing, allocate_barcodes('patron', len(missing), prefix=settings.PATRON_BARCODE_PREFIX)):
+        row['barcode'] = barcode
+    users = [User(**{field: row[field] for field in FIELDS}, password=password)
+             for (_, row), password in zip(rows, hashed)]
+
+    try:
+        with transaction.atomic():
+            User.objects.bulk_create(users)
+            _add_groups(users, groups)
+        created = list(zip(rows, users))
+    except IntegrityError:
+        # Someone else took an email, username or barcode since the check: find the rows one by one
+        created = []
+        for (number, row), user in zip(rows, users):
+            user.pk = None
+            try:
+                with transaction.atomic():
+                    user.save(force_insert=True)
+                    _add_groups([user], groups)
+            except IntegrityError:
+                result['errors'].append({'line': number, 'error': "A user with this email, username or barcode already exists"})
+            else:
+                created.append(((number, row), user))
+
+    result['created'] += len(created)
+    result['users'].extend({'line': number, 'id': user.pk, 'username': user.username, 'email': user.email,
+                            'barcode': user.barcode} for (number, _), user in created)
+
+
+def provision_patrons(rows, defaults=None, groups=(), workers=None, chunk_size=500, sealed=False):
+    """
+    Create users from an iterable of roster rows (dicts with ``email`` and
+    optional ``username``, ``password``, ``barcode`` and profile columns).
+
+    ``defaults`` fills blank ``faculty``, ``department``, ``user_category``,
+    ``staff_category`` and ``role`` columns; every new user joins ``groups``.
+    Usernames default to the student ID, then the email; rows without a
+    password get an unusable one. With ``sealed``, rows come from
+    ``seal_roster`` and their passwords are decrypted first.
+    """
+    defaults = defaults or {}
+    workers = settings.PROVISIONING_WORKERS if workers is None else workers
+    result = {'created': 0, 'errors': [], 'users': []}
+    seen = {field: set() for field in UNIQUE_FIELDS}
+
+    def cleaned():
+        for number, raw in enumerate(rows, start=1):
+            try:
+                yield number, _clean_row(raw, defaults, sealed)
+            except (TypeError, ValueError) as exc:
+                result['errors'].append({'line': number, 'error': str(exc)})
+
+    executor = password_pool(workers)
+    try:
+        hasher = lambda passwords: hash_passwords(passwords, executor, workers)
+        for chunk in chunks(cleaned(), chunk_size):
+            _provision_chunk(chunk, list(groups), hasher, seen, result)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    result['errors'].sort(key=lambda error: error['line'])
+    return result
+
+
+@jobs.task(max_attempts=1, clear_args=True)
+def provision_patrons_job(rows, defaults, group_ids):
+    """Background variant of ``provision_patrons`` for rows from ``seal_roster``; the roster is erased from the job when done."""
+    return provision_patrons(rows, defaults, Group.objects.filter(pk__in=group_ids), sealed=True)
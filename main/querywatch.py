@@ -0,0 +1,174 @@
+# querywatch.py
+"""
+N+1 query detection and a sampled slow-query log.
+
+While a request is watched, every query is reduced to its shape (literals
+and IN-lists stripped). A shape repeated ``NPLUSONE_THRESHOLD`` times in
+one request is reported with the view and the first project code location
+that issued it. Queries slower than ``SLOW_QUERY_MS`` are logged for a
+``SLOW_QUERY_SAMPLE_RATE`` fraction of occurrences.
+
+With ``QUERYWATCH_STRICT`` (or ``watch(strict=True)`` in a test) an N+1
+pattern raises ``NPlusOneError`` instead of being logged.
+"""
+import logging
+import os
+import random
+import re
+import sys
+import time
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+from .instrumentation import awrap_connections, wrap_connections
+
+logger = logging.getLogger(__name__)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*%s\s*,?)+\)", re.IGNORECASE)
+_SPACE = re.compile(r"\s+")
+
+_PROJECT_ROOT = Path(settings.BASE_DIR).resolve()
+# Frames in the app itself; manage.py and the backend entry points are never the cause
+_APP_ROOT = str(Path(__file__).resolve().parent)
+# Our own tooling frames are never the cause of a query
+_TOOLING = {str(Path(__file__).resolve()), str(Path(__file__).with_name('instrumentation.py').resolve())}
+
+
+class NPlusOneError(AssertionError):
+    pass
+
+
+def query_shape(sql):
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def code_location():
+    """
+    ``path:line in function`` of the innermost project frame, falling back
+    to the innermost library frame outside the database layer.
+    """
+    frame = sys._getframe(2)
+    fallback = None
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_APP_ROOT) and filename not in _TOOLING:
+            return f"{Path(filename).relative_to(_PROJECT_ROOT)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        if fallback is None and f"django{os.sep}db{os.sep}" not in filename and filename not in _TOOLING:
+            fallback = f"{filename}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return fallback or 'unknown'
+
+
+class QueryWatcher:
+    def __init__(self, view=None, strict=None, threshold=None):
+        self.view = view
+        self.strict = getattr(settings, 'QUERYWATCH_STRICT', False) if strict is None else strict
+        self.threshold = threshold or getattr(settings, 'NPLUSONE_THRESHOLD', 5)
+        self.slow_seconds = getattr(settings, 'SLOW_QUERY_MS', 200) / 1000
+        self.slow_sample_rate = getattr(settings, 'SLOW_QUERY_SAMPLE_RATE', 1.0)
+        self.shapes = {}  # shape -> [count, seconds, location]
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            shape = query_shape(sql)
+            entry = self.shapes.get(shape)
+            if entry is None:
+                entry = self.shapes[shape] = [0, 0.0, None]
+            entry[0] += 1
+            entry[1] += elapsed
+            # Only pay for a stack walk once a shape repeats or a query is slow
+            if entry[0] == 2:
+                entry[2] = code_location()
+            if elapsed >= self.slow_seconds and random.random() < self.slow_sample_rate:
+                logger.warning(
+                    "Slow query (%.1f ms) in %s at %s: %s",
+                    elapsed * 1000, self.view or 'unknown', code_location(), sql[:2000],
+                )
+
+    def repeated(self):
+        """``(shape, count, seconds, location)`` for every shape over the threshold."""
+        return [
+            (shape, count, seconds, location)
+            for shape, (count, seconds, location) in self.shapes.items()
+            if count >= self.threshold
+        ]
+
+    def report(self):
+        repeated = self.repeated()
+        if not repeated:
+            return
+        lines = [
+            f"{count}x ({seconds * 1000:.1f} ms) at {location}: {shape[:500]}"
+            for shape, count, seconds, location in repeated
+        ]
+        message = f"N+1 queries in {self.view or 'unknown'}:\n  " + "\n  ".join(lines)
+        if self.strict:
+            raise NPlusOneError(message)
+        logger.warning(message)
+
+
+@contextmanager
+def watch(view=None, strict=None, threshold=None):
+    """Watch all queries in the block; reports (or raises) on exit."""
+    watcher = QueryWatcher(view=view, strict=strict, threshold=threshold)
+    with ExitStack() as stack:
+        wrap_connections(stack, watcher)
+        yield watcher
+    watcher.report()
+
+
+class QueryWatchMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def sampled(self):
+        rate = getattr(settings, 'QUERYWATCH_SAMPLE_RATE', 0.0)
+        return getattr(settings, 'QUERYWATCH_STRICT', False) or (rate > 0 and random.random() < rate)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        watcher = QueryWatcher(view=request.path)
+        with ExitStack() as stack:
+            wrap_connections(stack, watcher)
+            response = self.get_response(request)
+        return self.finish(request, response, watcher)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        watcher = QueryWatcher(view=request.path)
+        stack = ExitStack()
+        await awrap_connections(stack, watcher)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.finish(request, response, watcher)
+
+    def finish(self, request, response, watcher):
+        if request.resolver_match is not None:
+            watcher.view = f"{request.resolver_match.view_name} ({request.method} {request.path})"
+        watcher.report()
+        return response
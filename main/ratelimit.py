@@ -0,0 +1,148 @@
+# ratelimit.py
+"""
+Token-bucket rate limiting for API views.
+
+``RATELIMIT_POLICIES`` names the buckets: a refill ``rate`` (``"30/min"``),
+a ``burst`` size and what a bucket belongs to (``by``): the client ``ip``,
+the ``user`` (falling back to the ip when anonymous), or the ``username``
+posted to a login endpoint. ``RATELIMIT_VIEWS`` maps view classes, by dotted
+path, to the policies they draw from; this covers views the project does not
+own, such as djoser's and simplejwt's. ``TokenBucketThrottle`` (a DRF
+default throttle) takes one token from each, and an empty bucket gets a 429
+with ``Retry-After``.
+
+Buckets are shared by every worker process. Each bucket is a single
+timestamp (GCRA, the "virtual scheduling" form of a token bucket). When
+``RATELIMIT_CACHE`` names a Redis cache it is updated by one atomic Lua
+script, one round trip per bucket. Otherwise buckets are ``RateLimitBucket``
+rows and a token is taken by one conditional UPDATE, which the database
+serializes, so limits are exact across processes there too; buckets that
+have refilled completely are pruned every ``RATELIMIT_PRUNE_SECONDS``.
+"""
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Greatest
+from rest_framework.throttling import BaseThrottle
+
+from main.models import RateLimitBucket
+
+try:
+    from django.core.cache.backends.redis import RedisCache
+except ImportError:  # redis-py not installed
+    RedisCache = None
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# KEYS[1] bucket; ARGV now, interval, burst in microseconds/tokens. Returns 0, or microseconds to wait
+_GCRA = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then tat = now end
+local allow_at = tat + interval - interval * tonumber(ARGV[3])
+if now < allow_at then return allow_at - now end
+redis.call('SET', KEYS[1], tat + interval, 'PX', math.ceil((tat + interval - now) / 1000))
+return 0
+"""
+
+_scripts = {}  # cache alias -> registered Lua script
+_last_prune = 0.0
+
+
+@lru_cache(maxsize=None)
+def parse_rate(rate):
+    """``"30/min"`` -> tokens per second; the period is ``s``, ``m``, ``h`` or ``d`` (or a word starting with one)."""
+    count, _, period = rate.partition('/')
+    if not period or period[0] not in PERIODS:
+        raise ValueError(f"Invalid rate: {rate!r}")
+    return int(count) / PERIODS[period[0]]
+
+
+def _take_redis(cache, key, now, interval, burst):
+    key = cache.make_key(key)
+    client = cache._cache.get_client(key, write=True)
+    script = _scripts.get(settings.RATELIMIT_CACHE)
+    if script is None:
+        script = _scripts[settings.RATELIMIT_CACHE] = client.register_script(_GCRA)
+    return int(script(keys=[key], args=[now, interval, burst], client=client))
+
+
+def _prune(now):
+    global _last_prune
+    if time.monotonic() - _last_prune > settings.RATELIMIT_PRUNE_SECONDS:
+        _last_prune = time.monotonic()
+        RateLimitBucket.objects.filter(tat__lt=now).delete()
+
+
+def _take_db(key, now, interval, burst):
+    _prune(now)
+    while True:
+        # Allowed when max(tat, now) + interval - interval * burst <= now
+        taken = RateLimitBucket.objects.filter(key=key, tat__lte=now + interval * (burst - 1)).update(
+            tat=Greatest('tat', models.Value(now, output_field=models.BigIntegerField())) + interval)
+        if taken:
+            return 0
+        tat = RateLimitBucket.objects.filter(key=key).values_list('tat', flat=True).first()
+        if tat is None:
+            try:
+                with transaction.atomic():
+                    RateLimitBucket.objects.create(key=key, tat=now + interval)
+                return 0
+            except IntegrityError:
+                continue  # another process created the bucket first
+        wait = tat + interval - interval * burst - now
+        if wait > 0:
+            return wait
+
+
+def take(bucket, rate, burst):
+    """Take a token from ``bucket``; returns 0, or the seconds until one is available."""
+    key, now, interval = f"ratelimit:{bucket}", time.time_ns() // 1000, round(1e6 / parse_rate(rate))
+    cache = caches[settings.RATELIMIT_CACHE] if settings.RATELIMIT_CACHE else None
+    if RedisCache is not None and isinstance(cache, RedisCache):
+        wait = _take_redis(cache, key, now, interval, burst)
+    else:
+        wait = _take_db(key, now, interval, burst)
+    return wait / 1e6
+
+
+def _identity(request, by, throttle):
+    if by == 'ip':
+        return throttle.get_ident(request)
+    if by == 'user':
+        user = request.user
+        return f"user:{user.pk}" if user and user.is_authenticated else throttle.get_ident(request)
+    if by == 'username':
+        # Per account, so a credential-stuffing run spread over many addresses still hits a limit
+        if request.method != 'POST' or not hasattr(request.data, 'get'):
+            return None
+        username = str(request.data.get('username') or '').strip().lower()
+        return f"username:{username[:150]}" if username else None
+    raise ValueError(f"Unknown rate limit identity: {by!r}")
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Applies the ``RATELIMIT_VIEWS`` policies for the view; views without any are not limited."""
+
+    def allow_request(self, request, view):
+        self.retry_after = None
+        names = settings.RATELIMIT_VIEWS.get(f"{type(view).__module__}.{type(view).__qualname__}")
+        if not names or not settings.RATELIMIT_ENABLED:
+            return True
+        for name in names:
+            policy = settings.RATELIMIT_POLICIES[name]
+            identity = _identity(request, policy.get('by', 'ip'), self)
+            if identity is None:
+                continue
+            wait = take(f"{name}:{identity}", policy['rate'], policy.get('burst', 1))
+            if wait:
+                self.retry_after = wait
+                return False
+        return True
+
+    def wait(self):
+        return self.retry_after
@@ -0,0 +1,144 @@
+# replicas.py
+"""
+Read-replica routing with read-your-writes stickiness.
+
+Safe (GET/HEAD) requests to the ``main`` viewsets read from one of the
+``REPLICA_DATABASES``; everything else, and all code outside a request,
+stays on ``default``. Any write marks the request: its later reads go to the
+primary, and the user is pinned to the primary for ``REPLICA_STICKY_SECONDS``
+so the next read after e.g. a checkout cannot hit a lagging replica. Pins
+live in the ``REPLICA_PIN_CACHE`` cache, which must be shared between
+processes (Redis, or the database cache) when more than one worker serves the
+API. The database cache's table is created by a ``main`` migration.
+"""
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PRIMARY = 'default'
+
+_state = ContextVar('replica_routing', default=None)
+
+
+class RoutingState:
+    __slots__ = ('replica_reads', 'wrote')
+
+    def __init__(self):
+        self.replica_reads = False
+        self.wrote = False
+
+
+def replicas():
+    return getattr(settings, 'REPLICA_DATABASES', [])
+
+
+def pin_cache():
+    return caches[getattr(settings, 'REPLICA_PIN_CACHE', 'default')]
+
+
+def pin_key(user):
+    return f"replicas:pinned:{user.pk}"
+
+
+def pin(user):
+    pin_cache().set(pin_key(user), True, getattr(settings, 'REPLICA_STICKY_SECONDS', 10))
+
+
+def allow_replica_reads(request, user):
+    """Let the rest of this request read from replicas, unless the user was pinned by a recent write."""
+    state = _state.get()
+    if state is None or not replicas() or request.method not in SAFE_METHODS:
+        return
+    if user is not None and user.is_authenticated and pin_cache().get(pin_key(user)):
+        return
+    state.replica_reads = True
+
+
+async def aallow_replica_reads(request, user):
+    state = _state.get()
+    if state is None or not replicas() or request.method not in SAFE_METHODS:
+        return
+    if user is not None and user.is_authenticated and await pin_cache().aget(pin_key(user)):
+        return
+    state.replica_reads = True
+
+
+def is_cache_entry(model):
+    # DatabaseCache and rate-limit rows: always on the primary, and touching them is not a write that pins the user
+    return model._meta.app_label == 'django_cache' or model._meta.label == 'main.RateLimitBucket'
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if is_cache_entry(model):
+            return PRIMARY
+        if state is None or not state.replica_reads or state.wrote:
+            return PRIMARY
+        return random.choice(replicas())
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and not is_cache_entry(model):
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaReadMixin:
+    """Viewset mixin: safe requests read from replicas once the user is authenticated."""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        allow_replica_reads(request, request.user)
+
+
+class ReplicaMiddleware:
+    """Scopes routing state to a request and pins users who wrote during it."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote:
+            self.pin(request)
+        return response
+
+    async def __acall__(self, request):
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote:
+            # request.user may still be a lazy session lookup
+            await sync_to_async(self.pin)(request)
+        return response
+
+    def pin(self, request):
+        # DRF copies the authenticated user onto the Django request
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            pin(user)
@@ -0,0 +1,130 @@
+# roster.py
+"""
+Duty roster generation and conflict detection.
+
+Double-booking is defined as the same user on the same date and shift; the
+``unique_duty_per_shift`` constraint makes every check an index lookup.
+"""
+import heapq
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+
+from main.models import Duty, User
+from main.utils import chunks
+
+DEFAULT_SHIFTS = ['Morning', 'Afternoon', 'Evening']
+WEEKDAYS = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+
+
+def roster_staff():
+    """Users eligible for duty: staff accounts and library staff categories."""
+    return User.objects.filter(is_active=True).filter(
+        Q(is_staff=True) | Q(staff_category__in=['librarian', 'staff'])
+    )
+
+
+def find_conflicts(assignments):
+    """
+    Return the subset of ``(user_id, date, shift)`` tuples that are already
+    booked. One query, each row matched through the unique index.
+    """
+    assignments = {(str(user_id), date, shift) for user_id, date, shift in assignments}
+    if not assignments:
+        return []
+    user_ids = {a[0] for a in assignments}
+    dates = {a[1] for a in assignments}
+    shifts = {a[2] for a in assignments}
+    existing = Duty.objects.filter(
+        user_id__in=user_ids, date__in=dates, shift__in=shifts
+    ).values_list('user_id', 'date', 'shift')
+    return sorted(
+        (a for a in ((str(u), d, s) for u, d, s in existing) if a in assignments),
+        key=lambda a: (a[1], a[2], a[0]),
+    )
+
+
+def _is_available(availability, user_id, day, shift):
+    # No entry means the user is available for every shift
+    rules = availability.get(str(user_id))
+    if rules is None:
+        return True
+    return shift in rules.get(WEEKDAYS[day.weekday()], ())
+
+
+def generate_roster(start, end, staff_ids, shifts=None, coverage=None,
+                    availability=None, max_per_day=1, days=None):
+    """
+    Plan duties from ``start`` to ``end`` inclusive.
+
+    ``coverage`` maps shift name to required headcount (default 1),
+    ``availability`` maps user id to ``{weekday: [shifts]}`` and ``days``
+    restricts the roster to the given weekday names. Staff with the fewest
+    shifts so far are picked first, using a heap, so the work is
+    O(slots * log staff). Existing duties in the range count towards
+    coverage and are never double-booked.
+
+    Returns ``(planned, gaps)``: unsaved Duty objects and a list of
+    ``{"date", "shift", "missing"}`` for slots that could not be filled.
+    """
+    shifts = shifts or DEFAULT_SHIFTS
+    coverage = coverage or {}
+    availability = {str(k): v for k, v in (availability or {}).items()}
+    staff_ids = [str(pk) for pk in staff_ids]
+
+    booked = set()
+    load = defaultdict(int)
+    per_day = defaultdict(int)
+    filled = defaultdict(int)
+    existing = Duty.objects.filter(date__range=(start, end)).values_list('user_id', 'date', 'shift')
+    for user_id, date, shift in existing:
+        user_id = str(user_id)
+        booked.add((user_id, date, shift))
+        load[user_id] += 1
+        per_day[(user_id, date)] += 1
+        filled[(date, shift)] += 1
+
+    heap = [(load[pk], pk) for pk in staff_ids]
+    heapq.heapify(heap)
+
+    planned, gaps = [], []
+    day = start
+    while day <= end:
+        if days is None or WEEKDAYS[day.weekday()] in days:
+            for shift in shifts:
+                needed = int(coverage.get(shift, 1)) - filled[(day, shift)]
+                skipped = []
+                while needed > 0 and heap:
+                    count, user_id = heapq.heappop(heap)
+                    if ((user_id, day, shift) in booked
+                            or per_day[(user_id, day)] >= max_per_day
+                            or not _is_available(availability, user_id, day, shift)):
+                        skipped.append((count, user_id))
+                        continue
+                    planned.append(Duty(user_id=user_id, date=day, shift=shift))
+                    booked.add((user_id, day, shift))
+                    per_day[(user_id, day)] += 1
+                    needed -= 1
+                    heapq.heappush(heap, (count + 1, user_id))
+                for item in skipped:
+                    heapq.heappush(heap, item)
+                if needed > 0:
+                    gaps.append({"date": day, "shift": shift, "missing": needed})
+        day += timedelta(days=1)
+    return planned, gaps
+
+
+def save_roster(planned, batch_size=1000):
+    """
+    Insert planned duties and return the ones actually stored; rows that
+    collide with concurrent bookings are skipped.
+    """
+    with transaction.atomic():
+        Duty.objects.bulk_create(planned, batch_size=batch_size, ignore_conflicts=True)
+        # Ids are generated client-side, so the re-read tells which rows were ours
+        stored = set()
+        for chunk in chunks([duty.pk for duty in planned], batch_size):
+            stored.update(Duty.objects.filter(pk__in=chunk).values_list('pk', flat=True))
+    return [duty for duty in planned if duty.pk in stored]
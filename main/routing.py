@@ -3,4 +3,5 @@ from . import consumers
 
 websocket_urlpatterns = [
     re_path(r"ws/chat/$", consumers.ChatConsumer.as_asgi()),
+    re_path(r"ws/dashboard/$", consumers.DashboardConsumer.as_asgi()),
 ]
@@ -1,7 +1,10 @@
+from django.conf import settings
+from django.db import transaction
 from rest_framework import serializers
-from djoser.serializers import UserSerializer as BaseUserSerializer, UserCreateSerializer as BaseUserCreateSerializer
-from .models import User, Attendance, Catalog, Circulation, Acquisition, Duty, Message
+from .models import User, Attendance, Catalog, Circulation, Acquisition, AcquisitionSpend, Duty, Job, Message
 from django.contrib.auth.models import Permission, Group
+from . import holds, roster
+from .identifiers import normalize_isbn, normalize_issn
 
 class PermissionSerializer(serializers.ModelSerializer):
     class Meta:
@@ -23,42 +26,6 @@ class GroupSerializer(serializers.ModelSerializer):
         fields = ["id", "name", "permissions", "permission_ids"]
 
 
-class UserCreateSerializer(BaseUserCreateSerializer):
-
-    class Meta(BaseUserCreateSerializer.Meta):
-        model = User
-        fields = [
-            "id", "first_name", "last_name", "username", "email", "password",
-            "phone", "student_id", "faculty", "department", "user_category", 
-            "staff_category"
-        ]
-
-
-class UserSerializer(BaseUserSerializer):
-    groups = GroupSerializer(many=True, read_only=True)
-    group_ids = serializers.PrimaryKeyRelatedField(      
-        many=True,
-        queryset=Group.objects.all(),
-        write_only=True,
-        source="groups"
-    )
-    permissions = PermissionSerializer(source="user_permissions", many=True, read_only=True)
-    permission_ids = serializers.PrimaryKeyRelatedField( 
-        many=True,
-        queryset=Permission.objects.all(),
-        write_only=True,
-        source="user_permissions"
-    )
-    class Meta(BaseUserSerializer.Meta):
-        model = User
-        fields = [
-            "id", "first_name", "last_name", "username", "email",
-            "phone", "student_id", "faculty", "department", "user_category",
-            "staff_category", "role", 'barcode', 'permissions', 'permission_ids', 'groups', 'group_ids',
-            "is_active", "is_staff", "is_superuser", "password",
-        ]
-
-
 class UserNestedSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -93,14 +60,34 @@ class AttendanceSerializer(serializers.ModelSerializer):
 
 
 
+class AttendanceBatchSerializer(serializers.Serializer):
+    # Each scan is checked on its own in main.kiosk, so one bad scan does not fail the upload
+    scans = serializers.ListField(child=serializers.DictField(), allow_empty=False,
+                                  max_length=settings.KIOSK_BATCH_MAX_SCANS)
+
+
 class CatalogSerializer(serializers.ModelSerializer):
-    added_by = UserNestedSerializer(read_only=True)
     class Meta:
         model = Catalog
         fields = [
             'id', 'title', 'author', 'barcode', 'marc_tag', 'dublin_core', 'ai_suggestion', 'isbn', 'issn', 'lccn', 'dewey_decimal',
-            'subject', 'language', 'format', 'publisher', 'year', 'contributors', 'notes', 'tags', 'quantity', 'can_be_borrowed', 'created_at', 'updated_at', 'added_by'
+            'subject', 'language', 'format', 'publisher', 'year', 'contributors', 'notes', 'tags', 'quantity', 'can_be_borrowed', 'created_at', 'updated_at',
+            'isbn13', 'issn_normalized'
         ]
+
+    def validate(self, data):
+        # Reject duplicates by canonical identifier, whatever the input formatting
+        for field, target, normalize in (('isbn', 'isbn13', normalize_isbn), ('issn', 'issn_normalized', normalize_issn)):
+            key = normalize(data.get(field))
+            if not key:
+                continue
+            duplicates = Catalog.objects.filter(**{target: key})
+            if self.instance is not None:
+                duplicates = duplicates.exclude(pk=self.instance.pk)
+            if duplicates.exists():
+                raise serializers.ValidationError({field: f'A catalog record with this {field.upper()} already exists.'})
+        return data
+
 class CirculationSerializer(serializers.ModelSerializer):
     user_barcode = serializers.CharField(write_only=True, required=True)
     book_barcode = serializers.CharField(write_only=True, required=True)
@@ -119,9 +106,11 @@ class CirculationSerializer(serializers.ModelSerializer):
             'return_date',
             'actual_return',
             'fine',
-            'status'
+            'status',
+            'priority',
+            'reserved_at'
         ]
-        read_only_fields = ['id', 'borrower', 'book']
+        read_only_fields = ['id', 'borrower', 'book', 'reserved_at']
 
     def validate(self, data):
         user_barcode = data.get('user_barcode')
@@ -148,13 +137,10 @@ class CirculationSerializer(serializers.ModelSerializer):
             if not book.can_be_borrowed:
                 raise serializers.ValidationError({'book': 'This item cannot be borrowed.'})
 
-            from main.models import Circulation
-            borrowed_status = ['borrowed', 'overdue']
-
-            borrowed_count = Circulation.objects.filter(
-                book=book,
-                status__in=borrowed_status
-            ).count()
+            # A copy already allocated to this borrower's hold is theirs to take. Checked again
+            # under the title's lock when the loan is created (see holds.checkout)
+            own_hold = holds.ready_hold_for(book, self.user_instance)
+            borrowed_count = holds.copies_in_use(book, exclude=own_hold)
 
             available = book.quantity - borrowed_count
             if available <= 0:
@@ -167,19 +153,96 @@ class CirculationSerializer(serializers.ModelSerializer):
         validated_data.pop('user_barcode')
         validated_data.pop('book_barcode')
 
+        if validated_data.get('status') == holds.HOLD_STATUS:
+            validated_data.pop('status')
+            return holds.place_hold(self.book_instance, self.user_instance, **validated_data)
+
+        if validated_data.get('status') == 'borrowed':
+            validated_data.pop('status')
+            try:
+                return holds.checkout(self.book_instance, self.user_instance, **validated_data)
+            except holds.NoCopyAvailable:
+                raise serializers.ValidationError({'book': 'No available copies to borrow.'})
+
         return Circulation.objects.create(
             borrower=self.user_instance,
             book=self.book_instance,
             **validated_data
         )
 
+    def update(self, instance, validated_data):
+        validated_data.pop('user_barcode', None)
+        validated_data.pop('book_barcode', None)
+        status = validated_data.pop('status', instance.status)
+        if status != instance.status:
+            queue = {holds.HOLD_STATUS, holds.READY_STATUS}
+            if status in queue or instance.status in queue:
+                raise serializers.ValidationError({'status': 'Holds are placed and collected through POST.'})
+            if status != 'returned':
+                validated_data['status'] = status
+
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            if status == 'returned' and instance.status != 'returned':
+                # Through the hold queue, so the freed copy goes to the next hold
+                try:
+                    instance, _ = holds.return_loan(instance, validated_data.get('actual_return'))
+                except ValueError as exc:
+                    raise serializers.ValidationError({'status': str(exc)})
+        return instance
+
 class AcquisitionSerializer(serializers.ModelSerializer):
     added_by = UserNestedSerializer(read_only=True)
     class Meta:
         model = Acquisition
         fields = [
-            'id', 'title', 'source', 'supplier', 'amount', 'date_acquired', 'added_by'
+            'id', 'title', 'source', 'supplier', 'amount', 'date_acquired', 'added_by', 'catalog', 'quantity'
+        ]
+
+
+class AcquisitionSpendSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AcquisitionSpend
+        fields = ['supplier', 'source', 'total_amount', 'item_count', 'updated_at']
+
+
+class AccessionManifestSerializer(serializers.Serializer):
+    source = serializers.ChoiceField(choices=Acquisition.SOURCE_CHOICES, default='purchase')
+    supplier = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    date_acquired = serializers.DateField(required=False)
+    items = serializers.ListField(child=serializers.DictField(), required=False)
+    file = serializers.FileField(required=False)
+    background = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        if not data.get('items') and not data.get('file'):
+            raise serializers.ValidationError('Provide manifest items or a CSV file.')
+        return data
+
+class PatronProvisioningSerializer(serializers.Serializer):
+    items = serializers.ListField(child=serializers.DictField(), required=False)
+    file = serializers.FileField(required=False)
+    groups = serializers.SlugRelatedField(many=True, slug_field='name', queryset=Group.objects.all(), required=False)
+    faculty = serializers.CharField(max_length=255, required=False)
+    department = serializers.CharField(max_length=255, required=False)
+    user_category = serializers.ChoiceField(choices=User._meta.get_field('user_category').choices, required=False)
+    staff_category = serializers.ChoiceField(choices=User._meta.get_field('staff_category').choices, required=False)
+    role = serializers.CharField(max_length=50, required=False)
+    background = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        if not data.get('items') and not data.get('file'):
+            raise serializers.ValidationError('Provide roster items or a CSV file.')
+        return data
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'task', 'status', 'priority', 'run_at', 'attempts', 'max_attempts', 'result', 'error',
+            'created_by', 'created_at', 'started_at', 'finished_at'
         ]
+        read_only_fields = fields
 
 class DutySerializer(serializers.ModelSerializer):
     class Meta:
@@ -201,3 +264,26 @@ class MessageSerializer(serializers.ModelSerializer):
         validated_data['sender'] = request.user
         return super().create(validated_data)
 
+
+
+class DutyAssignmentSerializer(serializers.Serializer):
+    user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
+    date = serializers.DateField()
+    shift = serializers.CharField(max_length=50)
+
+
+class RosterRequestSerializer(serializers.Serializer):
+    start = serializers.DateField()
+    end = serializers.DateField()
+    staff = serializers.PrimaryKeyRelatedField(many=True, queryset=User.objects.all(), required=False)
+    shifts = serializers.ListField(child=serializers.CharField(max_length=50), required=False)
+    coverage = serializers.DictField(child=serializers.IntegerField(min_value=0), required=False)
+    availability = serializers.DictField(child=serializers.DictField(), required=False)
+    days = serializers.ListField(child=serializers.ChoiceField(choices=roster.WEEKDAYS), required=False)
+    max_per_day = serializers.IntegerField(min_value=1, default=1)
+    dry_run = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        if data['end'] < data['start']:
+            raise serializers.ValidationError({'end': 'End date must not be before start date.'})
+        return data
@@ -0,0 +1,36 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Attendance, Catalog, Circulation, User
+from . import changefeed, events, typeahead
+
+
+@receiver(post_save, sender=Catalog)
+def index_catalog(sender, instance, **kwargs):
+    # Only patch an index that is already loaded; the first query builds it
+    if typeahead.index.loaded:
+        typeahead.index.add(instance.pk, instance.title, instance.author)
+
+
+@receiver(post_delete, sender=Catalog)
+def unindex_catalog(sender, instance, **kwargs):
+    if typeahead.index.loaded:
+        typeahead.index.remove(instance.pk)
+
+
+@receiver(post_delete, sender=Catalog)
+@receiver(post_delete, sender=User)
+def record_tombstone(sender, instance, **kwargs):
+    changefeed.record_deletion(instance)
+
+
+@receiver(post_save, sender=Circulation)
+def announce_loan(sender, instance, created, **kwargs):
+    if instance.status in ('borrowed', 'returned', 'overdue'):
+        events.publish('circulation', events.loan_event(instance, created))
+
+
+@receiver(post_save, sender=Attendance)
+def announce_scan(sender, instance, created, **kwargs):
+    if created:
+        events.publish('attendance', events.scan_event(instance))
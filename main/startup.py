@@ -0,0 +1,263 @@
+# startup.py
+"""
+Cold-start instrumentation and lazy loading for the WSGI/ASGI entry points.
+
+With ``STARTUP_PROFILE=1`` in the environment, ``begin()`` installs an import
+hook before Django loads, the entry points time their phases, and once the
+first HTTP request has been answered a breakdown (phases, slowest packages
+and modules by import time) is written to stderr and the hook removed.
+``manage.py benchmark_coldstart`` uses the same machinery in fresh processes.
+
+This module must not import Django at import time: it runs before setup.
+"""
+import asyncio
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+_started = None
+_profiler = None
+_phases = {}
+last_report = None
+
+
+class ImportProfiler:
+    """A meta path hook recording inclusive and self ``exec_module`` time per module."""
+
+    def __init__(self):
+        self.records = {}  # module -> (inclusive seconds, self seconds)
+        self._local = threading.local()
+
+    def find_spec(self, fullname, path=None, target=None):
+        local = self._local
+        if getattr(local, 'finding', False):
+            return None
+        local.finding = True
+        try:
+            for finder in sys.meta_path:
+                find = getattr(finder, 'find_spec', None)
+                if finder is self or find is None:
+                    continue
+                spec = find(fullname, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            local.finding = False
+        loader = spec.loader
+        # Built-in and frozen importers are shared classes; file loaders are per module
+        if loader is not None and not isinstance(loader, type) and hasattr(loader, 'exec_module'):
+            loader.exec_module = self._timed(fullname, loader.exec_module)
+        return spec
+
+    def _timed(self, name, exec_module):
+        def exec_timed(module):
+            stack = self._local.__dict__.setdefault('stack', [])
+            stack.append(0.0)
+            started = time.perf_counter()
+            try:
+                exec_module(module)
+            finally:
+                elapsed = time.perf_counter() - started
+                children = stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+                self.records[name] = (elapsed, elapsed - children)
+        return exec_timed
+
+    def by_package(self):
+        totals = {}
+        for name, (_, own) in self.records.items():
+            package = name.partition('.')[0]
+            totals[package] = totals.get(package, 0.0) + own
+        return totals
+
+
+def enabled():
+    return os.environ.get('STARTUP_PROFILE') == '1'
+
+
+def begin(profile=None):
+    """Start the cold-start clock; call first thing in an entry point."""
+    global _started, _profiler
+    if _started is not None:
+        return
+    _started = time.perf_counter()
+    if (enabled() if profile is None else profile) and _profiler is None:
+        _profiler = ImportProfiler()
+        sys.meta_path.insert(0, _profiler)
+
+
+@contextmanager
+def phase(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases[name] = _phases.get(name, 0.0) + time.perf_counter() - started
+
+
+def report(top=15):
+    profiler = _profiler
+    data = {
+        'since_begin_s': round(time.perf_counter() - _started, 4) if _started is not None else None,
+        'phases_s': {name: round(seconds, 4) for name, seconds in _phases.items()},
+    }
+    if profiler is not None:
+        packages = sorted(profiler.by_package().items(), key=lambda item: -item[1])[:top]
+        modules = sorted(profiler.records.items(), key=lambda item: -item[1][0])[:top]
+        data['imported_modules'] = len(profiler.records)
+        data['import_s'] = round(sum(own for _, own in profiler.records.values()), 4)
+        data['packages_s'] = {name: round(seconds, 4) for name, seconds in packages}
+        data['modules_inclusive_s'] = {name: round(inclusive, 4) for name, (inclusive, _) in modules}
+    return data
+
+
+def finish():
+    """Remove the import hook and keep the report; with ``STARTUP_PROFILE=1`` it goes to stderr."""
+    global _profiler, last_report
+    if _profiler is None:
+        return
+    last_report = report()
+    sys.meta_path.remove(_profiler)
+    _profiler = None
+    if enabled():
+        sys.stderr.write(f"startup profile: {json.dumps(last_report)}\n")
+
+
+def track_wsgi(application):
+    """Time the first request of a WSGI application, then report. A no-op unless profiling."""
+    if _profiler is None:
+        return application
+    pending = [True]
+
+    def first_request(environ, start_response):
+        if not pending:
+            return application(environ, start_response)
+        pending.clear()
+        with phase('first_request'):
+            response = application(environ, start_response)
+        finish()
+        return response
+    return first_request
+
+
+def track_asgi(application):
+    """ASGI counterpart of ``track_wsgi``; only HTTP requests count."""
+    if _profiler is None:
+        return application
+    pending = [True]
+
+    async def first_request(scope, receive, send):
+        if not pending or scope['type'] != 'http':
+            return await application(scope, receive, send)
+        pending.clear()
+        with phase('first_request'):
+            await application(scope, receive, send)
+        finish()
+    return first_request
+
+
+class LazyApplication:
+    """An ASGI application built by ``loader()`` on its first connection."""
+
+    def __init__(self, loader):
+        self.loader = loader
+        self.application = None
+        self.lock = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if self.application is None:
+            with self.lock:
+                if self.application is None:
+                    with phase(f"lazy:{self.loader.__name__}"):
+                        self.application = self.loader()
+        return await self.application(scope, receive, send)
+
+
+class LazyURLConf:
+    """
+    A URLconf whose patterns are built by ``loader()`` the first time a URL
+    under its prefix is resolved (or any URL is reversed).
+    """
+
+    def __init__(self, loader):
+        self.loader = loader
+        self._urlpatterns = None
+
+    @property
+    def urlpatterns(self):
+        if self._urlpatterns is None:
+            with phase(f"lazy:{self.loader.__name__}"):
+                self._urlpatterns = self.loader()
+        return self._urlpatterns
+
+
+def lazy_include(prefix, loader, app_name=None, namespace=None):
+    """Like ``path(prefix, include(...))``, but nothing is imported until first use."""
+    from django.urls import URLResolver
+    from django.urls.resolvers import RoutePattern
+
+    return URLResolver(RoutePattern(prefix, is_endpoint=False), LazyURLConf(loader),
+                       app_name=app_name, namespace=namespace)
+
+
+def _wsgi_get(application, path):
+    from wsgiref.util import setup_testing_defaults
+
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': ''}
+    setup_testing_defaults(environ)
+    status = []
+    body = application(environ, lambda code, headers, exc_info=None: status.append(code))
+    b''.join(body)
+    if hasattr(body, 'close'):
+        body.close()
+    return int(status[0].split()[0])
+
+
+def _asgi_get(application, path):
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '', 'headers': [(b'host', b'testserver')],
+        'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+    }
+    status = []
+    body = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+    async def receive():
+        if body:
+            return body.pop()
+        # The client stays connected until the response is sent
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    asyncio.run(application(scope, receive, send))
+    return status[0]
+
+
+def measure(entry, path):
+    """
+    Run in a fresh interpreter: import ``backend.<entry>`` and serve one GET
+    of ``path`` through it, returning the timings and import breakdown.
+    """
+    begin(profile=True)
+    started = time.perf_counter()
+    module = importlib.import_module(f"backend.{entry}")
+    imported = time.perf_counter()
+    status = (_wsgi_get if entry == 'wsgi' else _asgi_get)(module.application, path)
+    served = time.perf_counter()
+    return {
+        'import_s': imported - started,
+        'first_request_s': served - imported,
+        'ready_s': served - started,
+        'status': status,
+        'report': last_report,
+    }
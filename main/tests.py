@@ -1,3 +1,1152 @@
-from django.test import TestCase
+import importlib
+import io
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import IntegrityError, connection, connections
+from django.apps import apps
+from django.contrib.auth.models import AnonymousUser, Group, Permission
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now, timedelta
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import (accessioning, barcodeimages, changefeed, checks, events, holds, idempotency, instrumentation, jobs, notices, provisioning,
+               querywatch, ratelimit, replicas, roster, startup, typeahead)
+from .consumers import DashboardConsumer
+from .dbpool import ConnectionPool, PooledDatabaseWrapperMixin, PoolTimeout
+from .fastpath import FastListMixin
+from .models import (Acquisition, AcquisitionSpend, Attendance, Catalog, Circulation, Duty, IdempotencyKey, Job, LoanNotice,
+                     Message, RateLimitBucket, Tombstone, User)
+from .provisioning import provision_patrons
+
+
+def sqlite_pool(**options):
+    def check(conn):
+        conn.execute('SELECT 1')
+        return True
+    return ConnectionPool('test', None, check, lambda conn: conn.rollback(), **options)
+
+
+def connect():
+    return sqlite3.connect(':memory:', check_same_thread=False)
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def test_checkout_times_out_when_the_pool_is_exhausted(self):
+        pool = sqlite_pool(max_size=2, timeout=0.1)
+        held = [pool.get(connect), pool.get(connect)]
+        with self.assertRaises(PoolTimeout):
+            pool.get(connect)
+        pool.put(held.pop())
+        self.assertIsNotNone(pool.get(connect))
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_broken_connection_is_replaced_on_borrow(self):
+        pool = sqlite_pool(max_size=1)
+        conn = pool.get(connect)
+        pool.put(conn)
+        conn.close()
+        replacement = pool.get(connect)
+        self.assertIsNot(replacement, conn)
+        replacement.execute('SELECT 1')
+        stats = pool.stats()
+        self.assertEqual((stats['health_check_failures'], stats['connects'], stats['connections']), (1, 2, 1))
+
+    def test_connections_past_their_lifetime_are_reopened(self):
+        pool = sqlite_pool(max_size=1, max_lifetime=0.05)
+        conn = pool.get(connect)
+        pool.put(conn)
+        time.sleep(0.1)
+        self.assertIsNot(pool.get(connect), conn)
+
+
+@skipUnless(isinstance(connections['default'], PooledDatabaseWrapperMixin), "needs a pooled database engine (DB_POOL_SIZE > 0)")
+class PooledRequestTests(TransactionTestCase):
+    databases = '__all__'
+    requests = 300
+    threads = 100
+    pool_size = 4
+
+    def test_hundreds_of_concurrent_requests_share_a_small_pool(self):
+        reader = User.objects.create_superuser('pool-reader@test.local', 'pool-reader', 'x')
+        Catalog.objects.bulk_create([Catalog(title=f"Pool {i}", barcode=f"POOL{i:04d}") for i in range(20)])
+        headers = {'HTTP_AUTHORIZATION': f"JWT {AccessToken.for_user(reader)}"}
+        connection.close()
+
+        pool = connection.connection_pool
+        max_size, pool.max_size, pool.timeout = pool.max_size, self.pool_size, 30.0
+        pool.peak = 0
+        before = pool.stats()
+
+        def request(i):
+            try:
+                return Client(**headers).get('/api/catalog/').status_code
+            finally:
+                # What request_finished does outside the test client
+                connections.close_all()
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.threads) as executor:
+                statuses = list(executor.map(request, range(self.requests)))
+        finally:
+            pool.max_size = max_size
+
+        after = pool.stats()
+        self.assertEqual(statuses, [200] * self.requests)
+        self.assertLessEqual(after['peak'], self.pool_size)
+        self.assertLessEqual(after['connections'], self.pool_size)
+        self.assertGreaterEqual(after['checkouts'] - before['checkouts'], self.requests)
+        self.assertEqual(after['timeouts'], before['timeouts'])
+
+
+@override_settings(REPLICA_DATABASES=['replica1'], REPLICA_STICKY_SECONDS=60, REPLICA_PIN_CACHE='default')
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.router = replicas.ReplicaRouter()
+        self.user = User(pk=42)
+
+    def route(self, method, before=None):
+        """Route a read in a request of ``method``; ``before(state)`` runs first."""
+        token = replicas._state.set(replicas.RoutingState())
+        try:
+            if before:
+                before(replicas._state.get())
+            replicas.allow_replica_reads(getattr(RequestFactory(), method.lower())('/api/catalog/'), self.user)
+            return self.router.db_for_read(Catalog)
+        finally:
+            replicas._state.reset(token)
+
+    def test_safe_requests_read_from_a_replica(self):
+        self.assertEqual(self.route('GET'), 'replica1')
+        self.assertEqual(self.route('POST'), 'default')
+
+    def test_reads_outside_a_request_use_the_primary(self):
+        self.assertEqual(self.router.db_for_read(Catalog), 'default')
+
+    def test_reads_after_a_write_use_the_primary(self):
+        self.assertEqual(self.route('GET', before=lambda state: self.router.db_for_write(Catalog)), 'default')
+
+    def test_user_is_pinned_to_the_primary_after_writing(self):
+        replicas.pin(self.user)
+        self.assertEqual(self.route('GET'), 'default')
+        self.user = User(pk=7)
+        self.assertEqual(self.route('GET'), 'replica1')
+
+    def test_database_cache_stays_on_the_primary_and_does_not_pin(self):
+        entry = caches['shared'].cache_model_class
+        state = replicas.RoutingState()
+        state.replica_reads = True
+        token = replicas._state.set(state)
+        try:
+            self.assertEqual(self.router.db_for_read(entry), 'default')
+            self.assertEqual(self.router.db_for_write(entry), 'default')
+            self.assertFalse(state.wrote)
+        finally:
+            replicas._state.reset(token)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ProvisioningTests(TestCase):
+    def test_valid_rows_are_created_and_bad_rows_reported(self):
+        User.objects.create_user('taken@uni.test', 'taken')
+        students = Group.objects.create(name='Students')
+        rows = [
+            {'email': 'ada@uni.test', 'student_id': 'S001', 'password': 'correct-horse-42'},
+            {'email': 'bob@uni.test', 'username': 'bob', 'barcode': 'CARD-7'},
+            {'email': 'ada@uni.test', 'student_id': 'S002'},
+            {'email': 'taken@uni.test'},
+            {'email': 'nope'},
+            {'email': 'cy@uni.test', 'password': '1234'},
+        ]
+        result = provision_patrons(rows, defaults={'user_category': 'undergraduate'}, groups=[students],
+                                   workers=1, chunk_size=2)
+
+        self.assertEqual(result['created'], 2)
+        self.assertEqual([error['line'] for error in result['errors']], [3, 4, 5, 6])
+        ada = User.objects.get(username='S001')
+        self.assertTrue(ada.check_password('correct-horse-42'))
+        self.assertTrue(ada.barcode.startswith('PAT'))
+        self.assertEqual(ada.user_category, 'undergraduate')
+        bob = User.objects.get(username='bob')
+        self.assertFalse(bob.has_usable_password())
+        self.assertEqual(bob.barcode, 'CARD-7')
+        self.assertEqual(students.user_set.count(), 2)
+
+    @override_settings(PROVISIONING_WORKERS=4)
+    def test_rosters_without_passwords_are_provisioned_in_the_request(self):
+        admin = User.objects.create_superuser('registrar@uni.test', 'registrar', 'x')
+        client = Client(HTTP_AUTHORIZATION=f"JWT {AccessToken.for_user(admin)}")
+        items = [{'email': 'num@uni.test', 'student_id': 12345, 'password': ''},
+                 {'email': 'nil@uni.test', 'student_id': None, 'phone': 5550100}]
+        with mock.patch.object(provisioning, 'ProcessPoolExecutor', side_effect=AssertionError("pool spawned")):
+            response = client.post('/api/users/provision/', {'items': items}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual((response.json()['created'], response.json()['errors']), (2, []))
+        self.assertFalse(User.objects.get(username='12345').has_usable_password())
+        self.assertEqual(User.objects.get(email='nil@uni.test').phone, '5550100')
+
+    @override_settings(PROVISIONING_WORKERS=3)
+    def test_passwords_are_queued_encrypted_and_hashed_by_the_job_pool(self):
+        admin = User.objects.create_superuser('registrar@uni.test', 'registrar', 'x')
+        client = Client(HTTP_AUTHORIZATION=f"JWT {AccessToken.for_user(admin)}")
+        items = [{'email': 'ada@uni.test', 'student_id': 12345, 'password': 'correct-horse-42', 'sealed_password': 'forged'},
+                 {'email': 'bob@uni.test', 'password': '1234'},
+                 {'email': 'cy@uni.test'}]
+        with mock.patch.object(provisioning, 'make_password', side_effect=AssertionError("hashed in the request")):
+            response = client.post('/api/users/provision/', {'items': items}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 202, response.content)
+        job = Job.objects.get(pk=response.json()['id'])
+        self.assertNotIn('correct-horse-42', json.dumps(job.args))
+        self.assertNotIn('forged', json.dumps(job.args))
+        pool = ThreadPoolExecutor(3)
+        with mock.patch.object(provisioning, 'password_pool', return_value=pool) as password_pool:
+            jobs.execute(jobs.claim('test-worker'))
+        password_pool.assert_called_once_with(3)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.args), (Job.SUCCEEDED, []))
+        self.assertEqual((job.result['created'], [error['line'] for error in job.result['errors']]), (2, [2]))
+        self.assertTrue(User.objects.get(username='12345').check_password('correct-horse-42'))
+        self.assertFalse(User.objects.get(email='cy@uni.test').has_usable_password())
+
+    def test_sealed_passwords_survive_a_secret_key_rotation_only_with_fallbacks(self):
+        rows = provisioning.seal_roster([{'email': 'ada@uni.test', 'password': 'correct-horse-42'}])
+        with override_settings(SECRET_KEY='rotated', SECRET_KEY_FALLBACKS=[settings.SECRET_KEY]):
+            self.assertEqual(provision_patrons(rows, workers=1, sealed=True)['created'], 1)
+        rows = provisioning.seal_roster([{'email': 'bob@uni.test', 'password': 'correct-horse-42'}])
+        with override_settings(SECRET_KEY='rotated'):
+            result = provision_patrons(rows, workers=1, sealed=True)
+        self.assertEqual((result['created'], result['errors'][0]['line']), (0, 1))
+        self.assertTrue(User.objects.get(email='ada@uni.test').check_password('correct-horse-42'))
+
+
+class BarcodeImageTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.media = media.name
+        reader = User.objects.create_user('barcodes@test.local', 'barcodes', 'x')
+        Catalog.objects.create(title='Barcoded', barcode='LIB00000042')
+        self.client = Client(HTTP_AUTHORIZATION=f"JWT {AccessToken.for_user(reader)}")
+
+    def test_code_128_symbols_and_checksum(self):
+        self.assertEqual(barcodeimages.encode('PJJ123C'), [104, 48, 42, 42, 17, 18, 19, 35, 55, 106])
+        # Digit runs switch to code set C
+        self.assertEqual(barcodeimages.encode('LIB00000042')[:5], [104, 44, 41, 34, 99])
+        with self.assertRaises(ValueError):
+            barcodeimages.encode('caf\u00e9')
+
+    def test_images_are_cached_and_served_with_long_lived_headers(self):
+        response = self.client.get('/api/barcodes/LIB00000042.png')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['Cache-Control'].split(',')[0], 'private')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'\x89PNG'))
+
+        again = self.client.get('/api/barcodes/LIB00000042.png', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(barcodeimages.render_batch(['LIB00000042', 'LIB00000043'], workers=1)['rendered'], 1)
+        self.assertEqual(self.client.get('/api/barcodes/LIB00000042.svg?text=0').status_code, 200)
+
+    def test_only_known_barcodes_and_preset_sizes_are_rendered(self):
+        User.objects.filter(username='barcodes').update(barcode='PAT00000007')
+        self.assertEqual(self.client.get('/api/barcodes/PAT00000007.svg').status_code, 200)
+        self.assertEqual(self.client.get('/api/barcodes/ANYTHING-AT-ALL.png').status_code, 404)
+        self.assertEqual(self.client.get('/api/barcodes/LIB00000042.png?scale=3&height=90').status_code, 200)
+        self.assertEqual(self.client.get('/api/barcodes/LIB00000042.png?height=91').status_code, 400)
+        rendered = [name for _, _, names in os.walk(self.media) for name in names]
+        self.assertEqual(len(rendered), 2)
+
+
+class LabelSheetTests(TestCase):
+    def test_spine_labels_stream_one_pdf_page_per_sheet(self):
+        admin = User.objects.create_superuser('labels@test.local', 'labels', 'x')
+        Catalog.objects.bulk_create([Catalog(title=f"Label {i}", barcode=f"LBL{i:04d}", dewey_decimal='020') for i in range(22)])
+        client = Client(HTTP_AUTHORIZATION=f"JWT {AccessToken.for_user(admin)}")
+
+        response = client.get('/api/catalog/labels/', {'since': '2000-01-01'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        pdf = b''.join(response.streaming_content)
+        self.assertTrue(pdf.startswith(b'%PDF-') and pdf.endswith(b'%%EOF\n'))
+        self.assertIn(b'/Count 2 >>', pdf)
+        self.assertEqual(client.get('/api/catalog/labels/').status_code, 400)
+
+
+@jobs.task
+def add_job(a, b):
+    return a + b
+
+
+@jobs.task(max_attempts=2, backoff=60)
+def failing_job():
+    raise RuntimeError("boom")
+
+
+@jobs.task(max_attempts=1, clear_args=True)
+def secret_job(token):
+    return None
+
+
+class JobQueueTests(TestCase):
+    def run_next(self):
+        job = jobs.claim('test-worker')
+        if job is not None:
+            jobs.execute(job)
+            job.refresh_from_db()
+        return job
+
+    def test_jobs_run_by_priority_and_store_their_result(self):
+        low = jobs.enqueue(add_job, args=[1, 2], priority=jobs.LOW)
+        high = add_job.enqueue(3, 4)
+        Job.objects.filter(pk=high.pk).update(priority=jobs.HIGH)
+        jobs.enqueue('main.tests.add_job', args=[0, 0], delay=3600)
+
+        self.assertEqual((self.run_next().pk, self.run_next().pk), (high.pk, low.pk))
+        self.assertIsNone(self.run_next())  # the delayed job is not due
+        low.refresh_from_db()
+        self.assertEqual((low.status, low.result, low.attempts), (Job.SUCCEEDED, 3, 1))
+
+    def test_failures_are_retried_with_backoff_then_marked_failed(self):
+        job = jobs.enqueue(failing_job)
+        first = self.run_next()
+        self.assertEqual(first.status, Job.QUEUED)
+        self.assertIn('RuntimeError: boom', first.error)
+        self.assertGreater(first.run_at, first.started_at + timedelta(seconds=40))
+
+        Job.objects.filter(pk=job.pk).update(run_at=first.started_at)
+        second = self.run_next()
+        self.assertEqual((second.status, second.attempts), (Job.FAILED, 2))
+
+    def test_expired_leases_are_requeued(self):
+        job = jobs.enqueue(add_job, args=[1, 1])
+        jobs.claim('lost-worker')
+        Job.objects.filter(pk=job.pk).update(locked_until=now() - timedelta(seconds=1))
+        jobs.requeue_expired()
+        self.assertEqual(self.run_next().result, 2)
+
+    def test_cleared_args_are_erased_by_a_process_that_has_not_imported_the_task(self):
+        lost = jobs.enqueue(secret_job, args=['hunter2'])
+        jobs.claim('lost-worker')
+        Job.objects.filter(pk=lost.pk).update(locked_until=now() - timedelta(seconds=1))
+        queued = jobs.enqueue(secret_job, args=['hunter2'])
+        with mock.patch.dict(jobs._tasks, clear=True):
+            jobs.requeue_expired()
+            jobs.cancel(queued)
+        for job in (lost, queued):
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.args), (Job.FAILED if job is lost else Job.CANCELLED, []))
+
+    def test_status_endpoint_shows_own_jobs_and_cancels_queued_ones(self):
+        owner = User.objects.create_user('jobs@test.local', 'jobs', 'x')
+        mine = jobs.enqueue(add_job, args=[1, 1], created_by=owner)
+        jobs.enqueue(add_job, args=[2, 2])
+        client = Client(HTTP_AUTHORIZATION=f"JWT {AccessToken.for_user(owner)}")
+
+        self.assertEqual([row['id'] for row in client.get('/api/jobs/').json()], [str(mine.pk)])
+        self.assertEqual(client.post(f'/api/jobs/{mine.pk}/cancel/').json()['status'], Job.CANCELLED)
+        self.assertEqual(client.post(f'/api/jobs/{mine.pk}/cancel/').status_code, 409)
+
+
+@override_settings(LOAN_DUE_SOON_DAYS=2)
+class LoanNoticeTests(TestCase):
+    def loan(self, borrower, title, due, **fields):
+        book = Catalog.objects.create(title=title, author='Author', quantity=1)
+        return Circulation.objects.create(book=book, borrower=borrower, return_date=due, **fields)
+
+    def test_one_digest_per_borrower_and_reruns_do_not_resend(self):
+        today = now().date()
+        ada = User.objects.create_user('ada@uni.test', 'ada')
+        bob = User.objects.create_user('bob@uni.test', 'bob')
+        late = self.loan(ada, 'Late', today - timedelta(days=3))
+        self.loan(ada, 'Soon', today + timedelta(days=1))
+        self.loan(ada, 'Later', today + timedelta(days=10))
+        self.loan(ada, 'Returned', today - timedelta(days=1), actual_return=today, status='returned')
+        self.loan(bob, 'Tomorrow', today + timedelta(days=1))
+
+        self.assertEqual(notices.send_notices(dry_run=True), {'sent': 2, 'loans': 3, 'failed': 0})
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(notices.send_notices(rate=0), {'sent': 2, 'loans': 3, 'failed': 0})
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['ada@uni.test', 'bob@uni.test'])
+        digest = next(message for message in mail.outbox if message.to == ['ada@uni.test'])
+        self.assertIn('Late', digest.body)
+        self.assertIn('Soon', digest.body)
+        self.assertNotIn('Later', digest.body)
+
+        self.assertEqual(notices.send_notices(rate=0)['sent'], 0)
+        self.assertEqual(len(mail.outbox), 2)
+        # A renewed loan is notified again for its new due date
+        Circulation.objects.filter(pk=late.pk).update(return_date=today + timedelta(days=2))
+        self.assertEqual(notices.send_notices(rate=0), {'sent': 1, 'loans': 1, 'failed': 0})
+        self.assertEqual(LoanNotice.objects.filter(status=LoanNotice.SENT).count(), 4)
+
+
+@override_settings(DASHBOARD_COALESCE_SECONDS=0.05)
+class DashboardStreamTests(TestCase):
+    async def connect(self, user, query=b''):
+        scope = {'type': 'websocket', 'path': '/ws/dashboard/', 'query_string': query, 'headers': [], 'user': user}
+        communicator = ApplicationCommunicator(DashboardConsumer.as_asgi(), scope)
+        await communicator.send_input({'type': 'websocket.connect'})
+        return communicator, await communicator.receive_output(1)
+
+    async def frame(self, communicator, timeout=1):
+        return json.loads((await communicator.receive_output(timeout))['text'])
+
+    def test_staff_get_bursts_as_one_frame_and_others_are_refused(self):
+        staff = User.objects.create_user('desk@uni.test', 'desk', is_staff=True)
+
+        async def scenario():
+            _, reply = await self.connect(AnonymousUser())
+            self.assertEqual(reply, {'type': 'websocket.close', 'code': 4403})
+
+            communicator, reply = await self.connect(staff, b'topics=attendance,secret')
+            self.assertEqual(reply['type'], 'websocket.accept')
+            self.assertEqual(await self.frame(communicator),
+                             {'type': 'subscribed', 'topics': ['attendance'], 'denied': ['secret']})
+            layer = get_channel_layer()
+            for number in range(3):
+                await layer.group_send(events.group_name('attendance'), {'type': 'dashboard.event', 'events': [{'n': number}]})
+            await layer.group_send(events.group_name('circulation'), {'type': 'dashboard.event', 'events': [{'n': 9}]})
+            self.assertEqual(await self.frame(communicator), {'type': 'events', 'events': [{'n': 0}, {'n': 1}, {'n': 2}]})
+            self.assertTrue(await communicator.receive_nothing(0.1))
+            await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await communicator.wait(1)
+
+        async_to_sync(scenario)()
+
+    def test_saves_are_published_on_commit(self):
+        layer = get_channel_layer()
+        async_to_sync(layer.group_add)(events.group_name('circulation'), 'test-dashboard')
+        self.addCleanup(async_to_sync(layer.group_discard), events.group_name('circulation'), 'test-dashboard')
+        borrower = User.objects.create_user('loan@uni.test', 'loan')
+        book = Catalog.objects.create(title='Dune', author='Herbert', quantity=1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            loan = Circulation.objects.create(book=book, borrower=borrower, status='borrowed')
+            Attendance.objects.create(user=borrower)
+        message = async_to_sync(layer.receive)('test-dashboard')
+        self.assertEqual(message['events'][0]['event'], 'checkout')
+        self.assertEqual(message['events'][0]['id'], str(loan.pk))
+        self.assertEqual(events.allowed_topics(borrower), set())
+        self.assertEqual(events.allowed_topics(User.objects.create_superuser('root@uni.test', 'root', 'x')),
+                         {'circulation', 'attendance'})
+
+
+    def test_a_failing_channel_layer_never_fails_the_write(self):
+        borrower = User.objects.create_user('loan@uni.test', 'loan')
+        book = Catalog.objects.create(title='Dune', author='Herbert', quantity=1)
+        layer = get_channel_layer()
+        with mock.patch.object(layer, 'group_send', side_effect=ConnectionError("redis is down")), \
+                self.assertLogs('main.events', 'ERROR') as logs, self.captureOnCommitCallbacks(execute=True):
+            Circulation.objects.create(book=book, borrower=borrower, status='borrowed')
+        self.assertIn('circulation', logs.output[0])
+        self.assertEqual(Circulation.objects.filter(borrower=borrower).count(), 1)
+
+@override_settings(DELTA_SYNC_SETTLE_SECONDS=0)
+class ChangeFeedTests(TestCase):
+    def test_catalog_pages_then_deltas_with_tombstones(self):
+        admin = User.objects.create_superuser('sync@uni.test', 'sync', 'x')
+        client = Client(HTTP_AUTHORIZATION=f"JWT {AccessToken.for_user(admin)}")
+        _, second, third = [Catalog.objects.create(title=title, notes='long text') for title in 'ABC']
+
+        page = client.get('/api/catalog/changes/', {'limit': 2}).json()
+        self.assertEqual(([row['title'] for row in page['changed']], page['more']), (['A', 'B'], True))
+        self.assertNotIn('notes', page['changed'][0])
+        page = client.get('/api/catalog/changes/', {'limit': 2, 'cursor': page['cursor']}).json()
+        self.assertEqual(([row['title'] for row in page['changed']], page['deleted'], page['more']), (['C'], [], False))
+
+        second.title = 'B2'
+        second.save(update_fields=['title'])
+        deleted = str(third.pk)
+        third.delete()
+        delta = client.get('/api/catalog/changes/', {'cursor': page['cursor']}).json()
+        self.assertEqual([row['title'] for row in delta['changed']], ['B2'])
+        self.assertEqual(delta['deleted'], [deleted])
+        quiet = client.get('/api/catalog/changes/', {'cursor': delta['cursor']}).json()
+        self.assertEqual((quiet['changed'], quiet['deleted']), ([], []))
+
+        self.assertEqual(client.get('/api/catalog/changes/', {'cursor': 'nonsense'}).status_code, 400)
+        Tombstone.objects.update(deleted_at=now() - timedelta(days=365))
+        stale = changefeed.encode_cursor(None, (now() - timedelta(days=365), 0))
+        self.assertEqual(client.get('/api/catalog/changes/', {'cursor': stale}).status_code, 410)
+
+    def test_deactivated_users_leave_the_public_feed(self):
+        ada = User.objects.create_user('ada@sync.test', 'ada')
+        cursor = Client().get('/api/public-users/changes/').json()['cursor']
+        ada.is_active = False
+        ada.save(update_fields=['is_active'])
+        delta = Client().get('/api/public-users/changes/', {'cursor': cursor}).json()
+        self.assertEqual((delta['changed'], delta['deleted']), ([], [str(ada.pk)]))
+
+
+class KioskBatchTests(TestCase):
+    def test_scans_are_recorded_once_with_per_scan_outcomes(self):
+        kiosk_user = User.objects.create_user('gate@uni.test', 'gate', is_staff=True)
+        ada = User.objects.create_user('ada@kiosk.test', 'ada', barcode='PAT-1')
+        client = Client(HTTP_AUTHORIZATION=f"JWT {AccessToken.for_user(kiosk_user)}")
+        start = now() - timedelta(hours=2)
+        scans = [
+            {'key': 'k1', 'barcode': 'PAT-1', 'scanned_at': start.isoformat(), 'sign_type': 'signin'},
+            {'key': 'k2', 'barcode': 'PAT-1', 'scanned_at': (start + timedelta(seconds=20)).isoformat()},
+            {'key': 'k3', 'barcode': 'PAT-1', 'scanned_at': (start + timedelta(hours=1)).isoformat()},
+            {'key': 'k1', 'barcode': 'PAT-1', 'scanned_at': start.isoformat()},
+            {'key': 'k4', 'barcode': 'NOBODY', 'scanned_at': start.isoformat()},
+            {'key': 'k5', 'barcode': 'PAT-1', 'scanned_at': 'yesterday'},
+            {'key': 'k6', 'barcode': 'PAT-1', 'scanned_at': start.isoformat(), 'sign_type': ['signin']},
+        ]
+
+        body = client.post('/api/attendance/batch/', {'scans': scans}, content_type='application/json').json()
+        self.assertEqual(body['created'], 2)
+        self.assertEqual([result['status'] for result in body['results']],
+                         ['created', 'recent', 'created', 'duplicate', 'unknown_barcode', 'invalid', 'invalid'])
+        self.assertEqual((body['results'][5]['key'], body['results'][6]['key']), ('k5', 'k6'))
+        self.assertEqual(body['results'][3]['id'], body['results'][0]['id'])
+        first = Attendance.objects.get(client_key='k1')
+        self.assertEqual((first.user, first.created_at, first.sign_type), (ada, start, 'signin'))
+
+        replay = client.post('/api/attendance/batch/', {'scans': scans[:3]}, content_type='application/json').json()
+        self.assertEqual(replay['created'], 0)
+        self.assertEqual([result['status'] for result in replay['results']], ['duplicate', 'recent', 'duplicate'])
+        self.assertEqual(Attendance.objects.count(), 2)
+
+
+class IdempotencyTests(TestCase):
+    def test_retried_checkout_is_replayed_not_repeated(self):
+        admin = User.objects.create_superuser('desk@idem.test', 'desk', 'x')
+        User.objects.create_user('ada@idem.test', 'ada', barcode='PAT-9')
+        Catalog.objects.create(title='Dune', barcode='LIB-9', quantity=2)
+        client = Client(HTTP_AUTHORIZATION=f"JWT {AccessToken.for_user(admin)}")
+        checkout = {'user_barcode': 'PAT-9', 'book_barcode': 'LIB-9', 'status': 'borrowed'}
+
+        first = client.post('/api/circulation/', checkout, content_type='application/json', HTTP_IDEMPOTENCY_KEY='k-1')
+        retry = client.post('/api/circulation/', checkout, content_type='application/json', HTTP_IDEMPOTENCY_KEY='k-1')
+        self.assertEqual((first.status_code, retry.status_code), (201, 201))
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Circulation.objects.count(), 1)
+
+        other = dict(checkout, status='reserve')
+        self.assertEqual(client.post('/api/circulation/', other, content_type='application/json',
+                                     HTTP_IDEMPOTENCY_KEY='k-1').status_code, 422)
+        client.post('/api/circulation/', checkout, content_type='application/json')
+        self.assertEqual(Circulation.objects.count(), 2)  # no key, no deduplication
+
+    def test_concurrent_duplicate_waits_and_expired_keys_are_reclaimed(self):
+        record = idempotency.claim(None, 'k-2', 'print')
+        with self.assertRaises(idempotency.KeyInProgress):
+            idempotency.claim(None, 'k-2', 'print')
+        IdempotencyKey.objects.filter(pk=record.pk).update(expires_at=now() - timedelta(seconds=1))
+        self.assertNotEqual(idempotency.claim(None, 'k-2', 'print').pk, record.pk)
+
+
+class RateLimitTests(TestCase):
+    @override_settings(RATELIMIT_POLICIES={'public-users': {'rate': '1/min', 'burst': 3, 'by': 'ip'}})
+    def test_public_list_answers_429_with_retry_after_once_the_burst_is_spent(self):
+        codes = [Client().get('/api/public-users/').status_code for _ in range(4)]
+        self.assertEqual(codes, [200, 200, 200, 429])
+        limited = Client().get('/api/public-users/')
+        self.assertTrue(50 <= int(limited['Retry-After']) <= 60)
+        self.assertEqual(Client(REMOTE_ADDR='10.0.0.2').get('/api/public-users/').status_code, 200)
+
+    def test_login_attempts_are_limited_per_account_across_addresses(self):
+        User.objects.create_user('ada@rate.test', 'ada', password='right')
+        codes = [Client(REMOTE_ADDR=f"10.0.1.{i}").post('/api/auth/jwt/create/', {'username': 'Ada', 'password': 'wrong'})
+                 .status_code for i in range(6)]
+        self.assertEqual(codes, [401] * 5 + [429])
+        self.assertEqual(Client().post('/api/auth/jwt/create/', {'username': 'bob', 'password': 'x'}).status_code, 401)
+
+    def test_bucket_refills_at_its_rate(self):
+        self.assertEqual(ratelimit.parse_rate('30/min'), 0.5)
+        self.assertEqual(ratelimit.take('t', '10/s', 1), 0)
+        self.assertGreater(ratelimit.take('t', '10/s', 1), 0)
+        time.sleep(0.101)
+        self.assertEqual(ratelimit.take('t', '10/s', 1), 0)
+
+    def test_database_buckets_are_single_rows_and_pruned_once_refilled(self):
+        self.assertIsNone(settings.RATELIMIT_CACHE)
+        for _ in range(3):
+            self.assertEqual(ratelimit.take('rows', '1/min', 3), 0)
+        self.assertTrue(59 <= ratelimit.take('rows', '1/min', 3) <= 60)
+        bucket = RateLimitBucket.objects.get()
+        self.assertEqual(bucket.key, 'ratelimit:rows')
+        RateLimitBucket.objects.update(tat=0)
+        with mock.patch.object(ratelimit, '_last_prune', 0.0):
+            self.assertEqual(ratelimit.take('other', '1/min', 1), 0)
+        self.assertEqual(list(RateLimitBucket.objects.values_list('key', flat=True)), ['ratelimit:other'])
+
+    def test_migration_creates_the_database_cache_table(self):
+        migration = importlib.import_module('main.migrations.0019_ratelimit_buckets_cache_table')
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE django_cache')
+        migration.create_cache_tables(apps, mock.Mock(connection=connection))
+        self.assertIn('django_cache', connection.introspection.table_names())
+        caches['shared'].set('k', 1)
+        self.assertEqual(caches['shared'].get('k'), 1)
+
+
+class ConcurrentRateLimitTests(TransactionTestCase):
+    def test_database_buckets_hold_under_concurrent_requests(self):
+        def attempt(_):
+            try:
+                return ratelimit.take('burst', '1/min', 3) == 0
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            allowed = sum(executor.map(attempt, range(8)))
+        self.assertEqual(allowed, 3)
+
+
+class HoldQueueTests(TestCase):
+    def setUp(self):
+        admin = User.objects.create_superuser('desk@holds.test', 'desk', 'x')
+        self.client = Client(HTTP_AUTHORIZATION=f"JWT {AccessToken.for_user(admin)}")
+        self.book = Catalog.objects.create(title='Dune', barcode='LIB-1', quantity=1)
+        for name in ('ada', 'bob', 'cy'):
+            User.objects.create_user(f'{name}@holds.test', name, barcode=f'PAT-{name}')
+
+    def post(self, patron, status):
+        return self.client.post('/api/circulation/', {'user_barcode': f'PAT-{patron}', 'book_barcode': 'LIB-1',
+                                                      'status': status}, content_type='application/json')
+
+    def test_returned_copy_goes_to_the_head_of_the_queue_not_a_walk_up(self):
+        loan = self.post('ada', 'borrowed').json()
+        self.assertEqual(self.post('bob', 'reserve').json()['status'], 'reserve')
+        self.assertEqual(self.post('cy', 'borrowed').status_code, 400)
+
+        returned = self.client.post(f"/api/circulation/{loan['id']}/return/").json()
+        self.assertEqual(returned['allocated_hold']['status'], 'ready')
+        self.assertEqual(self.post('cy', 'borrowed').status_code, 400)
+        collected = self.post('bob', 'borrowed')
+        self.assertEqual((collected.status_code, collected.json()['id']), (201, returned['allocated_hold']['id']))
+
+    def test_checkout_rechecks_availability_under_the_lock(self):
+        ada, bob = User.objects.get(username='ada'), User.objects.get(username='bob')
+        holds.checkout(self.book, ada)
+        with self.assertRaises(holds.NoCopyAvailable):
+            holds.checkout(self.book, bob)
+
+    def test_holds_cannot_be_returned(self):
+        hold = self.post('ada', 'reserve').json()  # the free copy is allocated straight away
+        self.assertEqual(self.client.post(f"/api/circulation/{hold['id']}/return/").status_code, 400)
+        self.assertEqual(Circulation.objects.get(pk=hold['id']).status, 'ready')
+
+    def test_returns_through_put_serve_the_queue_and_hold_statuses_cannot_be_set(self):
+        loan = self.post('ada', 'borrowed').json()
+        hold = self.post('bob', 'reserve').json()
+        body = {'user_barcode': 'PAT-ada', 'book_barcode': 'LIB-1', 'status': 'returned'}
+        returned = self.client.put(f"/api/circulation/{loan['id']}/", body, content_type='application/json')
+
+        self.assertEqual((returned.status_code, returned.json()['status']), (200, 'returned'))
+        self.assertEqual(Circulation.objects.get(pk=hold['id']).status, 'ready')
+        body['status'] = 'reserve'
+        self.assertEqual(self.client.put(f"/api/circulation/{loan['id']}/", body,
+                                         content_type='application/json').status_code, 400)
+
+    def test_legacy_holds_get_a_reservation_time_and_a_position(self):
+        bob = User.objects.get(username='bob')
+        holds.checkout(self.book, User.objects.get(username='ada'))
+        legacy = Circulation.objects.create(book=self.book, borrower=bob, status='reserve', borrow_date='2025-03-01')
+        importlib.import_module('main.migrations.0018_backfill_hold_reserved_at').backfill_reserved_at(apps, None)
+        legacy.refresh_from_db()
+        self.assertEqual(legacy.reserved_at.date().isoformat(), '2025-03-01')
+        self.assertEqual(self.client.get(f"/api/circulation/{legacy.pk}/position/").json()['position'], 1)
+
+
+@skipUnless(connection.features.has_select_for_update, "needs row locks (SELECT ... FOR UPDATE)")
+class ConcurrentCheckoutTests(TransactionTestCase):
+    def test_concurrent_checkouts_never_lend_more_copies_than_exist(self):
+        book = Catalog.objects.create(title='Dune', barcode='LIB-2', quantity=2)
+        patrons = [User.objects.create_user(f'p{i}@holds.test', f'p{i}') for i in range(8)]
+
+        def borrow(patron):
+            try:
+                holds.checkout(book, patron)
+                return True
+            except holds.NoCopyAvailable:
+                return False
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=len(patrons)) as executor:
+            lent = sum(executor.map(borrow, patrons))
+        self.assertEqual(lent, 2)
+        self.assertEqual(holds.copies_in_use(book), 2)
+
+
+class DutyRosterTests(TestCase):
+    def setUp(self):
+        admin = User.objects.create_superuser('desk@roster.test', 'desk', 'x')
+        self.client = Client(HTTP_AUTHORIZATION=f"JWT {AccessToken.for_user(admin)}")
+        self.staff = [User.objects.create_user(f's{i}@roster.test', f's{i}', staff_category='staff') for i in range(2)]
+
+    def generate(self, **params):
+        return self.client.post('/api/duty/generate/', {'start': '2026-03-02', 'end': '2026-03-03', **params},
+                                content_type='application/json')
+
+    def test_roster_spreads_shifts_and_skips_existing_bookings(self):
+        Duty.objects.create(user=self.staff[0], date='2026-03-02', shift='Morning')
+        response = self.generate(staff=[str(user.pk) for user in self.staff], shifts=['Morning', 'Evening'])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['gaps'], [])
+        self.assertEqual(Duty.objects.count(), 4)
+        self.assertEqual(sorted(Duty.objects.filter(user=user).count() for user in self.staff), [2, 2])
+
+        conflicts = self.client.post('/api/duty/conflicts/', [
+            {'user': str(self.staff[0].pk), 'date': '2026-03-02', 'shift': 'Morning'},
+            {'user': str(self.staff[0].pk), 'date': '2026-03-09', 'shift': 'Morning'},
+        ], content_type='application/json').json()['conflicts']
+        self.assertEqual([(row['date'], row['shift']) for row in conflicts], [('2026-03-02', 'Morning')])
+
+    def test_rows_lost_to_a_concurrent_booking_are_not_reported_as_created(self):
+        plan = roster.generate_roster
+
+        def plan_then_race(*args, **kwargs):
+            planned, gaps = plan(*args, **kwargs)
+            Duty.objects.create(user_id=planned[0].user_id, date=planned[0].date, shift=planned[0].shift)
+            return planned, gaps
+
+        with mock.patch.object(roster, 'generate_roster', side_effect=plan_then_race):
+            response = self.generate(staff=[str(user.pk) for user in self.staff], shifts=['Morning'])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.json()['created'], len(response.json()['duties'])), (1, 1))
+        self.assertEqual(Duty.objects.count(), 2)
+
+    def test_unknown_or_malformed_staff_ids_are_rejected(self):
+        self.assertEqual(self.generate(staff=['abc']).status_code, 400)
+        self.assertEqual(self.generate(staff=['999999']).status_code, 400)
+        self.assertEqual(Duty.objects.count(), 0)
+
+
+class AcquisitionSpendTests(TestCase):
+    def test_legacy_acquisitions_are_backfilled_and_can_be_edited_and_deleted(self):
+        # Recorded before running totals existed
+        legacy = [Acquisition.objects.create(title=f"Old {i}", source='purchase', supplier='Acme', amount='10.00',
+                                             date_acquired='2025-01-01') for i in range(2)]
+        migration = importlib.import_module('main.migrations.0011_acquisition_accessioning')
+        migration.backfill_spend(apps, None)
+        spend = AcquisitionSpend.objects.get(supplier='Acme', source='purchase')
+        self.assertEqual((spend.total_amount, spend.item_count), (20, 2))
+
+        admin = User.objects.create_superuser('desk@spend.test', 'desk', 'x')
+        client = Client(HTTP_AUTHORIZATION=f"JWT {AccessToken.for_user(admin)}")
+        updated = client.patch(f'/api/acquisition/{legacy[0].pk}/', {'amount': '15.00', 'quantity': 3},
+                               content_type='application/json')
+        self.assertEqual(updated.status_code, 200)
+        self.assertEqual(client.delete(f'/api/acquisition/{legacy[1].pk}/').status_code, 204)
+        spend.refresh_from_db()
+        self.assertEqual((spend.total_amount, spend.item_count), (15, 3))
+
+
+class AccessioningTests(TestCase):
+    def setUp(self):
+        admin = User.objects.create_superuser('desk@accession.test', 'desk', 'x')
+        self.client = Client(HTTP_AUTHORIZATION=f"JWT {AccessToken.for_user(admin)}")
+        self.existing = Catalog.objects.create(title='Known', isbn='978-0-306-40615-7', isbn13='9780306406157',
+                                               quantity=1)
+
+    def accession(self, items, **params):
+        return self.client.post('/api/acquisition/accession/', {'items': items, 'supplier': 'Acme', **params},
+                                content_type='application/json')
+
+    def test_mixed_manifest_commits_good_lines_and_reports_bad_ones(self):
+        response = self.accession([
+            {'isbn': 9780306406157, 'quantity': 2, 'amount': '12.50'},  # numeric ISBN of a held title
+            {'title': 'New Title', 'isbn': '0-19-852663-6', 'amount': 8},
+            {'title': 'New Title', 'isbn': '9780198526636', 'quantity': '3'},
+            {'title': 'Zero', 'quantity': 0},
+            {'quantity': 1},
+            {'title': 'Swapped', 'source': 'theft'},
+            {'title': 'Dated', 'date_acquired': 'someday'},
+        ])
+
+        self.assertEqual(response.status_code, 201, response.content)
+        result = response.json()
+        self.assertEqual((result['acquisitions'], result['created'], result['incremented']), (3, 1, 1))
+        self.assertEqual([error['line'] for error in result['errors']], [4, 5, 6, 7])
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.quantity, 3)
+        self.assertEqual(Catalog.objects.get(isbn13='9780198526636').quantity, 4)
+        spend = AcquisitionSpend.objects.get(supplier='Acme', source='purchase')
+        self.assertEqual((spend.total_amount, spend.item_count), (Decimal('20.50'), 6))
+
+    def test_a_line_the_database_rejects_does_not_stop_the_rest(self):
+        create = Catalog.objects.bulk_create
+
+        def reject_broken(catalogs, *args, **kwargs):
+            if any(catalog.title == 'Broken' for catalog in catalogs):
+                raise IntegrityError("broken line")
+            return create(catalogs, *args, **kwargs)
+
+        with mock.patch.object(Catalog.objects, 'bulk_create', side_effect=reject_broken):
+            result = accessioning.accession_manifest([{'title': 'Fine'}, {'title': 'Broken'}, {'title': 'Also fine'}],
+                                                     chunk_size=10)
+        self.assertEqual((result['created'], result['acquisitions']), (2, 2))
+        self.assertEqual(result['errors'], [{'line': 2, 'error': 'broken line'}])
+        self.assertEqual(sorted(Acquisition.objects.values_list('title', flat=True)), ['Also fine', 'Fine'])
+
+    def test_background_job_accessions_the_manifest(self):
+        response = self.accession([{'title': 'Queued', 'quantity': 2}], background=True)
+        self.assertEqual(response.status_code, 202)
+        jobs.execute(jobs.claim('test-worker'))
+        job = Job.objects.get(pk=response.json()['id'])
+        self.assertEqual((job.status, job.result['created']), (Job.SUCCEEDED, 1))
+        self.assertEqual(Catalog.objects.get(title='Queued').quantity, 2)
+
+
+class CatalogIdentifierTests(TestCase):
+    def test_records_left_without_a_canonical_isbn_stay_editable(self):
+        # What backfill_identifiers leaves behind for two records with the same ISBN
+        kept, duplicate = Catalog.objects.bulk_create([
+            Catalog(title='First', isbn='0-306-40615-2', isbn13='9780306406157'),
+            Catalog(title='Second', isbn='978-0-306-40615-7'),
+        ])
+        admin = User.objects.create_superuser('desk@isbn.test', 'desk', 'x')
+        client = Client(HTTP_AUTHORIZATION=f"JWT {AccessToken.for_user(admin)}")
+
+        response = client.patch(f'/api/catalog/{duplicate.pk}/', {'title': 'Second copy'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        duplicate = Catalog.objects.get(pk=duplicate.pk)
+        duplicate.notes = 'Shelved in annex'
+        duplicate.save()
+        self.assertIsNone(duplicate.isbn13)
+
+        self.assertEqual(client.patch(f'/api/catalog/{duplicate.pk}/', {'isbn': '0306406152'},
+                                      content_type='application/json').status_code, 400)
+        response = client.patch(f'/api/catalog/{duplicate.pk}/', {'isbn': '978-1-4028-9462-6'}, content_type='application/json')
+        self.assertEqual(response.json()['isbn13'], '9781402894626')
+        self.assertEqual(Catalog.objects.get(pk=kept.pk).isbn13, '9780306406157')
+
+
+@override_settings(TYPEAHEAD_REFRESH_SECONDS=0, DELTA_SYNC_SETTLE_SECONDS=0)
+class TypeaheadTests(TestCase):
+    def setUp(self):
+        self.index = typeahead.TypeaheadIndex()
+
+    def titles(self, query):
+        return [row['title'] for row in self.index.suggest(query)]
+
+    def test_prefixes_and_typos_match(self):
+        Catalog.objects.create(title='Foundation and Empire', author='Isaac Asimov')
+        Catalog.objects.create(title='Things Fall Apart', author='Chinua Achebe')
+        self.index.sync()
+        self.assertEqual(self.titles('found'), ['Foundation and Empire'])
+        self.assertEqual(self.titles('fundation'), ['Foundation and Empire'])
+        self.assertEqual(self.titles('achbe thin'), ['Things Fall Apart'])
+
+    def test_sync_picks_up_other_workers_writes_including_equal_timestamps_and_deletions(self):
+        _, second = Catalog.objects.bulk_create([
+            Catalog(id=uuid.UUID(int=1), title='Dune'),
+            Catalog(id=uuid.UUID(int=3), title='Emma'),
+        ])
+        self.index.sync()
+        cursor_time = self.index.cursor[0]
+        # Written behind this index's back: a row stamped the same moment as the cursor, and a deletion
+        Catalog.objects.bulk_create([Catalog(id=uuid.UUID(int=4), title='Beloved')])
+        Catalog.objects.filter(pk=uuid.UUID(int=4)).update(updated_at=cursor_time)
+        second.delete()
+
+        self.index.sync()
+        self.assertEqual(self.titles('beloved'), ['Beloved'])
+        self.assertEqual(self.titles('emma'), [])
+        self.assertEqual(self.index.known, {str(uuid.UUID(int=1)), str(uuid.UUID(int=4))})
+
+    @override_settings(DELTA_SYNC_SETTLE_SECONDS=60)
+    def test_late_commits_with_earlier_timestamps_are_not_skipped(self):
+        recent = Catalog.objects.create(title='Dune')
+        Catalog.objects.filter(pk=recent.pk).update(updated_at=now() - timedelta(seconds=20))
+        self.index.sync()
+        self.assertIsNone(self.index.cursor)  # nothing has settled yet
+        # Commits after the sync, stamped before the newest row the index has seen
+        late = Catalog.objects.create(title='Emma')
+        Catalog.objects.filter(pk=late.pk).update(updated_at=now() - timedelta(seconds=30))
+
+        self.index.sync()
+        self.assertEqual(self.titles('emma'), ['Emma'])
+        Catalog.objects.filter(pk__in=[recent.pk, late.pk]).update(updated_at=now() - timedelta(seconds=90))
+        self.index.sync()
+        self.assertEqual(self.index.cursor[1], max(recent.pk, late.pk))
+
+    def test_suggestions_are_answered_while_another_request_syncs(self):
+        Catalog.objects.create(title='Dune')
+        self.index.sync()
+        Catalog.objects.bulk_create([Catalog(title='Emma')])
+        with self.index.sync_lock:  # a sync or rebuild in progress
+            started = time.monotonic()
+            self.index.sync()
+            self.assertEqual(self.titles('dune'), ['Dune'])
+            self.assertLess(time.monotonic() - started, 1)
+        self.index.sync()
+        self.assertEqual(self.titles('emma'), ['Emma'])
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        self.enterContext(override_settings(PERF_SAMPLE_RATE=0, PERF_METRICS_TOKEN='scrape'))
+        self.registry = instrumentation.MetricsRegistry()
+        self.original, instrumentation.registry = instrumentation.registry, self.registry
+        self.addCleanup(setattr, instrumentation, 'registry', self.original)
+        self.admin = User.objects.create_superuser('desk@perf.test', 'desk', 'x')
+        self.patron = User.objects.create_user('ada@perf.test', 'ada', 'x')
+
+    def get(self, user=None, **headers):
+        if user is not None:
+            headers['HTTP_AUTHORIZATION'] = f"JWT {AccessToken.for_user(user)}"
+        return Client(**headers).get('/api/public-users/')
+
+    def test_timings_are_only_shown_to_staff(self):
+        response = self.get(self.admin, HTTP_X_SERVER_TIMING='1')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", .*total;dur=')
+        self.assertNotIn('Server-Timing', self.get(HTTP_X_SERVER_TIMING='1'))
+        self.assertNotIn('Server-Timing', self.get(self.patron, HTTP_X_SERVER_TIMING='1'))
+        # None was sampled: asking for timings does not add a request to the histograms
+        self.assertNotIn('http_request_duration_seconds_count', self.registry.render())
+
+    @override_settings(PERF_SAMPLE_RATE=1)
+    def test_sampled_requests_are_recorded_without_exposing_timings(self):
+        self.assertNotIn('Server-Timing', self.get())
+        self.assertIn('http_request_db_queries_count{view="PublicUserListViewSet",action="list",status="200"} 1',
+                      self.registry.render())
+
+    def test_metrics_need_staff_or_the_scrape_token(self):
+        self.assertEqual(Client().get('/api/metrics/').status_code, 401)
+        self.assertEqual(Client(HTTP_X_METRICS_TOKEN='scrape').get('/api/metrics/').status_code, 200)
+
+
+@override_settings(QUERYWATCH_STRICT=True, NPLUSONE_THRESHOLD=5)
+class QueryWatchTests(TestCase):
+    urls = ['/api/attendance/', '/api/circulation/', '/api/acquisition/', '/api/users/', '/api/groups/']
+
+    def setUp(self):
+        admin = User.objects.create_superuser('desk@nplus.test', 'desk', 'x')
+        self.client = Client(HTTP_AUTHORIZATION=f"JWT {AccessToken.for_user(admin)}")
+        permissions = list(Permission.objects.all()[:3])
+        for i in range(8):
+            patron = User.objects.create_user(f'p{i}@nplus.test', f'p{i}', barcode=f'NP{i}')
+            group = Group.objects.create(name=f'Group {i}')
+            group.permissions.set(permissions)
+            patron.groups.add(group)
+            patron.user_permissions.set(permissions)
+            book = Catalog.objects.create(title=f'Book {i}', barcode=f'NPB{i}')
+            Attendance.objects.create(user=patron)
+            Circulation.objects.create(book=book, borrower=patron)
+            Acquisition.objects.create(title=f'Book {i}', source='purchase', date_acquired='2026-01-01', added_by=patron)
+
+    def test_list_endpoints_run_a_fixed_number_of_queries(self):
+        # The middleware raises NPlusOneError under QUERYWATCH_STRICT
+        for fast in (True, False):
+            with mock.patch.object(FastListMixin, 'use_fast_list', return_value=fast):
+                for url in self.urls:
+                    with self.subTest(url=url, fast=fast):
+                        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_strict_watch_raises_on_per_row_queries(self):
+        with self.assertRaises(querywatch.NPlusOneError), querywatch.watch(strict=True):
+            [attendance.user.username for attendance in Attendance.objects.all()]
+
+
+class FastListTests(TestCase):
+    queries = [
+        '/api/attendance/', '/api/attendance/?fields=id,user,created_at', '/api/attendance/?omit=user',
+        '/api/catalog/', '/api/catalog/?fields=title,notes,updated_at', '/api/catalog/?omit=barcode,isbn13',
+        '/api/circulation/', '/api/circulation/?fields=borrower,fine,status', '/api/circulation/?omit=borrower',
+        '/api/acquisition/', '/api/acquisition/?fields=amount,catalog', '/api/acquisition/?omit=added_by',
+        '/api/duty/', '/api/duty/?fields=user,date', '/api/messages/', '/api/messages/?omit=content',
+    ]
+
+    def setUp(self):
+        admin = User.objects.create_superuser('desk@fast.test', 'desk', 'x')
+        self.client = Client(HTTP_AUTHORIZATION=f"JWT {AccessToken.for_user(admin)}")
+        ada = User.objects.create_user('ada@fast.test', 'ada', first_name='Adá', barcode='FP-1', faculty='Science')
+        book = Catalog.objects.create(title='Dune \u2028 \u00e9', isbn='0306406152', notes='Long notes', year=1965)
+        Catalog.objects.create(title=None, quantity=3)
+        Attendance.objects.create(user=ada, purpose='study')
+        Circulation.objects.create(book=book, borrower=ada, borrow_date='2026-01-02', fine='12.50')
+        Circulation.objects.create(book=book, borrower=None, status='reserve', reserved_at=now())
+        Acquisition.objects.create(title='Dune', source='purchase', amount='19.99', date_acquired='2026-01-01',
+                                   added_by=ada, catalog=book)
+        Acquisition.objects.create(title='Gift', source='donation', date_acquired='2026-01-01')
+        Duty.objects.create(user=ada, date='2026-01-05', shift='Morning')
+        Message.objects.create(sender=admin, receiver=ada, content='Hello "there"')
+
+    def test_fast_lists_match_the_serializer_byte_for_byte(self):
+        for url in self.queries:
+            responses = []
+            for fast in (True, False):
+                with mock.patch.object(FastListMixin, 'use_fast_list', return_value=fast):
+                    responses.append(self.client.get(url))
+            with self.subTest(url=url):
+                self.assertEqual([response.status_code for response in responses], [200, 200])
+                self.assertFalse(hasattr(responses[0], 'data'))  # rendered by the fast path, not a DRF Response
+                self.assertEqual(responses[0].content, responses[1].content)
+                self.assertTrue(json.loads(responses[0].content))
+
+
+class SparseFieldsTests(TestCase):
+    def setUp(self):
+        admin = User.objects.create_superuser('desk@fields.test', 'desk', 'x')
+        self.client = Client(HTTP_AUTHORIZATION=f"JWT {AccessToken.for_user(admin)}")
+        self.book = Catalog.objects.create(title='Dune', author='Herbert', notes='Long notes', marc_tag='245 $a Dune')
+
+    def test_lists_leave_out_large_columns_unless_named(self):
+        row = self.client.get('/api/catalog/').json()[0]
+        self.assertEqual(row['title'], 'Dune')
+        self.assertFalse({'notes', 'marc_tag', 'dublin_core', 'ai_suggestion', 'contributors', 'tags'} & set(row))
+        self.assertEqual(self.client.get('/api/catalog/?fields=title,notes').json(), [{'title': 'Dune', 'notes': 'Long notes'}])
+        self.assertIn('notes', self.client.get(f'/api/catalog/{self.book.pk}/').json())
+
+    def test_fields_and_omit_select_columns(self):
+        detail = self.client.get(f'/api/catalog/{self.book.pk}/?omit=notes,marc_tag').json()
+        self.assertNotIn('notes', detail)
+        self.assertEqual(detail['author'], 'Herbert')
+        self.assertEqual(self.client.get(f'/api/catalog/{self.book.pk}/?fields=id,nope').json(), {'id': str(self.book.pk)})
+        # Writes are not trimmed
+        response = self.client.patch(f'/api/catalog/{self.book.pk}/?fields=id', {'notes': 'New'}, content_type='application/json')
+        self.assertEqual(response.json()['notes'], 'New')
+
+    def test_dropped_columns_are_not_fetched(self):
+        with mock.patch.object(FastListMixin, 'use_fast_list', return_value=False), CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/catalog/?fields=title')
+        catalog_sql = [query['sql'] for query in queries if 'FROM "main_catalog"' in query['sql']]
+        self.assertEqual(len(catalog_sql), 1)
+        self.assertNotIn('"notes"', catalog_sql[0])
+        self.assertNotIn('"marc_tag"', catalog_sql[0])
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('desk@async.test', 'desk', 'x')
+        self.ada = User.objects.create_user('ada@async.test', 'ada', 'x')
+        self.bob = User.objects.create_user('bob@async.test', 'bob', 'x')
+        Catalog.objects.create(title='Dune', author='Frank Herbert', isbn='0306406152', notes='Long notes')
+        Catalog.objects.create(title='Emma', author='Jane Austen')
+        Attendance.objects.create(user=self.ada)
+        Attendance.objects.create(user=self.bob)
+        Message.objects.create(sender=self.ada, receiver=self.admin, content='Hi')
+        Message.objects.create(sender=self.bob, receiver=self.admin, content='Hello')
+
+    def client_for(self, user):
+        return Client(HTTP_AUTHORIZATION=f"JWT {AccessToken.for_user(user)}")
+
+    def test_async_catalog_list_matches_the_sync_view(self):
+        self.assertEqual(Client().get('/api/async/catalog/').status_code, 401)
+        self.assertEqual(self.client_for(self.ada).get('/api/async/catalog/').status_code, 403)
+        client = self.client_for(self.admin)
+        for query in ('', '?fields=title,notes'):
+            self.assertEqual(client.get(f'/api/async/catalog/{query}').content, client.get(f'/api/catalog/{query}').content)
+        found = client.get('/api/async/catalog/search/', {'q': '978-0-306-40615-7'}).json()
+        self.assertEqual([row['title'] for row in found], ['Dune'])
+        self.assertEqual(client.get('/api/async/catalog/search/').json(), [])
+
+    def test_patrons_only_see_their_own_rows(self):
+        client = self.client_for(self.ada)
+        self.assertEqual([row['user']['username'] for row in client.get('/api/async/attendance/').json()], ['ada'])
+        self.assertEqual([row['content'] for row in client.get('/api/async/messages/').json()], ['Hi'])
+        self.assertEqual(client.get('/api/async/messages/', {'user1_id': self.bob.pk}).json(), [])
+        history = self.client_for(self.admin).get('/api/async/messages/', {'user1_id': self.bob.pk, 'user2_id': self.admin.pk})
+        self.assertEqual([row['content'] for row in history.json()], ['Hello'])
+
+    def test_malformed_user_ids_are_a_bad_request(self):
+        response = self.client_for(self.admin).get('/api/async/messages/', {'user1_id': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'detail': 'user1_id and user2_id must be user ids'})
+
+
+class StartupCheckTests(SimpleTestCase):
+    def test_process_local_channel_layer_is_reported(self):
+        self.assertEqual([message.id for message in checks.channel_layer_check(None)], ['main.W001'])
+        redis = {'default': {'BACKEND': 'channels_redis.core.RedisChannelLayer', 'CONFIG': {'hosts': ['redis://cache']}}}
+        with override_settings(CHANNEL_LAYERS=redis):
+            self.assertEqual(checks.channel_layer_check(None), [])
+        with self.assertLogs('main.checks', 'WARNING') as logs:
+            checks.log_startup_warnings()
+        self.assertIn('main.W001', logs.output[0])
+        with override_settings(SILENCED_SYSTEM_CHECKS=['main.W001']), self.assertNoLogs('main.checks'):
+            checks.log_startup_warnings()
+
+    def test_process_local_caches_for_shared_state_are_reported(self):
+        self.assertEqual(checks.shared_cache_check(None), [])
+        with override_settings(RATELIMIT_CACHE='default', REPLICA_DATABASES=['replica1'], REPLICA_PIN_CACHE='default'):
+            messages = checks.shared_cache_check(None)
+        self.assertEqual([message.id for message in messages], ['main.W002', 'main.W003'])
+        self.assertIn('REPLICA_PIN_CACHE', messages[0].msg)
+        self.assertIn('RATELIMIT_CACHE', messages[1].msg)
+
+
+class StartupProfileTests(SimpleTestCase):
+    def test_lazy_include_loads_patterns_on_first_resolve(self):
+        from django.urls import path as url_path
+
+        calls = []
+
+        def lazy_urls():
+            calls.append(1)
+            return [url_path('ping/', lambda request: None, name='ping')]
+
+        resolver = startup.lazy_include('lazy/', lazy_urls, namespace='lazy')
+        self.assertEqual(calls, [])
+        match = resolver.resolve('lazy/ping/')
+        self.assertEqual((match.url_name, match.namespace), ('ping', 'lazy'))
+        resolver.resolve('lazy/ping/')
+        self.assertEqual(calls, [1])
+        self.assertIn('lazy:lazy_urls', startup.report()['phases_s'])
+
+    def test_measure_reports_a_cold_worker(self):
+        child = ("import json, sys; from main import startup; result = startup.measure('wsgi', '/api/catalog/'); "
+                 "result['loaded'] = sorted(set(sys.argv[1:]) & set(sys.modules)); print(json.dumps(result))")
+        lazy = ['djoser.serializers', 'main.barcodeimages', 'main.labelsheets', 'main.provisioning', 'main.user_serializers']
+        with tempfile.TemporaryDirectory() as directory:
+            env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'backend.settings',
+                   'DATABASE_URL': f"sqlite:///{os.path.join(directory, 'cold.sqlite3')}"}
+            env.pop('STARTUP_PROFILE', None)
+            output = subprocess.run([sys.executable, '-c', child, *lazy], cwd=settings.BASE_DIR, env=env,
+                                    capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        self.assertEqual(result['status'], 401)
+        self.assertEqual(result['loaded'], [])
+        self.assertGreater(result['first_request_s'], 0)
+        self.assertAlmostEqual(result['ready_s'], result['import_s'] + result['first_request_s'], places=6)
+        report = result['report']
+        self.assertIn('first_request', report['phases_s'])
+        self.assertIn('django', report['packages_s'])
+        self.assertIn('backend.wsgi', report['modules_inclusive_s'])
+        self.assertGreater(report['imported_modules'], len(report['packages_s']))
+
+
+class DatasetTests(TestCase):
+    def test_generate_dataset_loads_every_model(self):
+        sizes = {'users': 20, 'catalog': 30, 'attendance': 60, 'circulation': 40, 'messages': 25,
+                 'acquisitions': 15, 'duties': 10}
+        call_command('generate_dataset', days=30, seed=7, workers=1, chunk_size=16, stdout=io.StringIO(), **sizes)
+
+        self.assertEqual(User.objects.count(), sizes['users'])
+        self.assertEqual(User.objects.filter(updated_at=None).count(), 0)
+        self.assertEqual(Catalog.objects.count(), sizes['catalog'])
+        self.assertEqual(Attendance.objects.count(), sizes['attendance'])
+        self.assertEqual(Circulation.objects.count(), sizes['circulation'])
+        self.assertEqual(Message.objects.count(), sizes['messages'])
+        self.assertEqual(Acquisition.objects.count(), sizes['acquisitions'])
+        self.assertTrue(Duty.objects.exists())
+        self.assertEqual(sum(AcquisitionSpend.objects.values_list('item_count', flat=True)),
+                         sum(Acquisition.objects.values_list('quantity', flat=True)))
@@ -0,0 +1,296 @@
+# typeahead.py
+"""
+In-memory, typo-tolerant typeahead over Catalog titles and authors.
+
+Each worker process keeps a token index: a sorted vocabulary for prefix
+search and a trigram index for fuzzy candidates, verified with a bounded
+edit distance. The index is built on first use, patched by the Catalog
+signals in this process and re-synced at most every
+``TYPEAHEAD_REFRESH_SECONDS`` to pick up writes made by other workers:
+changed rows from an ``(updated_at, id)`` cursor and deletions from the
+delta sync tombstones. As in ``main.changefeed``, the cursors stop short of
+the last ``DELTA_SYNC_SETTLE_SECONDS``: newer changes are applied but read
+again next time, so a transaction that commits late with an earlier
+``updated_at`` is not skipped. One request syncs while the others keep answering
+from the loaded index, and a full rebuild is read without holding the
+index lock and swapped in at the end.
+"""
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from main.changefeed import model_label
+from main.models import Catalog, Tombstone
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Swapped in whole by rebuild()
+INDEX_STATE = ('known', 'docs', 'doc_tokens', 'postings', 'vocabulary', 'grams', 'cursor', 'deletions')
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(normalize(text))
+
+
+def trigrams(token):
+    padded = f"${token}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _after(queryset, field, position):
+    """Rows strictly after ``position`` in (``field``, id) order."""
+    if position is None:
+        return queryset
+    moment, pk = position
+    return queryset.filter(**{f"{field}__gte": moment}).filter(Q(**{f"{field}__gt": moment}) | Q(pk__gt=pk))
+
+
+def _settle_horizon():
+    """Changes after this may still be joined by earlier-stamped ones committing late."""
+    return timezone.now() - timedelta(seconds=settings.DELTA_SYNC_SETTLE_SECONDS)
+
+
+def max_edits(token):
+    if len(token) < 4:
+        return 0
+    return 1 if len(token) < 8 else 2
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance, or ``limit + 1`` once it is exceeded."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous2 is not None and i > 1 and j > 1
+                    and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class TypeaheadIndex:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.sync_lock = threading.Lock()  # one sync or rebuild at a time
+        self._reset()
+
+    def _reset(self):
+        self.known = set()                      # every indexed id, with or without tokens
+        self.docs = {}                          # id -> (title, author)
+        self.doc_tokens = {}                    # id -> set(tokens)
+        self.postings = defaultdict(set)        # token -> ids
+        self.vocabulary = []                    # sorted tokens
+        self.grams = defaultdict(set)           # trigram -> tokens
+        self.loaded = False
+        self.synced_at = 0.0
+        self.cursor = None                      # (updated_at, id) of the last row read
+        self.deletions = None                   # (deleted_at, id) of the last tombstone read
+
+    # -- maintenance -------------------------------------------------------
+
+    def _add_token(self, token, doc_id):
+        postings = self.postings[token]
+        if not postings:
+            insort(self.vocabulary, token)
+            for gram in trigrams(token):
+                self.grams[gram].add(token)
+        postings.add(doc_id)
+
+    def _remove_token(self, token, doc_id):
+        postings = self.postings.get(token)
+        if postings is None:
+            return
+        postings.discard(doc_id)
+        if not postings:
+            del self.postings[token]
+            index = bisect_left(self.vocabulary, token)
+            if index < len(self.vocabulary) and self.vocabulary[index] == token:
+                del self.vocabulary[index]
+            for gram in trigrams(token):
+                self.grams[gram].discard(token)
+
+    def add(self, doc_id, title, author):
+        doc_id = str(doc_id)
+        with self.lock:
+            self.remove(doc_id)
+            self.known.add(doc_id)
+            tokens = set(tokenize(title)) | set(tokenize(author))
+            if not tokens:
+                return
+            self.docs[doc_id] = (title, author)
+            self.doc_tokens[doc_id] = tokens
+            for token in tokens:
+                self._add_token(token, doc_id)
+
+    def remove(self, doc_id):
+        doc_id = str(doc_id)
+        with self.lock:
+            self.known.discard(doc_id)
+            for token in self.doc_tokens.pop(doc_id, ()):
+                self._remove_token(token, doc_id)
+            self.docs.pop(doc_id, None)
+
+    def rebuild(self):
+        """Reload every record. Suggestions use the old index until the new one is swapped in."""
+        fresh = TypeaheadIndex()
+        horizon = _settle_horizon()
+        fresh.deletions = (Tombstone.objects.filter(model=model_label(Catalog), deleted_at__lte=horizon)
+                           .order_by('-deleted_at', '-id').values_list('deleted_at', 'id').first())
+        rows = Catalog.objects.order_by().values_list('id', 'title', 'author', 'updated_at').iterator(chunk_size=5000)
+        for pk, title, author, updated_at in rows:
+            doc_id = str(pk)
+            fresh.known.add(doc_id)
+            tokens = set(tokenize(title)) | set(tokenize(author))
+            if tokens:
+                fresh.docs[doc_id] = (title, author)
+                fresh.doc_tokens[doc_id] = tokens
+                for token in tokens:
+                    fresh.postings[token].add(doc_id)
+            if updated_at <= horizon and (fresh.cursor is None or (updated_at, pk) > fresh.cursor):
+                fresh.cursor = (updated_at, pk)
+        # Sort and gram the vocabulary once instead of per insert
+        fresh.vocabulary = sorted(fresh.postings)
+        for token in fresh.vocabulary:
+            for gram in trigrams(token):
+                fresh.grams[gram].add(token)
+        with self.lock:
+            for name in INDEX_STATE:
+                setattr(self, name, getattr(fresh, name))
+            self.loaded = True
+            self.synced_at = time.monotonic()
+
+    def _apply_changes(self):
+        horizon = _settle_horizon()
+        changed = list(_after(Catalog.objects.all(), 'updated_at', self.cursor)
+                       .order_by('updated_at', 'id').values_list('id', 'title', 'author', 'updated_at'))
+        deleted = list(_after(Tombstone.objects.filter(model=model_label(Catalog)), 'deleted_at', self.deletions)
+                       .order_by('deleted_at', 'id').values_list('deleted_at', 'id', 'object_id'))
+        with self.lock:
+            for pk, title, author, updated_at in changed:
+                self.add(pk, title, author)
+            for _, _, object_id in deleted:
+                self.remove(object_id)
+            # Only settled changes move the cursors; newer ones are read again next time
+            settled = [(updated_at, pk) for pk, _, _, updated_at in changed if updated_at <= horizon]
+            if settled:
+                self.cursor = settled[-1]
+            settled = [row[:2] for row in deleted if row[0] <= horizon]
+            if settled:
+                self.deletions = settled[-1]
+
+    def sync(self):
+        """Load on first use, then pick up changes made by other processes."""
+        if not self.loaded:
+            with self.sync_lock:
+                if not self.loaded:
+                    self.rebuild()
+            return
+        refresh = getattr(settings, 'TYPEAHEAD_REFRESH_SECONDS', 30)
+        if time.monotonic() - self.synced_at < refresh:
+            return
+        if not self.sync_lock.acquire(blocking=False):
+            return  # another request is syncing; answer from the loaded index
+        try:
+            self.synced_at = time.monotonic()
+            self._apply_changes()
+            # Deletions that bypassed the signals leave no tombstone; a count mismatch forces a rebuild
+            if Catalog.objects.count() != len(self.known):
+                self.rebuild()
+        finally:
+            self.sync_lock.release()
+
+    # -- querying ----------------------------------------------------------
+
+    def _prefix_matches(self, prefix, limit=200):
+        start = bisect_left(self.vocabulary, prefix)
+        matches = []
+        for token in self.vocabulary[start:start + limit]:
+            if not token.startswith(prefix):
+                break
+            matches.append(token)
+        return matches
+
+    def _fuzzy_matches(self, token, as_prefix):
+        edits = max_edits(token)
+        if not edits:
+            return {}
+        grams = trigrams(token)
+        if as_prefix:
+            grams.discard(f"{token[-2:]}$")
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.grams.get(gram, ()))
+        # q-gram lemma: each edit destroys at most three trigrams
+        needed = max(1, len(grams) - 3 * edits)
+        matches = {}
+        for candidate, overlap in shared.items():
+            if overlap < needed:
+                continue
+            target = candidate[:len(token)] if as_prefix and len(candidate) > len(token) else candidate
+            distance = edit_distance(token, target, edits)
+            if distance <= edits:
+                matches[candidate] = distance
+        return matches
+
+    def _token_scores(self, token, as_prefix):
+        """Map candidate vocabulary tokens to a score in (0, 1]."""
+        scores = {}
+        if token in self.postings:
+            scores[token] = 1.0
+        if as_prefix:
+            for match in self._prefix_matches(token):
+                scores.setdefault(match, 0.9)
+        for match, distance in self._fuzzy_matches(token, as_prefix).items():
+            scores.setdefault(match, 0.8 - 0.2 * distance)
+        return scores
+
+    def suggest(self, query, limit=10):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        with self.lock:
+            totals = defaultdict(float)
+            for position, token in enumerate(tokens):
+                as_prefix = position == len(tokens) - 1
+                best = {}
+                for match, score in self._token_scores(token, as_prefix).items():
+                    for doc_id in self.postings[match]:
+                        if score > best.get(doc_id, 0):
+                            best[doc_id] = score
+                for doc_id, score in best.items():
+                    totals[doc_id] += score
+            top = heapq.nlargest(limit, totals.items(), key=lambda item: (item[1], -len(self.docs[item[0]][0] or '')))
+            return [
+                {"id": doc_id, "title": self.docs[doc_id][0], "author": self.docs[doc_id][1],
+                 "score": round(score / len(tokens), 3)}
+                for doc_id, score in top
+            ]
+
+
+index = TypeaheadIndex()
+
+
+def suggest(query, limit=10):
+    index.sync()
+    return index.suggest(query, limit=limit)
@@ -1,11 +1,12 @@
-from django.urls import path
+from django.urls import path, re_path
 from rest_framework.routers import DefaultRouter
 from .views import (
   AttendanceViewSet, CatalogViewSet, CirculationViewSet, 
   AcquisitionViewSet, DutyViewSet, MessageViewSet,
   PermissionView, GroupViewSet,
-  PublicUserListViewSet, CustomUserViewSet
+  PublicUserListViewSet, CustomUserViewSet, MetricsView, BarcodeImageView, JobViewSet
 )
+from .async_views import AttendanceListView, CatalogListView, CatalogSearchView, MessageHistoryView
 
 router = DefaultRouter()
 router.register(r'attendance', AttendanceViewSet, basename='attendance')
@@ -18,5 +19,13 @@ router.register(r'permissions', PermissionView, basename='permission-list')
 router.register(r'groups', GroupViewSet, basename='group')
 router.register(r'public-users', PublicUserListViewSet, basename='public-user-list')
 router.register(r'users', CustomUserViewSet, basename='custom-user')
+router.register(r'jobs', JobViewSet, basename='job')
 
-urlpatterns = router.urls
\ No newline at end of file
+urlpatterns = router.urls + [
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    re_path(r'^barcodes/(?P<value>[^/]+)\.(?P<fmt>png|svg)$', BarcodeImageView.as_view(), name='barcode-image'),
+    path('async/catalog/', CatalogListView.as_view(), name='async-catalog-list'),
+    path('async/catalog/search/', CatalogSearchView.as_view(), name='async-catalog-search'),
+    path('async/attendance/', AttendanceListView.as_view(), name='async-attendance-list'),
+    path('async/messages/', MessageHistoryView.as_view(), name='async-message-history'),
+]
@@ -0,0 +1,48 @@
+# user_serializers.py
+"""
+The user serializers built on djoser's, kept out of ``main.serializers`` so
+that importing the API views does not import djoser: it loads with the
+auth endpoints (``DJOSER['SERIALIZERS']``) or the user admin API.
+"""
+from django.contrib.auth.models import Group, Permission
+from djoser.serializers import UserSerializer as BaseUserSerializer, UserCreateSerializer as BaseUserCreateSerializer
+from rest_framework import serializers
+
+from .models import User
+from .serializers import GroupSerializer, PermissionSerializer
+
+
+class UserCreateSerializer(BaseUserCreateSerializer):
+
+    class Meta(BaseUserCreateSerializer.Meta):
+        model = User
+        fields = [
+            "id", "first_name", "last_name", "username", "email", "password",
+            "phone", "student_id", "faculty", "department", "user_category", 
+            "staff_category"
+        ]
+
+
+class UserSerializer(BaseUserSerializer):
+    groups = GroupSerializer(many=True, read_only=True)
+    group_ids = serializers.PrimaryKeyRelatedField(      
+        many=True,
+        queryset=Group.objects.all(),
+        write_only=True,
+        source="groups"
+    )
+    permissions = PermissionSerializer(source="user_permissions", many=True, read_only=True)
+    permission_ids = serializers.PrimaryKeyRelatedField( 
+        many=True,
+        queryset=Permission.objects.all(),
+        write_only=True,
+        source="user_permissions"
+    )
+    class Meta(BaseUserSerializer.Meta):
+        model = User
+        fields = [
+            "id", "first_name", "last_name", "username", "email",
+            "phone", "student_id", "faculty", "department", "user_category",
+            "staff_category", "role", 'barcode', 'permissions', 'permission_ids', 'groups', 'group_ids',
+            "is_active", "is_staff", "is_superuser", "password",
+        ]
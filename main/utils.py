@@ -0,0 +1,12 @@
+# utils.py
+from itertools import islice
+
+
+def chunks(iterable, size):
+    """Yield lists of up to ``size`` items from ``iterable``, consuming it lazily."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
@@ -1,27 +1,40 @@
+import io
 from django.contrib.auth.models import Permission, Group
 from rest_framework import viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAdminUser
 from .models import (Attendance, Catalog, Circulation, 
-                     Acquisition, Duty, Message
+                     Acquisition, AcquisitionSpend, Duty, Job, Message
                      )
 from .serializers import (
-    AttendanceSerializer, CatalogSerializer, CirculationSerializer, 
+    AttendanceSerializer, AttendanceBatchSerializer, CatalogSerializer, CirculationSerializer, 
     AcquisitionSerializer, DutySerializer, MessageSerializer,
-    PermissionSerializer, GroupSerializer
+    PermissionSerializer, GroupSerializer,
+    DutyAssignmentSerializer, RosterRequestSerializer,
+    AccessionManifestSerializer, AcquisitionSpendSerializer, PatronProvisioningSerializer, JobSerializer
 )
-from .permissions import AttendancePermission, MessagePermission, FullDjangoModelPermissions
+from . import accessioning, changefeed, dbpool, holds, jobs, kiosk, roster, typeahead
+from .barcodes import is_known_barcode
+from .identifiers import normalize_isbn, normalize_issn
+from .fastpath import FastListMixin
+from .fieldsets import SparseFieldsMixin
+from .idempotency import IdempotencyMixin
+from .instrumentation import InstrumentedViewMixin
+from .instrumentation import registry as metrics_registry
+from .replicas import ReplicaReadMixin
+from .permissions import AttendancePermission, MessagePermission, FullDjangoModelPermissions, MetricsPermission
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from .models import User
 from rest_framework import status
-from .serializers import UserSerializer
-from django.db import models
+from django.db import models, transaction
 from django.utils.timezone import now, timedelta
 
 
-class AttendanceViewSet(viewsets.ModelViewSet):
+class AttendanceViewSet(InstrumentedViewMixin, IdempotencyMixin, ReplicaReadMixin, SparseFieldsMixin, FastListMixin, viewsets.ModelViewSet):
     serializer_class = AttendanceSerializer
     queryset = Attendance.objects.all()
     permission_classes = [AttendancePermission]
@@ -29,10 +42,11 @@ class AttendanceViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         user = self.request.user
 
+        queryset = Attendance.objects.select_related('user')
         if user.is_staff or user.has_perm('main.can_manage_attendance'):
-            return Attendance.objects.all()
+            return queryset
 
-        return Attendance.objects.filter(user=user)
+        return queryset.filter(user=user)
     
 
     def create(self, request, *args, **kwargs):
@@ -75,6 +89,13 @@ class AttendanceViewSet(viewsets.ModelViewSet):
         }, status=status.HTTP_201_CREATED)
 
 
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """Record a kiosk's offline queue of scans in one request; see main.kiosk."""
+        serializer = AttendanceBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(kiosk.record_scans(serializer.validated_data['scans']), status=status.HTTP_200_OK)
+
     def get_user_data(self, user):
         return {
             "id": user.id,
@@ -89,27 +110,195 @@ class AttendanceViewSet(viewsets.ModelViewSet):
 
 
 
-class CatalogViewSet(viewsets.ModelViewSet):
+class CatalogViewSet(InstrumentedViewMixin, IdempotencyMixin, ReplicaReadMixin, SparseFieldsMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = Catalog.objects.all()
     serializer_class = CatalogSerializer
     permission_classes = [FullDjangoModelPermissions]
+    # Large text columns; lists send them only when named in ?fields=
+    list_omit_fields = ('marc_tag', 'dublin_core', 'ai_suggestion', 'contributors', 'notes', 'tags')
+    list_actions = ('list', 'changes')
+
+    @action(detail=False, methods=['get'])
+    def lookup(self, request):
+        isbn = request.query_params.get('isbn')
+        issn = request.query_params.get('issn')
+        if isbn:
+            key = normalize_isbn(isbn)
+            lookup = {'isbn13': key}
+        elif issn:
+            key = normalize_issn(issn)
+            lookup = {'issn_normalized': key}
+        else:
+            return Response({"detail": "isbn or issn is required"}, status=400)
+
+        if key is None:
+            return Response({"detail": "Invalid identifier"}, status=400)
+        catalog = Catalog.objects.filter(**lookup).first()
+        if catalog is None:
+            return Response({"detail": "No catalog record with this identifier"}, status=404)
+        return Response(self.get_serializer(catalog).data)
+
+    @action(detail=False, methods=['get'], permission_classes=[AllowAny])
+    def suggest(self, request):
+        query = request.query_params.get('q', '')
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), 50)
+        except ValueError:
+            limit = 10
+        return Response(typeahead.suggest(query, limit=limit))
+
+    @action(detail=False, methods=['get'])
+    def labels(self, request):
+        """A PDF of spine labels for ``?ids=`` and/or records created ``?since=``; ``?per_copy=1`` repeats by quantity."""
+        from . import labelsheets
+
+        params = request.query_params
+        try:
+            queryset = labelsheets.select(Catalog.objects.order_by('dewey_decimal', 'title'),
+                                          [i for i in params.get('ids', '').split(',') if i], params.get('since'))
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=400)
+        labels = list(labelsheets.catalog_labels(queryset, per_copy=params.get('per_copy') in ('1', 'true')))
+        return sheet_response(labelsheets.stream_sheets('spine', labels), 'spine-labels.pdf')
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """Records changed or deleted since ``?cursor=`` (all records without one); see main.changefeed."""
+        return change_feed_response(request, self.filter_queryset(Catalog.objects.all()),
+                                    lambda rows: self.get_serializer(rows, many=True).data)
 
-class CirculationViewSet(viewsets.ModelViewSet):
-    queryset = Circulation.objects.all()
+class CirculationViewSet(InstrumentedViewMixin, IdempotencyMixin, ReplicaReadMixin, SparseFieldsMixin, FastListMixin, viewsets.ModelViewSet):
+    queryset = Circulation.objects.select_related('borrower')
     serializer_class = CirculationSerializer
     permission_classes = [FullDjangoModelPermissions]
 
-class AcquisitionViewSet(viewsets.ModelViewSet):
-    queryset = Acquisition.objects.all()
+    @action(detail=True, methods=['post'], url_path='return')
+    def return_item(self, request, pk=None):
+        try:
+            loan, allocated = holds.return_loan(self.get_object())
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=400)
+        return Response({
+            "circulation": self.get_serializer(loan).data,
+            "allocated_hold": self.get_serializer(allocated).data if allocated else None,
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'])
+    def position(self, request, pk=None):
+        hold = self.get_object()
+        return Response({
+            "id": str(hold.id),
+            "status": hold.status,
+            "position": holds.queue_position(hold),
+        })
+
+    @action(detail=False, methods=['get'], url_path='holds')
+    def hold_queue(self, request):
+        book_id = request.query_params.get('book')
+        if not book_id:
+            return Response({"detail": "book is required"}, status=400)
+        queryset = holds.queued_holds(book_id).select_related('borrower')
+        data = self.get_serializer(queryset, many=True).data
+        for position, row in enumerate(data, start=1):
+            row['position'] = position
+        return Response(data)
+
+class AcquisitionViewSet(InstrumentedViewMixin, IdempotencyMixin, ReplicaReadMixin, SparseFieldsMixin, FastListMixin, viewsets.ModelViewSet):
+    queryset = Acquisition.objects.select_related('added_by')
     serializer_class = AcquisitionSerializer
     permission_classes = [FullDjangoModelPermissions]
 
-class DutyViewSet(viewsets.ModelViewSet):
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            acquisition = serializer.save(added_by=self.request.user)
+            accessioning.record_spend([self._spend_row(acquisition)])
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            accessioning.record_spend([self._spend_row(serializer.instance)], sign=-1)
+            acquisition = serializer.save()
+            accessioning.record_spend([self._spend_row(acquisition)])
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            accessioning.record_spend([self._spend_row(instance)], sign=-1)
+            instance.delete()
+
+    @staticmethod
+    def _spend_row(acquisition):
+        return (acquisition.supplier, acquisition.source, acquisition.amount, acquisition.quantity)
+
+    @action(detail=False, methods=['post'])
+    def accession(self, request):
+        serializer = AccessionManifestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        if params.get('file'):
+            lines = accessioning.read_manifest_csv(io.TextIOWrapper(params['file'], encoding='utf-8-sig'))
+        else:
+            lines = params['items']
+
+        if params['background']:
+            job = jobs.enqueue(accessioning.accession_manifest_job, args=[
+                list(lines), params['source'], params.get('supplier') or None, params.get('date_acquired'), request.user.pk,
+            ], created_by=request.user)
+            return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+        result = accessioning.accession_manifest(
+            lines,
+            source=params['source'],
+            supplier=params.get('supplier') or None,
+            date_acquired=params.get('date_acquired'),
+            added_by=request.user,
+        )
+        return Response(result, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'])
+    def spend(self, request):
+        totals = AcquisitionSpend.objects.order_by('supplier', 'source')
+        return Response(AcquisitionSpendSerializer(totals, many=True).data)
+
+class DutyViewSet(InstrumentedViewMixin, IdempotencyMixin, ReplicaReadMixin, SparseFieldsMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = Duty.objects.all()
     serializer_class = DutySerializer
     permission_classes = [FullDjangoModelPermissions]
 
-class MessageViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['post'])
+    def conflicts(self, request):
+        serializer = DutyAssignmentSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        found = roster.find_conflicts(
+            (row['user'].pk, row['date'], row['shift']) for row in serializer.validated_data
+        )
+        return Response({
+            "conflicts": [{"user": user_id, "date": date, "shift": shift} for user_id, date, shift in found]
+        })
+
+    @action(detail=False, methods=['post'])
+    def generate(self, request):
+        serializer = RosterRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        staff_ids = [user.pk for user in params.get('staff', [])] or roster.roster_staff().values_list('id', flat=True)
+        planned, gaps = roster.generate_roster(
+            params['start'], params['end'], staff_ids,
+            shifts=params.get('shifts'),
+            coverage=params.get('coverage'),
+            availability=params.get('availability'),
+            max_per_day=params['max_per_day'],
+            days=params.get('days'),
+        )
+        duties = planned if params['dry_run'] else roster.save_roster(planned)
+
+        return Response({
+            "created": 0 if params['dry_run'] else len(duties),
+            "duties": [{"user": str(d.user_id), "date": d.date, "shift": d.shift} for d in duties],
+            "gaps": gaps,
+        }, status=status.HTTP_200_OK if params['dry_run'] else status.HTTP_201_CREATED)
+
+class MessageViewSet(InstrumentedViewMixin, IdempotencyMixin, ReplicaReadMixin, SparseFieldsMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = Message.objects.all()
     serializer_class = MessageSerializer
     permission_classes = [MessagePermission]
@@ -135,37 +324,170 @@ class MessageViewSet(viewsets.ModelViewSet):
         return queryset
 
 
-class PermissionView(viewsets.ModelViewSet):
+class PermissionView(InstrumentedViewMixin, IdempotencyMixin, ReplicaReadMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = Permission.objects.all()
     permission_classes = [IsAdminUser]
     serializer_class = PermissionSerializer
 
 
-class GroupViewSet(viewsets.ModelViewSet):
-    queryset = Group.objects.all()
+class GroupViewSet(InstrumentedViewMixin, IdempotencyMixin, ReplicaReadMixin, SparseFieldsMixin, viewsets.ModelViewSet):
+    queryset = Group.objects.prefetch_related('permissions')
     serializer_class = GroupSerializer
     permission_classes = [IsAdminUser]   # only admin users can manage groups
 
 
-class PublicUserListViewSet(viewsets.ViewSet):
+class PublicUserListViewSet(InstrumentedViewMixin, ReplicaReadMixin, viewsets.ViewSet):
     permission_classes = [AllowAny]
 
     def list(self, request):
         users = User.objects.filter(is_active=True)
-        data = []
-        for user in users:
-            data.append({
-                "id": str(user.id),
-                "email": user.email,
-                "username": user.username,
-                "first_name": user.first_name,
-                "last_name": user.last_name,
-                "role": "admin" if user.is_superuser else ("staff" if user.is_staff else (user.staff_category or user.user_category or "user")),
-            })
+        data = [self.public_user(user) for user in users]
         return Response(data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """The public list's delta since ``?cursor=``; deactivated users come back as deleted."""
+        return change_feed_response(request, User.objects.all(),
+                                    lambda users: [self.public_user(user) for user in users],
+                                    is_deleted=lambda user: not user.is_active)
+
+    @staticmethod
+    def public_user(user):
+        return {
+            "id": str(user.id),
+            "email": user.email,
+            "username": user.username,
+            "first_name": user.first_name,
+            "last_name": user.last_name,
+            "role": "admin" if user.is_superuser else ("staff" if user.is_staff else (user.staff_category or user.user_category or "user")),
+        }
     
 
-class CustomUserViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.all()
-    serializer_class = UserSerializer
-    permission_classes = [IsAdminUser]
\ No newline at end of file
+class CustomUserViewSet(InstrumentedViewMixin, IdempotencyMixin, ReplicaReadMixin, SparseFieldsMixin, viewsets.ModelViewSet):
+    queryset = User.objects.prefetch_related('groups__permissions', 'user_permissions')
+    permission_classes = [IsAdminUser]
+
+    def get_serializer_class(self):
+        # Imported here: it builds on djoser, which the rest of the API never loads
+        from .user_serializers import UserSerializer
+        return UserSerializer
+
+    @action(detail=False, methods=['post'])
+    def provision(self, request):
+        from . import provisioning
+
+        serializer = PatronProvisioningSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        if params.get('file'):
+            rows = list(provisioning.read_roster_csv(io.TextIOWrapper(params['file'], encoding='utf-8-sig')))
+        else:
+            rows = params['items']
+        defaults = {field: params[field] for field in provisioning.DEFAULT_FIELDS if params.get(field)}
+
+        # Passwords are hashed by the job worker's process pool, never in the web request
+        if params['background'] or provisioning.has_passwords(rows):
+            job = jobs.enqueue(provisioning.provision_patrons_job, args=[
+                provisioning.seal_roster(rows), defaults, [group.pk for group in params.get('groups', [])],
+            ], created_by=request.user)
+            return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+        result = provisioning.provision_patrons(rows, defaults=defaults, groups=params.get('groups', []), workers=1)
+        return Response(result, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'])
+    def cards(self, request):
+        """A PDF of library cards for ``?ids=`` and/or users who joined ``?since=``."""
+        from . import labelsheets
+
+        params = request.query_params
+        try:
+            queryset = labelsheets.select(User.objects.order_by('last_name', 'first_name'),
+                                          [i for i in params.get('ids', '').split(',') if i], params.get('since'),
+                                          date_field='date_joined')
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=400)
+        return sheet_response(labelsheets.stream_sheets('card', list(labelsheets.patron_cards(queryset))), 'library-cards.pdf')
+
+
+class JobViewSet(InstrumentedViewMixin, IdempotencyMixin, viewsets.ReadOnlyModelViewSet):
+    """Status of background jobs: staff see every job, other users the jobs they started."""
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = Job.objects.all()
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(created_by=self.request.user)
+        job_status = self.request.query_params.get('status')
+        if job_status:
+            queryset = queryset.filter(status=job_status)
+        return queryset
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        job = self.get_object()
+        if not jobs.cancel(job):
+            return Response({"detail": f"Only queued jobs can be cancelled; this one is {job.status}"}, status=409)
+        job.refresh_from_db()
+        return Response(self.get_serializer(job).data)
+
+
+def change_feed_response(request, queryset, serialize, is_deleted=None):
+    try:
+        limit = int(request.query_params.get('limit', changefeed.DEFAULT_LIMIT))
+    except ValueError:
+        limit = changefeed.DEFAULT_LIMIT
+    try:
+        page = changefeed.changes(queryset, request.query_params.get('cursor'), limit, serialize, is_deleted)
+    except changefeed.CursorExpired as exc:
+        return Response({"detail": str(exc)}, status=status.HTTP_410_GONE)
+    except ValueError as exc:
+        return Response({"detail": str(exc)}, status=400)
+    return Response(page)
+
+
+def sheet_response(pages, filename):
+    # Records are read before streaming starts; only rendering happens while the PDF streams
+    response = StreamingHttpResponse(pages, content_type='application/pdf')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+class MetricsView(APIView):
+    permission_classes = [MetricsPermission]
+
+    def get(self, request):
+        return HttpResponse(metrics_registry.render() + dbpool.render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class BarcodeImageView(APIView):
+    """A Code 128 image of a catalog or patron barcode, e.g. ``/api/barcodes/LIB00000042.png?scale=3&text=0``."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, value, fmt):
+        from . import barcodeimages
+
+        params = request.query_params
+        try:
+            options = barcodeimages.served_options(
+                scale=params.get('scale'),
+                height=params.get('height'),
+                text=params['text'] not in ('0', 'false') if 'text' in params else None,
+            )
+            path, key = barcodeimages.render_cached(value, fmt, render_if=is_known_barcode, **options)
+        except LookupError as exc:
+            return Response({"detail": str(exc)}, status=404)
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=400)
+
+        etag = f'"{key}"'
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponseNotModified()
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=barcodeimages.FORMATS[fmt])
+        response['ETag'] = etag
+        # Private: the response needs a login, so shared caches must not keep it
+        response['Cache-Control'] = f"private, max-age={settings.BARCODE_CACHE_SECONDS}, immutable"
+        return response